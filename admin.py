@@ -1,12 +1,22 @@
 import os
-import pytz
-from flask import url_for, redirect, flash, render_template
+from datetime import datetime
+from flask import url_for, redirect, flash, render_template, request, Response, stream_with_context
 from flask_login import current_user
-from flask_admin import Admin, AdminIndexView, expose
+from flask_admin import Admin, AdminIndexView, BaseView, expose
 from flask_admin.contrib.sqla import ModelView
 from markupsafe import Markup
 
 from models import User, MataKuliah, AttendanceRecord, db
+from face_gallery import face_gallery, record_face_change, record_enrollment_change
+from enrollment import import_enrollment_csv
+from capture_store import capture_store
+from timezone_utils import to_wib
+from attendance_summary import record_removed, refresh_enrollment, course_rates, absence_streaks, heatmap
+from attendance_export import iter_attendance_csv, iter_pivot_csv
+from attendance import insert_classroom_attendance
+from recognition_executor import recognition_executor, RecognitionBusy
+from face_utils_mediapipe import match_classroom_embeddings
+from recognition_backends import get_backend, classroom_faces_from_image_bytes
 
 class MyAdminIndexView(AdminIndexView):
     @expose('/')
@@ -15,9 +25,8 @@ class MyAdminIndexView(AdminIndexView):
             return redirect(url_for('auth.login'))
         
         recent_records = AttendanceRecord.query.order_by(AttendanceRecord.timestamp.desc()).limit(10).all()
-        wib = pytz.timezone('Asia/Jakarta')
         for record in recent_records:
-            record.local_time = record.timestamp.replace(tzinfo=pytz.utc).astimezone(wib)
+            record.local_time = to_wib(record.timestamp)
 
         return self.render('admin/index.html', recent_records=recent_records)
 
@@ -45,9 +54,15 @@ class AttendanceAdminView(ModelView):
 
     def _list_thumbnail(self, context, model, name):
         if not model.image_path: return ''
-        return Markup(f'<img src="{url_for("static", filename=model.image_path)}" width="100" class="img-thumbnail">')
+        thumbnail_url = url_for('main.capture_thumbnail', key=model.image_path)
+        return Markup(f'<a href="{capture_store.url(model.image_path)}" target="_blank">'
+                      f'<img src="{thumbnail_url}" width="100" loading="lazy" decoding="async" class="img-thumbnail"></a>')
 
     column_formatters = {'image_path': _list_thumbnail, 'location': _location_formatter}
+
+    # Rekap harian ikut diperbarui saat presensi dihapus
+    def on_model_delete(self, model):
+        record_removed(model.user_id, model.matakuliah_id, model.attendance_date)
     
     def is_accessible(self):
         return current_user.is_authenticated and current_user.is_admin
@@ -57,13 +72,187 @@ class UserAdminView(ModelView):
     can_create = False
     can_edit = True
     can_delete = True
-    column_list = ['id', 'name', 'is_admin']
+    column_list = ['id', 'name', 'is_admin', 'has_face']
+    column_labels = {'has_face': 'Wajah Terdaftar'}
     column_exclude_list = ['password']
     # Sesuaikan dengan nama kolom baru di model User
-    form_excluded_columns = ['password', 'records', 'face_encoding']
+    form_excluded_columns = ['password', 'records', 'face_encoding', 'has_face', 'courses', 'templates']
     column_searchable_list = ['name']
     column_filters = ['is_admin']
 
+    # Galeri wajah di setiap worker perlu tahu bahwa user ini berubah
+    def on_model_change(self, form, model, is_created):
+        if not is_created:
+            record_face_change(model.id)
+
+    def on_model_delete(self, model):
+        record_face_change(model.id)
+
+    # Snapshot galeri bersama ditulis ulang setelah perubahannya ter-commit
+    def after_model_change(self, form, model, is_created):
+        if not is_created:
+            face_gallery.publish_snapshot()
+
+    def after_model_delete(self, model):
+        face_gallery.publish_snapshot()
+
+    def is_accessible(self):
+        return current_user.is_authenticated and current_user.is_admin
+
+
+class MataKuliahAdminView(ModelView):
+    can_create = False
+    can_edit = True
+    can_delete = True
+    list_template = 'admin/matakuliah_list.html'
+    form_columns = ['kode_mk', 'nama_mk', 'dosen_pengampu', 'students']
+    column_labels = {'students': 'Peserta'}
+
+    # Sub-galeri wajah per mata kuliah harus dibangun ulang, dan rekap hari
+    # ini mengikuti daftar peserta yang baru
+    def on_model_change(self, form, model, is_created):
+        record_enrollment_change(model.id)
+        refresh_enrollment(model.id)
+
+    def on_model_delete(self, model):
+        record_enrollment_change(model.id)
+
+    @expose('/import/', methods=('GET', 'POST'))
+    def import_enrollment(self):
+        report = None
+        if request.method == 'POST':
+            upload = request.files.get('file')
+            if not upload or not upload.filename:
+                flash('Pilih file CSV terlebih dahulu.', 'warning')
+            else:
+                text = upload.read().decode('utf-8-sig')
+                report = import_enrollment_csv(text, replace=bool(request.form.get('replace')))
+        return self.render('admin/import_enrollment.html', report=report)
+
+    def is_accessible(self):
+        return current_user.is_authenticated and current_user.is_admin
+
+
+class AttendanceSummaryView(BaseView):
+    """
+    Rekap kehadiran per mata kuliah, streak absen mahasiswa, dan heatmap.
+    Semua data dibaca dari tabel rekap harian, bukan attendance_record.
+    """
+
+    @expose('/')
+    def index(self):
+        rates = course_rates()
+        course_id = request.args.get('course', type=int) or (rates[0]['id'] if rates else None)
+        weeks = min(max(request.args.get('weeks', 8, type=int), 1), 52)
+        streaks = absence_streaks(course_id) if course_id else []
+        dates, heatmap_rows = heatmap(weeks)
+        return self.render('admin/attendance_summary.html', rates=rates, course_id=course_id,
+                           streaks=streaks, weeks=weeks, dates=dates, heatmap_rows=heatmap_rows)
+
+    def is_accessible(self):
+        return current_user.is_authenticated and current_user.is_admin
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except ValueError:
+        return None
+
+
+class AttendanceExportView(BaseView):
+    """
+    Ekspor presensi per mata kuliah dan rentang tanggal sebagai CSV streaming.
+    """
+
+    @expose('/')
+    def index(self):
+        courses = MataKuliah.query.order_by(MataKuliah.kode_mk).all()
+        return self.render('admin/attendance_export.html', courses=courses)
+
+    @expose('/download')
+    def download(self):
+        matakuliah_id = request.args.get('course', type=int)
+        start_date = _parse_date(request.args.get('start'))
+        end_date = _parse_date(request.args.get('end'))
+        layout = request.args.get('layout', 'rows')
+
+        if layout == 'pivot':
+            if not matakuliah_id:
+                flash('Format pivot membutuhkan satu mata kuliah.', 'warning')
+                return redirect(url_for('.index'))
+            chunks = iter_pivot_csv(matakuliah_id, start_date, end_date)
+        else:
+            chunks = iter_attendance_csv(matakuliah_id, start_date, end_date)
+
+        period = '_'.join(day.isoformat() for day in (start_date, end_date) if day) or 'semua'
+        filename = f"presensi_{layout}_{matakuliah_id or 'semua'}_{period}.csv"
+        return Response(stream_with_context(chunks), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+    def is_accessible(self):
+        return current_user.is_authenticated and current_user.is_admin
+
+
+class ClassroomAttendanceView(BaseView):
+    """
+    Mode kelas: dosen mengunggah satu atau beberapa foto ruang kelas, semua
+    wajah dicocokkan sekaligus dengan peserta mata kuliah, lalu presensinya
+    disimpan dalam satu transaksi.
+    """
+
+    @expose('/', methods=('GET', 'POST'))
+    def index(self):
+        courses = MataKuliah.query.order_by(MataKuliah.kode_mk).all()
+        report = None
+        if request.method == 'POST':
+            report = self._process(request.form.get('course', type=int),
+                                   [upload.read() for upload in request.files.getlist('photos') if upload.filename])
+        return self.render('admin/classroom_attendance.html', courses=courses, report=report,
+                           course_id=request.form.get('course', type=int))
+
+    def _process(self, matakuliah_id, photos):
+        course = db.session.get(MataKuliah, matakuliah_id) if matakuliah_id else None
+        if course is None or not photos:
+            flash('Pilih mata kuliah dan minimal satu foto kelas.', 'warning')
+            return None
+
+        backend = get_backend()
+        embeddings, sources = [], []
+        try:
+            for photo_index, photo in enumerate(photos):
+                for embedding, _ in recognition_executor.submit(classroom_faces_from_image_bytes, photo, backend.name):
+                    embeddings.append(embedding)
+                    sources.append(photo_index)
+        except RecognitionBusy:
+            flash('Server sedang sibuk memproses wajah lain. Silakan coba lagi sebentar.', 'warning')
+            return None
+        except ValueError:
+            flash('Salah satu foto tidak dapat dibaca.', 'danger')
+            return None
+
+        matches = match_classroom_embeddings(embeddings, course.id, threshold=backend.threshold, groups=sources)
+        keys = [capture_store.key_for(photo) for photo in photos]
+        inserted = set(insert_classroom_attendance(
+            [(user_id, keys[sources[probe]]) for probe, user_id, _ in matches], course.id))
+
+        # Foto hanya disimpan jika menjadi bukti presensi yang baru tersimpan
+        for photo_index in {sources[probe] for probe, user_id, _ in matches if user_id in inserted}:
+            capture_store.save(photos[photo_index])
+
+        names = dict(db.session.query(User.id, User.name).filter(
+            User.id.in_([user_id for _, user_id, _ in matches])).all()) if matches else {}
+        return {
+            'course': course,
+            'faces': len(embeddings),
+            'unreadable': sum(embedding is None for embedding in embeddings),
+            'unmatched': len(embeddings) - len(matches),
+            'matches': sorted(({'name': names.get(user_id, '-'), 'similarity': similarity,
+                                'photo': sources[probe] + 1, 'new': user_id in inserted}
+                               for probe, user_id, similarity in matches), key=lambda item: item['name']),
+            'inserted': len(inserted),
+        }
+
     def is_accessible(self):
         return current_user.is_authenticated and current_user.is_admin
 
@@ -74,12 +263,12 @@ def setup_admin(app, db):
     
     admin.add_view(UserAdminView(User, db.session, name="Data Pengguna"))
     
-    # Buat ModelView sederhana dengan konfigurasi minimal
-    mk_view = ModelView(MataKuliah, db.session, name="Data Mata Kuliah")
-    mk_view.form_excluded_columns = ['records']  # Exclude relationship
-    mk_view.can_create = False
-    mk_view.can_edit = True
-    mk_view.can_delete = True
-    admin.add_view(mk_view)
+    admin.add_view(MataKuliahAdminView(MataKuliah, db.session, name="Data Mata Kuliah"))
     
     admin.add_view(AttendanceAdminView(AttendanceRecord, db.session, name="Riwayat Presensi"))
+
+    admin.add_view(AttendanceSummaryView(name="Rekap Presensi", endpoint='attendance_summary'))
+
+    admin.add_view(AttendanceExportView(name="Ekspor Presensi", endpoint='attendance_export'))
+
+    admin.add_view(ClassroomAttendanceView(name="Presensi Kelas", endpoint='classroom_attendance'))
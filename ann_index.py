@@ -0,0 +1,162 @@
+"""
+Indeks approximate nearest neighbour (IVF) berbasis numpy untuk galeri wajah.
+
+Vektor galeri dikelompokkan ke `nlist` centroid hasil spherical k-means.
+Saat pencarian hanya `nprobe` kelompok terdekat yang dibandingkan, jadi
+nprobe adalah kenop recall/latensi: makin besar makin akurat dan makin lambat.
+Indeks tidak menyimpan salinan vektor; ia hanya menyimpan centroid dan label
+kelompok untuk setiap template galeri.
+"""
+import os
+import numpy as np
+
+# Ukuran blok saat menghitung jarak ke centroid agar memori sementara kecil
+_ASSIGN_BLOCK = 4096
+
+
+class IVFIndex:
+
+    def __init__(self, centroids, nprobe=8, generation=0, recall=None):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        # Generasi galeri ketika indeks disimpan
+        self.generation = generation
+        # Recall top-1 terhadap pencarian exact yang terakhir diukur
+        self.recall = recall
+        self._saved_labels = {}
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    @property
+    def dim(self):
+        return self.centroids.shape[1]
+
+    @classmethod
+    def train(cls, matrix, nlist=256, iterations=10, nprobe=8, seed=0, sample_size=50000):
+        """
+        Latih centroid dengan spherical k-means pada (sampel) baris galeri
+        yang sudah dinormalisasi.
+        """
+        rng = np.random.default_rng(seed)
+        if len(matrix) > sample_size:
+            matrix = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+        nlist = max(1, min(nlist, len(matrix)))
+        centroids = matrix[rng.choice(len(matrix), nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            labels = _nearest(matrix, centroids)
+            counts = np.bincount(labels, minlength=nlist)
+            # Jumlahkan baris per kelompok lewat reduceat pada urutan label
+            order = np.argsort(labels, kind='stable')
+            present = np.flatnonzero(counts)
+            starts = np.concatenate([[0], np.cumsum(counts[present])[:-1]])
+            sums = np.zeros_like(centroids)
+            sums[present] = np.add.reduceat(matrix[order], starts, axis=0)
+            # Centroid kosong diisi ulang dengan baris acak
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = matrix[rng.choice(len(matrix), int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = sums / norms
+
+        return cls(centroids, nprobe=nprobe)
+
+    def assign(self, matrix):
+        """
+        Label centroid terdekat untuk setiap baris.
+        """
+        if not len(matrix):
+            return np.empty(0, dtype=np.int32)
+        return _nearest(matrix, self.centroids)
+
+    def labels_for(self, template_ids, matrix, stale_mask=None):
+        """
+        Label untuk baris galeri. Label yang tersimpan di file dipakai ulang
+        kecuali barisnya ditandai di `stale_mask` (user-nya berubah sejak
+        indeks disimpan); sisanya dihitung.
+        """
+        labels = np.empty(len(template_ids), dtype=np.int32)
+        missing = []
+        for row, template_id in enumerate(template_ids.tolist()):
+            label = self._saved_labels.get(template_id)
+            if label is None or (stale_mask is not None and stale_mask[row]):
+                missing.append(row)
+            else:
+                labels[row] = label
+        if missing:
+            labels[missing] = self.assign(matrix[missing])
+        return labels
+
+    def probe_lists(self, probe, nprobe=None):
+        """
+        ID kelompok yang akan diperiksa untuk satu probe ter-normalisasi.
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        similarities = self.centroids @ probe
+        return np.argpartition(-similarities, nprobe - 1)[:nprobe]
+
+    def candidate_rows(self, labels, probe, nprobe=None):
+        return np.flatnonzero(np.isin(labels, self.probe_lists(probe, nprobe)))
+
+    def measure_recall(self, matrix, labels, queries, nprobe=None):
+        """
+        Recall top-1: proporsi query yang hasil ANN-nya sama dengan hasil
+        pencarian exact.
+        """
+        if not len(queries):
+            return None
+        hits = 0
+        for probe in queries:
+            exact = int(np.argmax(matrix @ probe))
+            rows = self.candidate_rows(labels, probe, nprobe)
+            if len(rows) and int(rows[np.argmax(matrix[rows] @ probe)]) == exact:
+                hits += 1
+        return hits / len(queries)
+
+    def save(self, path, template_ids, labels, generation):
+        """
+        Simpan centroid dan label secara atomik supaya worker lain tidak
+        pernah membaca file setengah jadi.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as handle:
+            np.savez(
+                handle,
+                centroids=self.centroids,
+                template_ids=np.asarray(template_ids, dtype=np.int64),
+                labels=np.asarray(labels, dtype=np.int32),
+                generation=np.int64(generation),
+                nprobe=np.int32(self.nprobe),
+                recall=np.float64(np.nan if self.recall is None else self.recall),
+            )
+        os.replace(tmp_path, path)
+        self.generation = generation
+
+    @classmethod
+    def load(cls, path, nprobe=None):
+        with np.load(path) as data:
+            recall = float(data['recall'])
+            index = cls(
+                data['centroids'],
+                nprobe=nprobe or int(data['nprobe']),
+                generation=int(data['generation']),
+                recall=None if np.isnan(recall) else recall,
+            )
+            # Indeks lama menyimpan label per user_id; label-nya dihitung ulang
+            if 'template_ids' in data.files:
+                index._saved_labels = dict(zip(data['template_ids'].tolist(), data['labels'].tolist()))
+        return index
+
+
+def _nearest(matrix, centroids):
+    labels = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), _ASSIGN_BLOCK):
+        block = matrix[start:start + _ASSIGN_BLOCK]
+        labels[start:start + _ASSIGN_BLOCK] = np.argmax(block @ centroids.T, axis=1)
+    return labels
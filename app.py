@@ -1,13 +1,19 @@
 import os
-from flask import Flask
+from flask import Flask, url_for
 from flask_login import LoginManager
 
 #Impor db dan model dari file models.py
 from models import db, User
 
-def create_app():
+def create_app(init_database=True, warmup=True):
     """
     Factory function untuk membuat dan mengkonfigurasi aplikasi Flask.
+
+    init_database=False melewati pembuatan tabel dan data awal (dijalankan
+    sekali lewat init_db.py sebelum server produksi start). warmup=False
+    menunda warmup MediaPipe, mis. agar dijalankan per worker setelah fork,
+    atau melewatinya sama sekali pada script command-line sekali jalan.
+    Galeri wajah dan pool proses pengenalan tetap dimuat malas saat dipakai.
     """
     app = Flask(__name__, instance_relative_config=True)
 
@@ -29,17 +35,99 @@ def create_app():
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
 
+    # Jumlah pasangan detector+mesh MediaPipe yang dipakai bersama per proses
+    app.config['FACE_MODEL_POOL_SIZE'] = int(os.environ.get('FACE_MODEL_POOL_SIZE', 2))
+    # Jumlah detector jarak jauh per proses untuk frame kiosk dan foto kelas
+    # (kira-kira jumlah kiosk yang streaming bersamaan ke satu worker)
+    app.config['FACE_DETECTION_POOL_SIZE'] = int(os.environ.get('FACE_DETECTION_POOL_SIZE', 2))
+
+    # 'verify' = cocokkan hanya dengan wajah user yang login (1:1),
+    # 'identify' = cari di seluruh galeri (1:N)
+    app.config['FACE_MATCH_MODE'] = os.environ.get('FACE_MATCH_MODE', 'verify')
+    # Pada mode verify, jumlah kandidat teratas yang dicek untuk mendeteksi
+    # wajah milik user lain (0 = nonaktif). Pengecekan ini memindai galeri
+    # mata kuliah, atau seluruh galeri (O(jumlah template)) jika mata kuliah
+    # belum punya peserta dan indeks ANN tidak aktif, sehingga biaya per
+    # request tidak lagi konstan.
+    app.config['FACE_IMPOSTOR_TOP_K'] = int(os.environ.get('FACE_IMPOSTOR_TOP_K', 0))
+
+    # Indeks ANN (IVF) untuk galeri besar. NPROBE adalah kenop recall/latensi;
+    # indeks hanya dipakai jika jumlah wajah >= MIN_SIZE.
+    app.config['FACE_ANN_INDEX_PATH'] = os.environ.get(
+        'FACE_ANN_INDEX_PATH', os.path.join(app.instance_path, 'face_ann_index.npz'))
+    app.config['FACE_ANN_NPROBE'] = int(os.environ.get('FACE_ANN_NPROBE', 8))
+    app.config['FACE_ANN_MIN_SIZE'] = int(os.environ.get('FACE_ANN_MIN_SIZE', 10000))
+
+    # Snapshot galeri (int8 + float32) yang di-memmap bersama oleh semua
+    # proses; kosongkan untuk menonaktifkan. RERANK = jumlah kandidat hasil
+    # scoring int8 yang dihitung ulang secara exact.
+    app.config['FACE_GALLERY_SNAPSHOT_PATH'] = os.environ.get(
+        'FACE_GALLERY_SNAPSHOT_PATH', os.path.join(app.instance_path, 'face_gallery.snapshot'))
+    app.config['FACE_GALLERY_RERANK'] = int(os.environ.get('FACE_GALLERY_RERANK', 16))
+
+    # Engine pengenalan wajah: 'mediapipe' atau 'face_recognition' (dlib,
+    # perlu library face_recognition). Embedding dari engine lain diabaikan galeri.
+    app.config['RECOGNITION_BACKEND'] = os.environ.get('RECOGNITION_BACKEND', 'mediapipe')
+
+    # Template wajah per user: batas jumlah template (yang tertua dibuang),
+    # dan opsi menambah foto presensi yang sangat mirip sebagai template baru
+    app.config['FACE_TEMPLATE_LIMIT'] = int(os.environ.get('FACE_TEMPLATE_LIMIT', 5))
+    app.config['FACE_TEMPLATE_AUTO_ADD'] = os.environ.get('FACE_TEMPLATE_AUTO_ADD', '0') == '1'
+    # Batas auto-add = threshold pencocokan + porsi ini dari sisa jarak ke 1.0,
+    # sehingga artinya sama sebelum dan sesudah proyeksi ulang ke basis landmark
+    # (0.67 dengan threshold mentah 0.85 setara similarity 0.95)
+    app.config['FACE_TEMPLATE_AUTO_ADD_MARGIN'] = float(os.environ.get('FACE_TEMPLATE_AUTO_ADD_MARGIN', 0.67))
+
+    # Executor pengenalan wajah: jumlah proses worker (0 = jalan di thread
+    # request), batas antrean, dan saran Retry-After saat antrean penuh
+    app.config['RECOGNITION_WORKERS'] = int(os.environ.get('RECOGNITION_WORKERS', 0))
+    app.config['RECOGNITION_MAX_QUEUE'] = int(os.environ.get('RECOGNITION_MAX_QUEUE', 16))
+    app.config['RECOGNITION_TIMEOUT'] = float(os.environ.get('RECOGNITION_TIMEOUT', 30))
+    app.config['RECOGNITION_RETRY_AFTER'] = int(os.environ.get('RECOGNITION_RETRY_AFTER', 2))
+
+    # Penyimpanan foto presensi: 'local' (folder static) atau 's3' (object store)
+    app.config['CAPTURE_BACKEND'] = os.environ.get('CAPTURE_BACKEND', 'local')
+    app.config['CAPTURE_QUEUE_SIZE'] = int(os.environ.get('CAPTURE_QUEUE_SIZE', 256))
+    app.config['CAPTURE_THUMBNAIL_WIDTH'] = int(os.environ.get('CAPTURE_THUMBNAIL_WIDTH', 128))
+    app.config['CAPTURE_S3_BUCKET'] = os.environ.get('CAPTURE_S3_BUCKET')
+    app.config['CAPTURE_S3_PREFIX'] = os.environ.get('CAPTURE_S3_PREFIX', '')
+    app.config['CAPTURE_S3_ENDPOINT'] = os.environ.get('CAPTURE_S3_ENDPOINT')
+    app.config['CAPTURE_PUBLIC_URL'] = os.environ.get('CAPTURE_PUBLIC_URL')
+
+    # Request yang lebih lama dari batas ini dicatat beserta rincian tahapnya
+    # (0 = nonaktif)
+    app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 0))
+
+    # Lama (detik) identitas user yang login disimpan di memori tiap worker (0 = nonaktif)
+    app.config['IDENTITY_CACHE_TTL'] = float(os.environ.get('IDENTITY_CACHE_TTL', 30))
+    # Seberapa sering (detik) tiap worker memeriksa perubahan user dari worker lain
+    app.config['IDENTITY_CACHE_CHECK_INTERVAL'] = float(os.environ.get('IDENTITY_CACHE_CHECK_INTERVAL', 2))
+
+    # Mode kiosk: jumlah frame yang boleh menunggu sebelum frame lama dibuang,
+    # vote yang dibutuhkan untuk mencatat presensi, dan batas pencocokan per track
+    app.config['KIOSK_MAX_BACKLOG'] = int(os.environ.get('KIOSK_MAX_BACKLOG', 2))
+    app.config['KIOSK_VOTES_NEEDED'] = int(os.environ.get('KIOSK_VOTES_NEEDED', 2))
+    app.config['KIOSK_MAX_SAMPLES'] = int(os.environ.get('KIOSK_MAX_SAMPLES', 4))
+
     # --- Inisialisasi Ekstensi ---
     db.init_app(app)
+
+    import metrics
+    metrics.init_app(app, db)
     
     login_manager = LoginManager()
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
 
     # --- User Loader ---
+    # Identitas ringan dari cache per worker, tanpa membaca blob embedding
+    from identity_cache import identity_cache
+    identity_cache.configure(ttl=app.config['IDENTITY_CACHE_TTL'],
+                             check_interval=app.config['IDENTITY_CACHE_CHECK_INTERVAL'])
+
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return identity_cache.get(int(user_id))
 
     # --- Registrasi Blueprints (Rute) ---
     from auth import auth as auth_blueprint
@@ -49,9 +137,44 @@ def create_app():
     app.register_blueprint(main_blueprint)
 
     # Health check endpoint untuk Railway
+    # Mengembalikan 503 sampai model wajah selesai di-warmup, sehingga load
+    # balancer tidak mengarahkan request ke worker yang masih dingin.
     @app.route('/health')
     def health_check():
-        return {'status': 'healthy', 'service': 'hadirku-project'}
+        from recognition_backends import get_backend
+        backend = get_backend()
+        ready = backend.ready.is_set()
+        from recognition_executor import recognition_executor
+        body = {
+            'status': 'healthy' if ready else ('warmup_failed' if backend.warmup_error else 'warming_up'),
+            'ready': ready,
+            'service': 'hadirku-project',
+            'recognition_backend': backend.name,
+            'recognition_queue': recognition_executor.stats(),
+            'warmup_seconds': backend.warmup_seconds,
+            'warmup_error': backend.warmup_error,
+        }
+        return body, 200 if ready else 503
+
+    # Metrik format teks Prometheus untuk proses worker yang melayani request
+    @app.route('/metrics')
+    def metrics_endpoint():
+        from face_gallery import face_gallery
+        from recognition_executor import recognition_executor
+        queue_stats = recognition_executor.stats()
+        gauges = [
+            ('hadirku_gallery_size', 'Jumlah wajah di galeri memori', len(face_gallery)),
+            ('hadirku_gallery_templates', 'Jumlah template wajah di galeri memori', face_gallery.template_count),
+            ('hadirku_gallery_generation', 'Generasi galeri yang sudah dimuat', face_gallery.generation),
+            ('hadirku_recognition_queue_depth', 'Job pengenalan yang antre atau berjalan', queue_stats['queue_depth']),
+        ]
+        # Total yang terus bertambah sejak proses start
+        totals = [
+            ('hadirku_recognition_completed_total', 'Job pengenalan yang selesai', queue_stats['completed']),
+            ('hadirku_recognition_rejected_total', 'Job pengenalan yang ditolak karena antrean penuh',
+             queue_stats['rejected']),
+        ]
+        return metrics.metrics.render(gauges, totals), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
     
     # Setup endpoint untuk Railway manual setup
     @app.route('/setup-admin/<password>')
@@ -110,6 +233,61 @@ def create_app():
         from admin import setup_admin
         setup_admin(app, db)
 
+    if init_database:
+        initialize_database(app)
+
+    # --- Engine pengenalan wajah ---
+    from recognition_backends import configure_backend, get_backend
+    configure_backend(app.config['RECOGNITION_BACKEND'])
+    backend = get_backend()
+
+    # --- Galeri wajah ---
+    from face_gallery import face_gallery
+    face_gallery.configure_backend(backend.backend_id)
+    face_gallery.configure_ann(
+        app.config['FACE_ANN_INDEX_PATH'],
+        nprobe=app.config['FACE_ANN_NPROBE'],
+        min_size=app.config['FACE_ANN_MIN_SIZE'],
+    )
+    face_gallery.configure_snapshot(
+        app.config['FACE_GALLERY_SNAPSHOT_PATH'],
+        rerank=app.config['FACE_GALLERY_RERANK'],
+    )
+
+    # --- Executor pengenalan wajah ---
+    from recognition_executor import recognition_executor
+    recognition_executor.configure(
+        workers=app.config['RECOGNITION_WORKERS'],
+        max_queue=app.config['RECOGNITION_MAX_QUEUE'],
+        timeout=app.config['RECOGNITION_TIMEOUT'],
+        retry_after=app.config['RECOGNITION_RETRY_AFTER'],
+        backend=backend.name,
+    )
+
+    # --- Penyimpanan foto presensi ---
+    from capture_store import capture_store, create_backend
+    capture_store.configure(
+        create_backend(app.config, app.static_folder),
+        max_queue=app.config['CAPTURE_QUEUE_SIZE'],
+        thumbnail_width=app.config['CAPTURE_THUMBNAIL_WIDTH'],
+    )
+    app.jinja_env.globals['capture_url'] = capture_store.url
+    app.jinja_env.globals['capture_thumbnail_url'] = lambda key: url_for('main.capture_thumbnail', key=key)
+
+    # --- Warmup model pengenalan wajah ---
+    from face_utils_mediapipe import face_model_pool, detection_model_pool
+    face_model_pool.configure(app.config['FACE_MODEL_POOL_SIZE'])
+    detection_model_pool.configure(app.config['FACE_DETECTION_POOL_SIZE'])
+    if warmup:
+        backend.start_warmup()
+
+    return app
+
+def initialize_database(app):
+    """
+    Buat folder, tabel, kolom/index baru, dan data awal.
+    """
+    with app.app_context():
         # --- Membuat Folder dan Database ---
         try:
             os.makedirs(app.instance_path)
@@ -122,12 +300,13 @@ def create_app():
             
         # Membuat semua tabel database jika belum ada
         db.create_all()
+        # Tambahkan kolom/index baru pada tabel yang sudah ada
+        from schema import upgrade_schema
+        upgrade_schema()
         
         # --- AUTO SETUP untuk Railway ---
         setup_initial_data()
 
-    return app
-
 def setup_initial_data():
     """
     Setup initial data untuk Railway deployment
@@ -0,0 +1,100 @@
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, AttendanceRecord
+from db_utils import dialect_insert
+from attendance_summary import record_present, record_present_many
+from timezone_utils import wib_date, wib_today
+
+# Kolom yang membentuk unique index satu presensi per mahasiswa, mata kuliah, dan hari
+_UNIQUE_COLUMNS = ['user_id', 'matakuliah_id', 'attendance_date']
+
+
+def has_attended_today(user_id, matakuliah_id):
+    """
+    Cek cepat sebelum pengenalan wajah; dilayani langsung oleh unique index.
+    """
+    return db.session.query(AttendanceRecord.id).filter(
+        AttendanceRecord.user_id == user_id,
+        AttendanceRecord.matakuliah_id == matakuliah_id,
+        AttendanceRecord.attendance_date == wib_today()
+    ).first() is not None
+
+
+def insert_attendance(user_id, matakuliah_id, image_path, latitude=None, longitude=None, timestamp=None):
+    """
+    Simpan presensi dengan INSERT ... ON CONFLICT DO NOTHING sehingga dua
+    request yang berbarengan tidak bisa membuat dua baris di hari yang sama.
+    timestamp (UTC) default sekarang. Mengembalikan True jika baris baru
+    tersimpan, False jika sudah ada.
+    """
+    timestamp = timestamp or datetime.utcnow()
+    values = {
+        'user_id': user_id,
+        'matakuliah_id': matakuliah_id,
+        'timestamp': timestamp,
+        'attendance_date': wib_date(timestamp),
+        'latitude': latitude,
+        'longitude': longitude,
+        'image_path': image_path,
+    }
+
+    stmt = dialect_insert(AttendanceRecord)
+    if stmt is not None:
+        result = db.session.execute(stmt.values(**values).on_conflict_do_nothing(index_elements=_UNIQUE_COLUMNS))
+        if result.rowcount != 1:
+            db.session.rollback()
+            return False
+    else:
+        # Database lain: andalkan unique index dan tangkap pelanggarannya
+        try:
+            db.session.execute(AttendanceRecord.__table__.insert().values(**values))
+        except IntegrityError:
+            db.session.rollback()
+            return False
+
+    # Rekap harian diperbarui dalam transaksi yang sama dengan presensinya
+    record_present(user_id, matakuliah_id, values['attendance_date'])
+    db.session.commit()
+    return True
+
+
+def insert_classroom_attendance(entries, matakuliah_id):
+    """
+    Simpan presensi satu sesi kelas sekaligus dalam satu transaksi.
+    `entries` berisi pasangan (user_id, image_path). Mahasiswa yang sudah
+    presensi hari ini dilewati. Mengembalikan user_id yang baru tersimpan.
+    """
+    timestamp = datetime.utcnow()
+    attendance_date = wib_date(timestamp)
+    rows = [{
+        'user_id': user_id,
+        'matakuliah_id': matakuliah_id,
+        'timestamp': timestamp,
+        'attendance_date': attendance_date,
+        'latitude': None,
+        'longitude': None,
+        'image_path': image_path,
+    } for user_id, image_path in entries]
+    if not rows:
+        return []
+
+    stmt = dialect_insert(AttendanceRecord)
+    if stmt is not None:
+        result = db.session.execute(stmt.values(rows).on_conflict_do_nothing(
+            index_elements=_UNIQUE_COLUMNS).returning(AttendanceRecord.user_id))
+        inserted = [user_id for (user_id,) in result]
+    else:
+        inserted = []
+        for values in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(AttendanceRecord.__table__.insert().values(**values))
+                inserted.append(values['user_id'])
+            except IntegrityError:
+                pass
+
+    record_present_many(inserted, matakuliah_id, attendance_date)
+    db.session.commit()
+    return inserted
@@ -0,0 +1,108 @@
+"""
+Ekspor presensi ke CSV secara streaming. Baris dibaca dengan yield_per
+(server-side cursor di PostgreSQL) dan ditulis per potongan, sehingga
+memori tetap kecil walaupun rentangnya satu semester penuh.
+"""
+import csv
+import io
+from itertools import groupby
+
+from sqlalchemy import select
+
+from models import db, AttendanceRecord, AttendanceDailySummary, MataKuliah, User
+from attendance_summary import STATUS_PRESENT
+from timezone_utils import wib_timestamp
+
+# Jumlah baris yang diambil per fetch dan ditulis per potongan respons
+_YIELD_PER = 1000
+
+_PIVOT_MARKS = {STATUS_PRESENT: 'H'}
+
+
+def _csv_chunks(rows):
+    """
+    Ubah iterator baris menjadi potongan teks CSV.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % _YIELD_PER == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _date_filter(column, start_date, end_date):
+    conditions = []
+    if start_date:
+        conditions.append(column >= start_date)
+    if end_date:
+        conditions.append(column <= end_date)
+    return conditions
+
+
+def iter_attendance_csv(matakuliah_id=None, start_date=None, end_date=None):
+    """
+    CSV satu baris per presensi, dengan waktu WIB dihitung di database.
+    """
+    stmt = select(
+        AttendanceRecord.attendance_date,
+        wib_timestamp(AttendanceRecord.timestamp),
+        User.name,
+        MataKuliah.kode_mk,
+        MataKuliah.nama_mk,
+        AttendanceRecord.latitude,
+        AttendanceRecord.longitude,
+        AttendanceRecord.image_path,
+    ).join(User, User.id == AttendanceRecord.user_id).join(
+        MataKuliah, MataKuliah.id == AttendanceRecord.matakuliah_id
+    ).where(
+        *_date_filter(AttendanceRecord.attendance_date, start_date, end_date)
+    ).order_by(AttendanceRecord.attendance_date, MataKuliah.kode_mk, User.name)
+    if matakuliah_id:
+        stmt = stmt.where(AttendanceRecord.matakuliah_id == matakuliah_id)
+
+    def rows():
+        yield ['tanggal', 'waktu_wib', 'nama', 'kode_mk', 'nama_mk', 'latitude', 'longitude', 'foto']
+        result = db.session.execute(stmt.execution_options(yield_per=_YIELD_PER))
+        for attendance_date, local_time, name, kode_mk, nama_mk, latitude, longitude, image_path in result:
+            yield [
+                attendance_date.isoformat() if attendance_date else '',
+                local_time.strftime('%Y-%m-%d %H:%M:%S') if local_time else '',
+                name, kode_mk, nama_mk,
+                '' if latitude is None else latitude,
+                '' if longitude is None else longitude,
+                image_path,
+            ]
+
+    return _csv_chunks(rows())
+
+
+def iter_pivot_csv(matakuliah_id, start_date=None, end_date=None):
+    """
+    CSV pivot untuk satu mata kuliah: baris = mahasiswa, kolom = hari kuliah,
+    isi 'H' (hadir) atau 'A' (absen). Dibaca dari tabel rekap harian, jadi
+    peserta yang tidak pernah hadir tetap muncul.
+    """
+    summary = AttendanceDailySummary
+    conditions = [summary.matakuliah_id == matakuliah_id,
+                  *_date_filter(summary.summary_date, start_date, end_date)]
+    dates = [day for (day,) in db.session.execute(
+        select(summary.summary_date).where(*conditions).distinct().order_by(summary.summary_date)
+    )]
+    stmt = select(User.name, summary.summary_date, summary.status).join(
+        User, User.id == summary.user_id
+    ).where(*conditions).order_by(User.name, summary.user_id, summary.summary_date)
+
+    def rows():
+        yield ['nama'] + [day.isoformat() for day in dates] + ['total_hadir']
+        result = db.session.execute(stmt.execution_options(yield_per=_YIELD_PER))
+        for name, cells in groupby(result, key=lambda row: row[0]):
+            statuses = {day: status for _, day, status in cells}
+            marks = [_PIVOT_MARKS.get(statuses[day], 'A') if day in statuses else '' for day in dates]
+            yield [name] + marks + [marks.count('H')]
+
+    return _csv_chunks(rows())
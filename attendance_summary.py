@@ -0,0 +1,287 @@
+"""
+Rekap harian presensi (tabel attendance_daily_summary per mahasiswa dan
+penghitung attendance_session_summary per hari kuliah) dan query dashboard
+yang hanya membaca rekap tersebut.
+"""
+from datetime import timedelta
+from itertools import groupby
+
+from sqlalchemy import and_, case, func, literal, select
+
+from models import (db, AttendanceRecord, AttendanceDailySummary, AttendanceSessionSummary, MataKuliah, User,
+                    course_enrollment)
+from db_utils import dialect_insert
+from timezone_utils import wib_today
+
+STATUS_PRESENT = 'hadir'
+STATUS_ABSENT = 'absen'
+
+
+_SUMMARY_COLUMNS = ['matakuliah_id', 'summary_date', 'user_id', 'status']
+_SESSION_COLUMNS = ['matakuliah_id', 'summary_date', 'enrolled_count', 'present_count', 'enrolled_present_count']
+
+
+def _session_filter(table, matakuliah_id, summary_date):
+    return and_(table.c.matakuliah_id == matakuliah_id, table.c.summary_date == summary_date)
+
+
+def _insert_ignoring_conflicts(model, columns, query):
+    stmt = dialect_insert(model)
+    if stmt is not None:
+        db.session.execute(stmt.from_select(columns, query).on_conflict_do_nothing())
+    else:
+        db.session.execute(model.__table__.insert().from_select(columns, query))
+
+
+def _ensure_session_rows(matakuliah_id, summary_date):
+    """
+    Pada presensi pertama suatu mata kuliah di suatu hari, semua peserta
+    terdaftar dicatat 'absen' terlebih dahulu dan penghitung hari kuliahnya
+    dibuat.
+    """
+    sessions = AttendanceSessionSummary.__table__
+    exists = db.session.query(sessions.c.matakuliah_id).filter(
+        _session_filter(sessions, matakuliah_id, summary_date)
+    ).first()
+    if exists:
+        return
+    _insert_ignoring_conflicts(AttendanceDailySummary, _SUMMARY_COLUMNS, select(
+        literal(matakuliah_id), literal(summary_date), course_enrollment.c.user_id, literal(STATUS_ABSENT)
+    ).where(course_enrollment.c.matakuliah_id == matakuliah_id))
+    enrolled = select(func.count()).select_from(course_enrollment).where(
+        course_enrollment.c.matakuliah_id == matakuliah_id
+    ).scalar_subquery()
+    _insert_ignoring_conflicts(AttendanceSessionSummary, _SESSION_COLUMNS, select(
+        literal(matakuliah_id), literal(summary_date), enrolled, literal(0), literal(0)
+    ))
+
+
+def _bump_session(matakuliah_id, summary_date, present, enrolled_present):
+    """
+    Tambah/kurangi penghitung hadir secara atomik (UPDATE col = col + n).
+    """
+    sessions = AttendanceSessionSummary.__table__
+    db.session.execute(sessions.update().where(_session_filter(sessions, matakuliah_id, summary_date)).values(
+        present_count=sessions.c.present_count + present,
+        enrolled_present_count=sessions.c.enrolled_present_count + enrolled_present,
+    ))
+
+
+def _enrolled_among(matakuliah_id, user_ids):
+    return {user_id for (user_id,) in db.session.query(course_enrollment.c.user_id).filter(
+        course_enrollment.c.matakuliah_id == matakuliah_id, course_enrollment.c.user_id.in_(user_ids)
+    )}
+
+
+def _session_counts(*criteria):
+    """
+    SELECT penghitung hari kuliah dari baris rekap per mahasiswa.
+    """
+    summary = AttendanceDailySummary.__table__
+    is_enrolled = course_enrollment.c.user_id.isnot(None)
+    is_present = summary.c.status == STATUS_PRESENT
+    return select(
+        summary.c.matakuliah_id, summary.c.summary_date,
+        func.sum(case((is_enrolled, 1), else_=0)),
+        func.sum(case((is_present, 1), else_=0)),
+        func.sum(case((and_(is_present, is_enrolled), 1), else_=0)),
+    ).select_from(summary.outerjoin(course_enrollment, and_(
+        course_enrollment.c.matakuliah_id == summary.c.matakuliah_id,
+        course_enrollment.c.user_id == summary.c.user_id,
+    ))).where(*criteria).group_by(summary.c.matakuliah_id, summary.c.summary_date)
+
+
+def record_present(user_id, matakuliah_id, summary_date):
+    """
+    Tandai mahasiswa hadir. Dipanggil di transaksi yang sama dengan insert
+    presensi; commit dilakukan pemanggil.
+    """
+    record_present_many([user_id], matakuliah_id, summary_date)
+
+
+def record_present_many(user_ids, matakuliah_id, summary_date):
+    """
+    Seperti record_present untuk banyak mahasiswa sekaligus (satu statement).
+    """
+    if not user_ids:
+        return
+    matakuliah_id = int(matakuliah_id)
+    _ensure_session_rows(matakuliah_id, summary_date)
+    _bump_session(matakuliah_id, summary_date, len(user_ids), len(_enrolled_among(matakuliah_id, user_ids)))
+    rows = [{'matakuliah_id': matakuliah_id, 'summary_date': summary_date,
+             'user_id': user_id, 'status': STATUS_PRESENT} for user_id in user_ids]
+    stmt = dialect_insert(AttendanceDailySummary)
+    if stmt is not None:
+        db.session.execute(stmt.values(rows).on_conflict_do_update(
+            index_elements=['matakuliah_id', 'summary_date', 'user_id'], set_={'status': STATUS_PRESENT}
+        ))
+    else:
+        for values in rows:
+            db.session.merge(AttendanceDailySummary(**values))
+
+
+def record_removed(user_id, matakuliah_id, summary_date):
+    """
+    Presensi dihapus: peserta terdaftar menjadi 'absen', selain itu barisnya dihapus.
+    """
+    if summary_date is None:
+        return
+    row = db.session.get(AttendanceDailySummary, (matakuliah_id, summary_date, user_id))
+    if row is None or row.status != STATUS_PRESENT:
+        return
+    enrolled = bool(_enrolled_among(matakuliah_id, [user_id]))
+    if enrolled:
+        row.status = STATUS_ABSENT
+    else:
+        db.session.delete(row)
+    _bump_session(matakuliah_id, summary_date, -1, -int(enrolled))
+
+
+def refresh_enrollment(matakuliah_id, summary_date=None):
+    """
+    Selaraskan hari kuliah (default hari ini) dengan daftar peserta terbaru:
+    peserta baru dicatat 'absen', baris 'absen' peserta yang dikeluarkan
+    dihapus, lalu penghitungnya dihitung ulang. Hari kuliah lampau tetap
+    memakai daftar peserta saat itu. Commit dilakukan pemanggil.
+    """
+    summary_date = summary_date or wib_today()
+    summary = AttendanceDailySummary.__table__
+    sessions = AttendanceSessionSummary.__table__
+    if db.session.query(sessions.c.matakuliah_id).filter(
+            _session_filter(sessions, matakuliah_id, summary_date)).first() is None:
+        return
+
+    enrolled = select(course_enrollment.c.user_id).where(course_enrollment.c.matakuliah_id == matakuliah_id)
+    db.session.execute(summary.delete().where(
+        _session_filter(summary, matakuliah_id, summary_date),
+        summary.c.status == STATUS_ABSENT,
+        summary.c.user_id.not_in(enrolled),
+    ))
+    existing = select(summary.c.user_id).where(_session_filter(summary, matakuliah_id, summary_date))
+    _insert_ignoring_conflicts(AttendanceDailySummary, _SUMMARY_COLUMNS, select(
+        literal(matakuliah_id), literal(summary_date), course_enrollment.c.user_id, literal(STATUS_ABSENT)
+    ).where(course_enrollment.c.matakuliah_id == matakuliah_id, course_enrollment.c.user_id.not_in(existing)))
+
+    db.session.execute(sessions.delete().where(_session_filter(sessions, matakuliah_id, summary_date)))
+    db.session.execute(sessions.insert().from_select(_SESSION_COLUMNS, _session_counts(
+        _session_filter(summary, matakuliah_id, summary_date)
+    )))
+
+
+def rebuild_summary():
+    """
+    Hitung ulang seluruh rekap dari attendance_record dan daftar peserta.
+    Mengembalikan jumlah baris hadir dan absen.
+    """
+    summary = AttendanceDailySummary.__table__
+    records = AttendanceRecord.__table__
+    columns = _SUMMARY_COLUMNS
+
+    db.session.execute(AttendanceSessionSummary.__table__.delete())
+    db.session.execute(summary.delete())
+    db.session.execute(summary.insert().from_select(columns, select(
+        records.c.matakuliah_id, records.c.attendance_date, records.c.user_id, literal(STATUS_PRESENT)
+    ).where(records.c.attendance_date.isnot(None)).distinct()))
+
+    # Hari kuliah = tanggal yang punya minimal satu presensi
+    sessions = select(summary.c.matakuliah_id, summary.c.summary_date).distinct().subquery()
+    present = summary.alias('present')
+    db.session.execute(summary.insert().from_select(columns, select(
+        sessions.c.matakuliah_id, sessions.c.summary_date, course_enrollment.c.user_id, literal(STATUS_ABSENT)
+    ).select_from(
+        sessions.join(course_enrollment, course_enrollment.c.matakuliah_id == sessions.c.matakuliah_id)
+    ).where(
+        ~select(present.c.user_id).where(and_(
+            present.c.matakuliah_id == sessions.c.matakuliah_id,
+            present.c.summary_date == sessions.c.summary_date,
+            present.c.user_id == course_enrollment.c.user_id,
+        )).exists()
+    )))
+    db.session.execute(AttendanceSessionSummary.__table__.insert().from_select(_SESSION_COLUMNS, _session_counts()))
+    db.session.commit()
+
+    counts = dict(db.session.query(summary.c.status, func.count()).group_by(summary.c.status).all())
+    return counts.get(STATUS_PRESENT, 0), counts.get(STATUS_ABSENT, 0)
+
+
+def summary_needs_rebuild():
+    """
+    True jika rekap atau penghitung hari kuliah masih kosong padahal sudah
+    ada presensi (mis. database lama sebelum tabel rekap ada).
+    """
+    has_records = db.session.query(AttendanceRecord.id).filter(
+        AttendanceRecord.attendance_date.isnot(None)).first() is not None
+    return has_records and (db.session.query(AttendanceDailySummary.user_id).first() is None
+                            or db.session.query(AttendanceSessionSummary.matakuliah_id).first() is None)
+
+
+def _rate(present, enrolled):
+    # Mata kuliah tanpa daftar peserta tidak punya tingkat kehadiran
+    return round(100.0 * present / enrolled, 1) if enrolled else None
+
+
+def course_rates():
+    """
+    Per mata kuliah: jumlah hari kuliah, kehadiran peserta terdaftar dari
+    total kursi peserta, hadir di luar daftar peserta, dan persentasenya.
+    """
+    sessions = AttendanceSessionSummary
+    rows = db.session.query(
+        MataKuliah.id, MataKuliah.kode_mk, MataKuliah.nama_mk, func.count(),
+        func.sum(sessions.enrolled_present_count), func.sum(sessions.enrolled_count), func.sum(sessions.present_count),
+    ).join(sessions, sessions.matakuliah_id == MataKuliah.id).group_by(
+        MataKuliah.id, MataKuliah.kode_mk, MataKuliah.nama_mk
+    ).order_by(MataKuliah.kode_mk).all()
+    return [{
+        'id': course_id, 'kode_mk': kode_mk, 'nama_mk': nama_mk, 'sessions': session_count,
+        'present': int(present or 0), 'total': int(total or 0), 'walk_ins': int((all_present or 0) - (present or 0)),
+        'rate': _rate(present or 0, total or 0),
+    } for course_id, kode_mk, nama_mk, session_count, present, total, all_present in rows]
+
+
+def absence_streaks(matakuliah_id, limit=50):
+    """
+    Per mahasiswa di satu mata kuliah: jumlah absen berturut-turut sampai hari
+    kuliah terakhir (streak saat ini) dan streak terpanjang.
+    """
+    rows = db.session.query(
+        AttendanceDailySummary.user_id, User.name, AttendanceDailySummary.status
+    ).join(User, User.id == AttendanceDailySummary.user_id).filter(
+        AttendanceDailySummary.matakuliah_id == matakuliah_id
+    ).order_by(AttendanceDailySummary.user_id, AttendanceDailySummary.summary_date).all()
+
+    streaks = []
+    for (user_id, name), statuses in groupby(rows, key=lambda row: (row[0], row[1])):
+        current = longest = absences = 0
+        for _, _, status in statuses:
+            if status == STATUS_ABSENT:
+                current += 1
+                absences += 1
+                longest = max(longest, current)
+            else:
+                current = 0
+        if absences:
+            streaks.append({'user_id': user_id, 'name': name, 'current': current,
+                            'longest': longest, 'absences': absences})
+    streaks.sort(key=lambda item: (-item['current'], -item['longest'], item['name']))
+    return streaks[:limit]
+
+
+def heatmap(weeks=8):
+    """
+    Persentase kehadiran per (mata kuliah, tanggal) untuk beberapa minggu
+    terakhir. Mengembalikan (daftar tanggal, baris per mata kuliah).
+    """
+    start = wib_today() - timedelta(weeks=weeks)
+    sessions = AttendanceSessionSummary
+    rows = db.session.query(
+        sessions.matakuliah_id, sessions.summary_date, sessions.enrolled_present_count, sessions.enrolled_count
+    ).filter(sessions.summary_date >= start).all()
+
+    dates = sorted({summary_date for _, summary_date, _, _ in rows})
+    cells = {}
+    for matakuliah_id, summary_date, present, total in rows:
+        rate = _rate(present, total)
+        cells.setdefault(matakuliah_id, {})[summary_date] = None if rate is None else round(rate)
+    courses = MataKuliah.query.filter(MataKuliah.id.in_(cells)).order_by(MataKuliah.kode_mk).all() if cells else []
+    return dates, [{'course': course, 'cells': [cells[course.id].get(day) for day in dates]} for course in courses]
@@ -0,0 +1,50 @@
+import argparse
+
+from app import create_app, db
+from models import AttendanceRecord
+from capture_store import capture_store
+
+
+def backfill_thumbnails(batch_size=500):
+    """
+    Script command-line untuk membuat thumbnail foto presensi lama yang
+    disimpan sebelum thumbnail dibuat otomatis.
+    """
+    app = create_app(warmup=False)
+    with app.app_context():
+        print(f"--- Backfill Thumbnail Foto Presensi ({capture_store.thumbnail_width}px) ---")
+        created = existing = missing = failed = 0
+        last_id = 0
+
+        while True:
+            batch = db.session.query(AttendanceRecord.id, AttendanceRecord.image_path).filter(
+                AttendanceRecord.id > last_id
+            ).order_by(AttendanceRecord.id).limit(batch_size).all()
+            if not batch:
+                break
+            last_id = batch[-1][0]
+
+            for _, key in batch:
+                if not key:
+                    continue
+                try:
+                    if capture_store.backend.exists(capture_store.thumbnail_key(key)):
+                        existing += 1
+                        continue
+                    capture_store.thumbnail(key)
+                    created += 1
+                except FileNotFoundError:
+                    missing += 1
+                except Exception as e:
+                    print(f"  ! {key}: {e}")
+                    failed += 1
+            print(f"  Batch sampai ID {last_id}: {created} thumbnail dibuat")
+
+        print(f"\nSelesai: {created} dibuat, {existing} sudah ada, {missing} foto tidak ditemukan, {failed} gagal.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Buat thumbnail untuk foto presensi lama.")
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+    backfill_thumbnails(batch_size=args.batch_size)
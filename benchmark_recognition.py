@@ -0,0 +1,331 @@
+"""
+Benchmark pengenalan wajah dan generator beban lokal.
+
+Mode `stages` mengukur setiap tahap pipeline presensi secara terpisah
+(decode, resize, detect, mesh, match, verify, db) pada galeri sintetis
+berukuran tertentu. Mode `load` menjalankan aplikasi Flask sungguhan
+(lewat test client atau server lokal seperti gunicorn) dengan sejumlah
+pengguna paralel yang login, membuka halaman riwayat, dan mengirim presensi.
+
+Benchmark memakai database terpisah (default SQLite di folder sementara)
+karena membuat ribuan user sintetis. Contoh:
+
+    python benchmark_recognition.py stages --gallery-size 10000
+    python benchmark_recognition.py load --users 20 --concurrency 8
+    python benchmark_recognition.py --database-url postgresql://... load --url http://127.0.0.1:8000
+"""
+import argparse
+import glob
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+
+import cv2
+import numpy as np
+
+BENCH_PREFIX = 'bench_'
+BENCH_PASSWORD = 'benchmark'
+DEFAULT_DATABASE = f"sqlite:///{os.path.join(tempfile.gettempdir(), 'hadirku_benchmark.db')}"
+
+
+def summarize(samples):
+    """
+    p50/p95/p99 dan rata-rata (ms) dari daftar durasi dalam detik.
+    """
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'n': len(values), 'mean': values.mean(), 'p50': p50, 'p95': p95, 'p99': p99}
+
+
+def print_table(title, rows, elapsed=None):
+    print(f"\n{title}")
+    print(f"{'tahap':<16}{'n':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'ops/s':>10}")
+    for name, samples in rows:
+        if not samples:
+            continue
+        stats = summarize(samples)
+        throughput = len(samples) / elapsed if elapsed else 1000 / stats['mean'] if stats['mean'] else 0
+        print(f"{name:<16}{stats['n']:>7}{stats['mean']:>10.2f}{stats['p50']:>10.2f}"
+              f"{stats['p95']:>10.2f}{stats['p99']:>10.2f}{throughput:>10.1f}")
+
+
+def synthetic_probe_images(count=8, width=1280, height=960, seed=0):
+    """
+    Gambar JPEG sintetis berukuran kamera. Tidak berisi wajah sungguhan, jadi
+    hanya cocok untuk mengukur biaya decode/resize/detect/mesh, bukan akurasi.
+    """
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        frame = np.full((height, width, 3), rng.integers(80, 180), dtype=np.uint8)
+        frame += rng.integers(0, 20, size=frame.shape, dtype=np.uint8)
+        center = (int(width * rng.uniform(0.4, 0.6)), int(height * rng.uniform(0.4, 0.6)))
+        cv2.ellipse(frame, center, (width // 8, height // 5), 0, 0, 360, (150, 170, 210), -1)
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        images.append(buffer.tobytes())
+    return images
+
+
+def load_probe_images(directory):
+    images = []
+    for pattern in ('*.jpg', '*.jpeg', '*.png'):
+        for path in sorted(glob.glob(os.path.join(directory, pattern))):
+            with open(path, 'rb') as handle:
+                images.append(handle.read())
+    return images
+
+
+def seed_gallery(size, dim=1434, seed=0, batch_size=5000):
+    """
+    Pastikan ada `size` user sintetis dengan embedding acak ter-normalisasi.
+    User yang sudah ada dari run sebelumnya dipakai ulang.
+    """
+    from werkzeug.security import generate_password_hash
+    from models import db, User
+    from embedding_codec import encode_embedding, BACKEND_MEDIAPIPE
+    from face_templates import backfill_templates
+
+    existing = db.session.query(User.id).filter(User.name.like(f'{BENCH_PREFIX}%')).count()
+    if existing >= size:
+        return existing
+
+    rng = np.random.default_rng(seed + existing)
+    password_hash = generate_password_hash(BENCH_PASSWORD, method='pbkdf2:sha256')
+    for start in range(existing, size, batch_size):
+        stop = min(start + batch_size, size)
+        vectors = rng.standard_normal((stop - start, dim)).astype(np.float32)
+        db.session.bulk_insert_mappings(User, [
+            {'name': f'{BENCH_PREFIX}{number:06d}', 'password': password_hash, 'is_admin': False,
+             'face_encoding': encode_embedding(vector, BACKEND_MEDIAPIPE, normalize=True), 'has_face': True}
+            for number, vector in zip(range(start, stop), vectors)
+        ])
+        db.session.commit()
+        print(f"  {stop}/{size} user sintetis dibuat")
+    # Galeri dibaca dari tabel template; face_encoding disalin sebagai template pertama
+    backfill_templates()
+    return size
+
+
+def run_stages(args):
+    """
+    Ukur setiap tahap pipeline presensi secara berurutan di proses ini.
+    """
+    os.environ['DATABASE_URL'] = args.database_url
+    from app import create_app
+    from models import db, User, MataKuliah
+    from face_gallery import face_gallery
+    from face_utils_mediapipe import (face_model_pool, optimize_image_for_recognition,
+                                      match_embedding_in_db, verify_embedding_in_db)
+    from sqlalchemy import func
+    from models import AttendanceRecord
+    from image_io import decode_image
+    from attendance import has_attended_today, insert_attendance
+
+    app = create_app()
+    with app.app_context():
+        print(f"--- Benchmark Tahap Pengenalan (galeri {args.gallery_size}) ---")
+        seed_gallery(args.gallery_size)
+        started = time.perf_counter()
+        face_gallery.reload()
+        print(f"Galeri dimuat: {len(face_gallery)} wajah dalam {time.perf_counter() - started:.2f} detik")
+
+        images = load_probe_images(args.images) if args.images else synthetic_probe_images()
+        if not images:
+            raise SystemExit(f"Tidak ada gambar di {args.images}")
+        face_model_pool.configure(1)
+        face_model_pool.warmup()
+
+        bench_ids = [user_id for (user_id,) in db.session.query(User.id).filter(
+            User.name.like(f'{BENCH_PREFIX}%')).order_by(User.id).limit(args.iterations)]
+        course = MataKuliah.query.first()
+        rng = np.random.default_rng(1)
+        # Tahap db harus mengukur insert baru, bukan jalur konflik: setiap iterasi
+        # memakai tanggal berbeda, mundur dari presensi tertua (aman untuk run ulang)
+        oldest = db.session.query(func.min(AttendanceRecord.timestamp)).scalar() or datetime.utcnow()
+
+        stages = {name: [] for name in ('decode', 'resize', 'detect', 'mesh', 'match', 'verify', 'db')}
+        for iteration in range(args.iterations):
+            img_bytes = images[iteration % len(images)]
+
+            t0 = time.perf_counter()
+            frame = decode_image(img_bytes, target_width=640)
+            t1 = time.perf_counter()
+            rgb_frame = optimize_image_for_recognition(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            t2 = time.perf_counter()
+            with face_model_pool.acquire() as (face_detection, face_mesh):
+                face_detection.process(rgb_frame)
+                t3 = time.perf_counter()
+                mesh_results = face_mesh.process(rgb_frame)
+                t4 = time.perf_counter()
+
+            # Probe: landmark asli jika ada wajah, selain itu baris galeri + noise
+            if mesh_results.multi_face_landmarks:
+                probe = np.array([[p.x, p.y, p.z] for p in mesh_results.multi_face_landmarks[0].landmark],
+                                 dtype=np.float32).ravel()
+            else:
+                row = face_gallery.matrix[iteration % len(face_gallery)]
+                probe = row + rng.standard_normal(row.shape).astype(np.float32) * 0.01
+            claimed_user_id = bench_ids[iteration % len(bench_ids)]
+
+            t5 = time.perf_counter()
+            match_embedding_in_db(probe)
+            t6 = time.perf_counter()
+            verify_embedding_in_db(probe, claimed_user_id, impostor_top_k=app.config['FACE_IMPOSTOR_TOP_K'])
+            t7 = time.perf_counter()
+            if course is not None:
+                has_attended_today(claimed_user_id, course.id)
+                insert_attendance(claimed_user_id, course.id, image_path=f'captures/bench/{uuid.uuid4().hex}.jpg',
+                                  timestamp=oldest - timedelta(days=iteration + 1))
+            t8 = time.perf_counter()
+
+            for name, duration in zip(stages, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t6 - t5, t7 - t6, t8 - t7)):
+                stages[name].append(duration)
+
+        end_to_end = [sum(values) for values in zip(*(stages[name] for name in
+                                                         ('decode', 'resize', 'detect', 'mesh', 'verify', 'db')))]
+        print_table(f"Latensi per tahap (ms), {args.iterations} iterasi:",
+                    list(stages.items()) + [('total (verify)', end_to_end)])
+
+
+class _HttpSession:
+    """
+    Klien HTTP sederhana dengan cookie, untuk server lokal (gunicorn).
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def request(self, method, path, data=None, headers=None):
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers or {}, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+class _TestClientSession:
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None, headers=None):
+        return self.client.open(path, method=method, data=data, headers=headers or {},
+                                follow_redirects=True).status_code
+
+
+def _multipart(fields, image_bytes):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="capture.jpg"\r\n'
+                 f'Content-Type: image/jpeg\r\n\r\n'.encode() + image_bytes + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+
+def run_load(args):
+    """
+    Jalankan skenario pengguna paralel: login, buka /records, kirim presensi.
+    """
+    os.environ['DATABASE_URL'] = args.database_url
+    from app import create_app
+    from models import MataKuliah
+
+    app = create_app()
+    with app.app_context():
+        print(f"--- Generator Beban ({args.users} user, konkurensi {args.concurrency}) ---")
+        seed_gallery(args.users)
+        course_ids = [course.id for course in MataKuliah.query.all()]
+    if not course_ids:
+        raise SystemExit("Belum ada mata kuliah di database benchmark.")
+
+    images = load_probe_images(args.images) if args.images else synthetic_probe_images()
+    if args.url is None:
+        # Test client: warmup model dulu supaya tidak ikut terukur
+        from face_utils_mediapipe import face_model_pool
+        face_model_pool.ready.wait()
+
+    samples = {'login': [], 'records': [], 'mark_attendance': []}
+    statuses = {}
+    lock = threading.Lock()
+
+    def record(name, started, status):
+        with lock:
+            samples[name].append(time.perf_counter() - started)
+            statuses[(name, status)] = statuses.get((name, status), 0) + 1
+
+    def virtual_user(number):
+        session = _HttpSession(args.url) if args.url else _TestClientSession(app)
+        name = f'{BENCH_PREFIX}{number % args.users:06d}'
+
+        started = time.perf_counter()
+        status = session.request('POST', '/login', data=urllib.parse.urlencode(
+            {'name': name, 'password': BENCH_PASSWORD}).encode(),
+            headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        record('login', started, status)
+
+        for repeat in range(args.requests):
+            started = time.perf_counter()
+            record('records', started, session.request('GET', '/records'))
+
+            body, headers = _multipart({
+                'latitude': '-7.7956', 'longitude': '110.3695',
+                'matakuliah_id': course_ids[(number + repeat) % len(course_ids)],
+            }, images[(number + repeat) % len(images)])
+            started = time.perf_counter()
+            record('mark_attendance', started, session.request('POST', '/mark_attendance', data=body, headers=headers))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(virtual_user, range(args.sessions or args.users)))
+    elapsed = time.perf_counter() - started
+
+    total = sum(len(values) for values in samples.values())
+    print_table(f"Latensi per endpoint (ms), {total} request dalam {elapsed:.1f} detik "
+                f"({total / elapsed:.1f} req/s):", list(samples.items()), elapsed)
+    print("\nStatus HTTP:")
+    for (name, status), count in sorted(statuses.items()):
+        print(f"  {name:<16}{status:>5}  x{count}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark pengenalan wajah dan generator beban lokal.")
+    parser.add_argument('--database-url',
+                        help="Database khusus benchmark (default: SQLite di folder sementara; "
+                             "wajib untuk load --url dan harus sama dengan database server)")
+    parser.add_argument('--images', help="Folder berisi foto probe (default: gambar sintetis)")
+    subparsers = parser.add_subparsers(dest='mode', required=True)
+
+    stages_parser = subparsers.add_parser('stages', help="Ukur latensi setiap tahap pipeline.")
+    stages_parser.add_argument('--gallery-size', type=int, default=1000, help="Mis. 1000, 10000, 100000")
+    stages_parser.add_argument('--iterations', type=int, default=100)
+
+    load_parser = subparsers.add_parser('load', help="Jalankan beban paralel ke aplikasi.")
+    load_parser.add_argument('--url', help="URL server lokal (mis. gunicorn); default memakai test client")
+    load_parser.add_argument('--users', type=int, default=20, help="Jumlah akun sintetis")
+    load_parser.add_argument('--sessions', type=int, help="Jumlah sesi pengguna (default: sama dengan --users)")
+    load_parser.add_argument('--requests', type=int, default=3, help="Iterasi records+presensi per sesi")
+    load_parser.add_argument('--concurrency', type=int, default=4)
+
+    args = parser.parse_args()
+    if args.database_url is None:
+        if args.mode == 'load' and args.url:
+            # User sintetis harus dibuat di database yang dipakai server, bukan SQLite sementara
+            parser.error("load --url membutuhkan --database-url yang sama dengan database server")
+        args.database_url = DEFAULT_DATABASE
+    if args.mode == 'stages':
+        run_stages(args)
+    else:
+        run_load(args)
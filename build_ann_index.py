@@ -0,0 +1,56 @@
+import argparse
+import time
+
+from app import create_app
+from face_gallery import face_gallery
+
+
+def build_ann_index(nlist=256, nprobe=8, iterations=10, queries=200):
+    """
+    Script command-line untuk membangun indeks ANN galeri wajah, menyimpannya
+    ke FACE_ANN_INDEX_PATH, dan melaporkan recall terhadap pencarian exact.
+    """
+    app = create_app(warmup=False)
+    with app.app_context():
+        face_gallery.sync()
+        if not len(face_gallery):
+            print("Galeri wajah kosong, indeks tidak dibangun.")
+            return
+
+        print(f"--- Membangun Indeks ANN ({len(face_gallery)} wajah, {face_gallery.template_count} template, "
+              f"dimensi {face_gallery.dim}) ---")
+        started = time.perf_counter()
+        index = face_gallery.build_ann(nlist=nlist, nprobe=nprobe, iterations=iterations, recall_queries=queries)
+        print(f"Selesai dalam {time.perf_counter() - started:.1f} detik, {index.nlist} centroid.")
+        print(f"Disimpan ke {face_gallery.ann_path}")
+
+        # Recall dan latensi untuk beberapa nilai nprobe sebagai acuan tuning
+        sample = face_gallery.sample_queries(queries)
+        exact_ms = _time_per_query(lambda probe: face_gallery.matrix @ probe, sample)
+        print(f"\nPencarian exact: {exact_ms:.2f} ms/query")
+        print("nprobe  recall@1  ms/query")
+        for probe_count in sorted({1, 2, 4, nprobe, 16, 32}):
+            if probe_count > index.nlist:
+                continue
+            recall = face_gallery.ann_recall(sample, nprobe=probe_count)
+            labels = face_gallery.ann_labels
+            ann_ms = _time_per_query(
+                lambda probe: face_gallery.matrix[index.candidate_rows(labels, probe, probe_count)] @ probe, sample)
+            print(f"{probe_count:>6}  {recall:>8.3f}  {ann_ms:>8.2f}")
+
+
+def _time_per_query(search, queries):
+    started = time.perf_counter()
+    for probe in queries:
+        search(probe)
+    return (time.perf_counter() - started) * 1000 / max(len(queries), 1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bangun indeks ANN untuk galeri wajah.")
+    parser.add_argument('--nlist', type=int, default=256, help="Jumlah centroid (kelompok).")
+    parser.add_argument('--nprobe', type=int, default=8, help="Kelompok yang diperiksa per pencarian.")
+    parser.add_argument('--iterations', type=int, default=10, help="Iterasi k-means.")
+    parser.add_argument('--queries', type=int, default=200, help="Jumlah query untuk mengukur recall.")
+    args = parser.parse_args()
+    build_ann_index(nlist=args.nlist, nprobe=args.nprobe, iterations=args.iterations, queries=args.queries)
@@ -0,0 +1,230 @@
+import argparse
+import csv
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash
+
+from app import create_app, db
+from models import User, FaceTemplate
+from face_gallery import face_gallery, record_face_change
+from face_templates import encode_template, evict_templates, TEMPLATE_SOURCE_ENROLL
+from identity_cache import record_identity_change
+from recognition_backends import get_backend
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+REPORT_COLUMNS = ['name', 'photo', 'status', 'message']
+
+STATUS_MESSAGES = {
+    'ok': "Wajah berhasil didaftarkan.",
+    'no_face': "Tidak ada wajah terdeteksi.",
+    'multiple_faces': "Terdeteksi lebih dari satu wajah.",
+    'no_landmarks': "Landmark wajah tidak dapat dibaca.",
+    'unreadable': "File gambar tidak dapat dibaca.",
+    'failed': "Gagal memproses foto",
+    'unknown_user': "Mahasiswa belum terdaftar (gunakan --password untuk membuat akun).",
+    'admin_user': "Nama tersebut milik akun admin.",
+}
+
+
+def read_entries(source):
+    """
+    Daftar (nama, path foto) dari folder berisi `<nama mahasiswa>.jpg` atau
+    dari CSV dengan kolom `name` dan `photo` (path relatif terhadap file CSV).
+    """
+    if os.path.isdir(source):
+        entries = []
+        for filename in sorted(os.listdir(source)):
+            stem, extension = os.path.splitext(filename)
+            if extension.lower() in IMAGE_EXTENSIONS:
+                entries.append((stem.strip(), os.path.join(source, filename)))
+        return entries
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding='utf-8-sig', newline='') as handle:
+        reader = csv.DictReader(handle)
+        missing_columns = {'name', 'photo'} - set(reader.fieldnames or [])
+        if missing_columns:
+            raise SystemExit(f"Kolom wajib tidak ada: {', '.join(sorted(missing_columns))}")
+        return [
+            ((row['name'] or '').strip(), os.path.join(base_dir, (row['photo'] or '').strip()))
+            for row in reader if (row['name'] or '').strip()
+        ]
+
+
+def _init_worker(backend_name):
+    # Satu pasangan detector+mesh per proses worker
+    from face_utils_mediapipe import face_model_pool
+    from recognition_backends import configure_backend
+    face_model_pool.configure(1)
+    configure_backend(backend_name)
+
+
+def analyze_photo(path):
+    """
+    Dijalankan di proses worker. Mengembalikan (status, embedding mentah,
+    kualitas); untuk status 'failed' elemen ketiga berisi pesan error, agar
+    satu foto yang membuat engine error tidak menghentikan seluruh run.
+    """
+    try:
+        return _analyze_photo(path)
+    except Exception as e:
+        return 'failed', None, f"{type(e).__name__}: {e}"
+
+
+def _analyze_photo(path):
+    import cv2
+    from image_io import decode_image
+    from face_utils_mediapipe import optimize_image_for_recognition
+    from recognition_backends import get_backend
+
+    try:
+        with open(path, 'rb') as handle:
+            frame = decode_image(handle.read(), target_width=640)
+    except (OSError, ValueError):
+        return 'unreadable', None, None
+
+    backend = get_backend()
+    rgb_frame = optimize_image_for_recognition(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    embedding, face_count, quality = backend.embed(rgb_frame)
+    if face_count == 0:
+        return 'no_face', None, None
+    if face_count > 1:
+        return 'multiple_faces', None, None
+    if embedding is None:
+        return 'no_landmarks', None, None
+    return 'ok', embedding, quality
+
+
+def _load_report(report_path):
+    """
+    Nama yang sudah tercatat di laporan dari run sebelumnya (untuk resume).
+    """
+    if not os.path.exists(report_path):
+        return {}
+    with open(report_path, encoding='utf-8', newline='') as handle:
+        return {row['name']: row['status'] for row in csv.DictReader(handle)}
+
+
+def bulk_enroll(source, report_path=None, password=None, workers=None, batch_size=200, retry_failed=False):
+    """
+    Script command-line untuk mendaftarkan wajah banyak mahasiswa sekaligus.
+    Embedding dihitung paralel di semua core, lalu User dibuat/diperbarui per
+    batch. Setiap batch yang sudah di-commit dicatat di file laporan, sehingga
+    script bisa dijalankan ulang dan melanjutkan dari posisi terakhir.
+    """
+    report_path = report_path or f"{os.path.splitext(source.rstrip(os.sep))[0]}_report.csv"
+    done = _load_report(report_path)
+    # Jika satu nama muncul lebih dari sekali, foto terakhir yang dipakai
+    entries = [
+        (name, path) for name, path in dict(read_entries(source)).items()
+        if name not in done or (retry_failed and done[name] != 'ok')
+    ]
+
+    app = create_app(warmup=False)
+    with app.app_context():
+        template_limit = app.config['FACE_TEMPLATE_LIMIT']
+        backend_id = get_backend(app.config['RECOGNITION_BACKEND']).backend_id
+        # Template baru disimpan pada basis landmark yang dipakai galeri
+        face_gallery.sync()
+        print("--- Pendaftaran Wajah Massal ---")
+        print(f"{len(entries)} foto akan diproses ({len(done)} sudah tercatat di {report_path}).")
+        if not entries:
+            return
+
+        users = {name: (user_id, is_admin) for user_id, name, is_admin in
+                 db.session.query(User.id, User.name, User.is_admin).all()}
+        # Password default di-hash sekali untuk semua akun baru
+        password_hash = generate_password_hash(password, method='pbkdf2:sha256') if password else None
+
+        new_file = not os.path.exists(report_path)
+        with open(report_path, 'a', encoding='utf-8', newline='') as report_file, ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(),
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(app.config['RECOGNITION_BACKEND'],),
+        ) as pool:
+            report = csv.DictWriter(report_file, fieldnames=REPORT_COLUMNS)
+            if new_file:
+                report.writeheader()
+
+            totals = {}
+            paths = [path for _, path in entries]
+            results = pool.map(analyze_photo, paths, chunksize=4)
+            for start in range(0, len(entries), batch_size):
+                inserts, updates, rows, templates = [], [], [], []
+                for name, path in entries[start:start + batch_size]:
+                    status, embedding, quality = next(results)
+                    if status == 'ok':
+                        user_id, is_admin = users.get(name, (None, False))
+                        encoding, landmarks = encode_template(embedding, backend_id)
+                        # User.face_encoding selalu menyimpan vektor mentah
+                        raw = encoding if landmarks is None else landmarks
+                        template = {'name': name, 'encoding': encoding, 'landmarks': landmarks, 'quality': quality}
+                        if is_admin:
+                            status = 'admin_user'
+                        elif user_id is not None:
+                            updates.append({'id': user_id, 'face_encoding': raw, 'has_face': True})
+                            templates.append(template)
+                        elif password_hash:
+                            inserts.append({'name': name, 'password': password_hash,
+                                            'is_admin': False, 'face_encoding': raw, 'has_face': True})
+                            templates.append(template)
+                        else:
+                            status = 'unknown_user'
+                    message = STATUS_MESSAGES[status]
+                    if status == 'failed':
+                        message = f"{message}: {quality}"
+                    rows.append({'name': name, 'photo': path, 'status': status, 'message': message})
+                    totals[status] = totals.get(status, 0) + 1
+
+                if inserts:
+                    db.session.bulk_insert_mappings(User, inserts)
+                if updates:
+                    db.session.bulk_update_mappings(User, updates)
+                    # bulk_update_mappings tidak memicu event ORM, jadi has_face dicatat manual
+                    record_identity_change(update['id'] for update in updates)
+                db.session.flush()
+                changed_ids = [update['id'] for update in updates]
+                if inserts:
+                    new_users = db.session.query(User.id, User.name).filter(
+                        User.name.in_([insert['name'] for insert in inserts])
+                    ).all()
+                    for user_id, name in new_users:
+                        users[name] = (user_id, False)
+                        changed_ids.append(user_id)
+                # Foto massal ditambahkan sebagai template baru, seperti pendaftaran di web
+                if templates:
+                    db.session.bulk_insert_mappings(FaceTemplate, [
+                        {'user_id': users[template.pop('name')][0], 'source': TEMPLATE_SOURCE_ENROLL, **template}
+                        for template in templates
+                    ])
+                    evict_templates(changed_ids, template_limit)
+                for user_id in changed_ids:
+                    record_face_change(user_id)
+                db.session.commit()
+
+                # Laporan ditulis setelah commit supaya resume tidak melewatkan data
+                report.writerows(rows)
+                report_file.flush()
+                print(f"  {min(start + batch_size, len(entries))}/{len(entries)} diproses")
+
+        # Satu kali tulis ulang snapshot galeri untuk seluruh batch
+        face_gallery.save_snapshot()
+
+        summary = ', '.join(f"{status}: {count}" for status, count in sorted(totals.items()))
+        print(f"\nSelesai ({summary}). Laporan: {report_path}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Daftarkan wajah mahasiswa secara massal dari folder atau CSV.")
+    parser.add_argument('source', help="Folder berisi <nama>.jpg atau CSV dengan kolom name,photo")
+    parser.add_argument('--report', help="File laporan/checkpoint CSV (default: <source>_report.csv)")
+    parser.add_argument('--password', help="Password awal untuk mahasiswa yang belum punya akun")
+    parser.add_argument('--workers', type=int, help="Jumlah proses (default: jumlah core)")
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--retry-failed', action='store_true', help="Proses ulang foto yang sebelumnya ditolak.")
+    args = parser.parse_args()
+    bulk_enroll(args.source, report_path=args.report, password=args.password, workers=args.workers,
+                batch_size=args.batch_size, retry_failed=args.retry_failed)
@@ -0,0 +1,275 @@
+"""
+Penyimpanan foto bukti presensi.
+
+Foto disimpan apa adanya (bytes JPEG hasil upload, tanpa encode ulang) dengan
+nama berdasarkan hash SHA-256 isinya, dan dipecah ke subfolder dua tingkat
+(`captures/ab/cd/abcd....jpg`) agar satu folder tidak berisi ribuan file.
+Penulisan dilakukan oleh thread background melalui antrean terbatas, jadi
+request presensi tidak menunggu disk atau object store.
+
+Setiap foto juga dibuatkan thumbnail kecil (`thumbnails/ab/cd/<hash>_128.jpg`)
+untuk tampilan daftar di halaman admin.
+
+Backend bisa diganti lewat konfigurasi CAPTURE_BACKEND: `local` menulis ke
+folder static, `s3` menulis ke bucket object store dengan API yang sama.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import queue
+import re
+import threading
+from abc import ABC, abstractmethod
+
+from flask import url_for
+
+from image_io import make_thumbnail
+
+logger = logging.getLogger(__name__)
+
+# Key foto yang sah: berbasis hash (captures/ab/cd/<sha256>.jpg) atau nama
+# file lama langsung di folder captures (<nama>_<YYYYmmdd_HHMMSS>.jpg)
+_CAPTURE_KEY = re.compile(r'captures/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.jpg')
+_LEGACY_CAPTURE_KEY = re.compile(r'captures/[^/\\]+_\d{8}_\d{6}\.jpg')
+
+
+class CaptureBackend(ABC):
+    """
+    Antarmuka backend penyimpanan. `key` adalah path relatif seperti
+    `captures/ab/cd/<hash>.jpg` yang juga disimpan di AttendanceRecord.image_path.
+    """
+
+    @abstractmethod
+    def put(self, key, data, content_type='image/jpeg'):
+        pass
+
+    @abstractmethod
+    def get(self, key):
+        pass
+
+    @abstractmethod
+    def exists(self, key):
+        pass
+
+    @abstractmethod
+    def url(self, key):
+        pass
+
+
+class LocalFileSystemBackend(CaptureBackend):
+    """
+    Menyimpan file di bawah folder static aplikasi sehingga bisa dilayani
+    langsung lewat route static.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Key capture tidak valid: {key}")
+        return path
+
+    def put(self, key, data, content_type='image/jpeg'):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Tulis ke file sementara lalu rename agar pembaca tidak melihat file setengah jadi
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as handle:
+            handle.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, key):
+        with open(self._path(key), 'rb') as handle:
+            return handle.read()
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def url(self, key):
+        return url_for('static', filename=key)
+
+
+class S3Backend(CaptureBackend):
+    """
+    Backend object store yang kompatibel dengan S3 (AWS S3, MinIO, R2, dll).
+    Membutuhkan paket boto3.
+    """
+
+    def __init__(self, bucket, prefix='', public_url=None, endpoint_url=None):
+        try:
+            import boto3
+        except ImportError as e:
+            raise RuntimeError("CAPTURE_BACKEND=s3 membutuhkan paket boto3.") from e
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.public_url = public_url.rstrip('/') if public_url else None
+
+    def _object_key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put(self, key, data, content_type='image/jpeg'):
+        self.client.put_object(
+            Bucket=self.bucket, Key=self._object_key(key), Body=data, ContentType=content_type,
+            CacheControl='public, max-age=31536000, immutable',
+        )
+
+    def get(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))['Body'].read()
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except Exception:
+            return False
+
+    def url(self, key):
+        if self.public_url:
+            return f"{self.public_url}/{self._object_key(key)}"
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self._object_key(key)}, ExpiresIn=3600
+        )
+
+
+class CaptureStore:
+
+    def __init__(self, backend=None, max_queue=256, thumbnail_width=128):
+        self.backend = backend
+        self.thumbnail_width = thumbnail_width
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def configure(self, backend, max_queue=256, thumbnail_width=128):
+        self.backend = backend
+        self.thumbnail_width = thumbnail_width
+        self._queue = queue.Queue(maxsize=max_queue)
+
+    @staticmethod
+    def is_capture_key(key):
+        """
+        True jika key berbentuk key foto presensi (tidak bisa menunjuk ke file
+        lain di bawah folder static).
+        """
+        if '..' in key.split('/'):
+            return False
+        return bool(_CAPTURE_KEY.fullmatch(key) or _LEGACY_CAPTURE_KEY.fullmatch(key))
+
+    @staticmethod
+    def key_for(data, extension='jpg'):
+        digest = hashlib.sha256(data).hexdigest()
+        return f"captures/{digest[:2]}/{digest[2:4]}/{digest}.{extension}"
+
+    def thumbnail_key(self, key):
+        """
+        Key thumbnail untuk key foto, mis. captures/ab/cd/x.jpg ->
+        thumbnails/ab/cd/x_128.jpg (juga berlaku untuk nama file lama).
+        """
+        path = key.split('/', 1)[1] if key.startswith('captures/') else key
+        stem = os.path.splitext(path)[0]
+        return f"thumbnails/{stem}_{self.thumbnail_width}.jpg"
+
+    def _ensure_writer(self):
+        # Thread dibuat malas di proses yang memakainya (aman setelah fork)
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='capture-writer', daemon=True)
+                    self._thread.start()
+
+    def _write(self, key, data):
+        # Isi file ditentukan oleh hash-nya, jadi file yang sudah ada tidak perlu ditulis ulang
+        if not self.backend.exists(key):
+            self.backend.put(key, data)
+        try:
+            self._write_thumbnail(key, data)
+        except Exception:
+            # Thumbnail masih bisa dibuat belakangan saat pertama diminta
+            logger.exception("Gagal membuat thumbnail %s", key)
+
+    def _write_thumbnail(self, key, data):
+        thumbnail_key = self.thumbnail_key(key)
+        if self.backend.exists(thumbnail_key):
+            return None
+        thumbnail = make_thumbnail(data, width=self.thumbnail_width)
+        self.backend.put(thumbnail_key, thumbnail)
+        return thumbnail
+
+    def _write_logged(self, key, data):
+        # Presensi sudah ter-commit dengan key ini sebelum foto ditulis, jadi
+        # kegagalan dicatat beserta key-nya untuk ditelusuri/diunggah ulang
+        try:
+            self._write(key, data)
+        except Exception:
+            logger.exception("Gagal menyimpan foto presensi %s; presensi dengan image_path ini tidak punya foto", key)
+
+    def _run(self):
+        while True:
+            key, data = self._queue.get()
+            try:
+                self._write_logged(key, data)
+            finally:
+                self._queue.task_done()
+
+    def save(self, data, extension='jpg'):
+        """
+        Jadwalkan penyimpanan bytes foto dan langsung kembalikan key-nya.
+        Jika antrean penuh, file ditulis langsung agar bukti tidak hilang.
+        """
+        key = self.key_for(data, extension)
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait((key, data))
+        except queue.Full:
+            self._write_logged(key, data)
+        return key
+
+    def url(self, key):
+        return self.backend.url(key)
+
+    def thumbnail(self, key):
+        """
+        Bytes thumbnail untuk key foto; dibuat dari foto aslinya jika belum
+        ada. Melempar FileNotFoundError jika foto aslinya tidak ada dan
+        ValueError jika key bukan key foto presensi.
+        """
+        if not self.is_capture_key(key):
+            raise ValueError(f"Key capture tidak valid: {key}")
+        thumbnail_key = self.thumbnail_key(key)
+        if self.backend.exists(thumbnail_key):
+            return self.backend.get(thumbnail_key)
+        if not self.backend.exists(key):
+            raise FileNotFoundError(key)
+        return self._write_thumbnail(key, self.backend.get(key)) or self.backend.get(thumbnail_key)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def flush(self):
+        """
+        Tunggu sampai semua foto di antrean selesai ditulis.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+
+capture_store = CaptureStore()
+atexit.register(capture_store.flush)
+
+
+def create_backend(config, static_folder):
+    """
+    Buat backend penyimpanan sesuai konfigurasi aplikasi.
+    """
+    if config['CAPTURE_BACKEND'] == 's3':
+        return S3Backend(
+            bucket=config['CAPTURE_S3_BUCKET'],
+            prefix=config['CAPTURE_S3_PREFIX'],
+            public_url=config['CAPTURE_PUBLIC_URL'],
+            endpoint_url=config['CAPTURE_S3_ENDPOINT'],
+        )
+    return LocalFileSystemBackend(static_folder)
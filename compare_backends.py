@@ -0,0 +1,232 @@
+"""
+Bandingkan backend pengenalan wajah pada set foto berlabel yang sama.
+
+Set foto berupa folder dengan satu subfolder per orang:
+
+    dataset/
+        andi/1.jpg, andi/2.jpg, ...
+        budi/1.jpg, ...
+
+Setiap backend dijalankan di proses tersendiri (spawn) agar pemakaian
+memorinya tidak tercampur. Dilaporkan latensi per tahap, waktu muat model,
+puncak RSS, failure-to-enroll, serta FAR/FRR semua pasangan foto pada
+threshold bawaan backend dan pada titik EER. Contoh:
+
+    python compare_backends.py dataset/
+    python compare_backends.py dataset/ --backends mediapipe --max-far 0.001 --json hasil.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from benchmark_recognition import print_table, summarize
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+
+
+def read_labelled_images(root):
+    """
+    Daftar (label, path) dari subfolder per orang.
+    """
+    samples = []
+    for label in sorted(os.listdir(root)):
+        directory = os.path.join(root, label)
+        if not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                samples.append((label, os.path.join(directory, filename)))
+    return samples
+
+
+def _peak_rss_mb():
+    # ru_maxrss dalam KB di Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_backend(name, samples, max_width=640):
+    """
+    Dijalankan di proses tersendiri: muat backend, ekstrak embedding semua
+    foto, lalu hitung matriks skor semua pasangan.
+    """
+    from metrics import collect_stages
+    from recognition_backends import get_backend, embedding_from_image_bytes
+
+    baseline_mb = _peak_rss_mb()
+    started = time.perf_counter()
+    try:
+        backend = get_backend(name)
+        backend.warmup()
+    except ImportError as e:
+        return {'backend': name, 'error': f"tidak tersedia ({e})"}
+    load_seconds = time.perf_counter() - started
+    loaded_mb = _peak_rss_mb()
+
+    stages, embeddings, labels, failed = {}, [], [], 0
+    for label, path in samples:
+        with open(path, 'rb') as handle:
+            img_bytes = handle.read()
+        with collect_stages() as breakdown:
+            started = time.perf_counter()
+            try:
+                embedding, _ = embedding_from_image_bytes(img_bytes, name, max_width)
+            except ValueError:
+                embedding = None
+            elapsed = time.perf_counter() - started
+        for stage_name, seconds in breakdown.items():
+            stages.setdefault(stage_name, []).append(seconds)
+        stages.setdefault('total', []).append(elapsed)
+        if embedding is None:
+            failed += 1
+            continue
+        embeddings.append(embedding)
+        labels.append(label)
+
+    started = time.perf_counter()
+    scores = backend.score(embeddings, embeddings) if embeddings else np.empty((0, 0), dtype=np.float32)
+    score_seconds = time.perf_counter() - started
+    return {
+        'backend': name,
+        'dim': backend.dim,
+        'threshold': float(backend.threshold),
+        'load_seconds': load_seconds,
+        'model_mb': loaded_mb - baseline_mb,
+        'peak_rss_mb': _peak_rss_mb(),
+        'stages': stages,
+        'score_seconds': score_seconds,
+        'failed': failed,
+        'labels': labels,
+        'scores': scores,
+    }
+
+
+def pair_scores(scores, labels):
+    """
+    Pisahkan skor semua pasangan (i < j) menjadi genuine (label sama) dan
+    impostor (label berbeda).
+    """
+    labels = np.asarray(labels)
+    upper = np.triu_indices(len(labels), k=1)
+    same = labels[upper[0]] == labels[upper[1]]
+    values = scores[upper]
+    return values[same], values[~same]
+
+
+def error_rates(genuine, impostor, threshold):
+    """
+    (FAR, FRR) pada threshold: impostor yang lolos dan genuine yang ditolak.
+    """
+    far = float(np.mean(impostor >= threshold)) if len(impostor) else None
+    frr = float(np.mean(genuine < threshold)) if len(genuine) else None
+    return far, frr
+
+
+def equal_error_rate(genuine, impostor):
+    """
+    (EER, threshold) di titik FAR dan FRR paling dekat.
+    """
+    if not len(genuine) or not len(impostor):
+        return None, None
+    genuine, impostor = np.sort(genuine), np.sort(impostor)
+    thresholds = np.unique(np.concatenate([genuine, impostor]))
+    far = 1 - np.searchsorted(impostor, thresholds, side='left') / len(impostor)
+    frr = np.searchsorted(genuine, thresholds, side='left') / len(genuine)
+    best = int(np.argmin(np.abs(far - frr)))
+    return float((far[best] + frr[best]) / 2), float(thresholds[best])
+
+
+def _percent(value):
+    return '-' if value is None else f"{value * 100:.2f}%"
+
+
+def compare_backends(root, backends, max_width=640, max_far=0.001, max_frr=0.05, json_path=None):
+    """
+    Script command-line untuk membandingkan backend pada set foto berlabel
+    dan menyarankan backend tercepat yang memenuhi batas FAR/FRR.
+    """
+    samples = read_labelled_images(root)
+    if not samples:
+        raise SystemExit(f"Tidak ada foto berlabel di {root} (format: <folder>/<nama orang>/<foto>).")
+    print(f"--- Perbandingan Backend Pengenalan ({len(samples)} foto, "
+          f"{len({label for label, _ in samples})} orang) ---")
+
+    report = []
+    for name in backends:
+        # Satu proses baru per backend agar puncak memori terukur terpisah
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            result = pool.submit(run_backend, name, samples, max_width).result()
+        if 'error' in result:
+            print(f"\n[{name}] {result['error']}")
+            report.append({'backend': name, 'error': result['error']})
+            continue
+
+        genuine, impostor = pair_scores(result['scores'], result['labels'])
+        far, frr = error_rates(genuine, impostor, result['threshold'])
+        eer, eer_threshold = equal_error_rate(genuine, impostor)
+        total = summarize(result['stages']['total'])
+        entry = {
+            'backend': name,
+            'dim': result['dim'],
+            'images': len(samples),
+            'failed_to_enroll': result['failed'],
+            'load_seconds': round(result['load_seconds'], 3),
+            'model_mb': round(result['model_mb'], 1),
+            'peak_rss_mb': round(result['peak_rss_mb'], 1),
+            'latency_ms': {stage_name: {key: round(float(value), 3) for key, value in summarize(values).items()}
+                           for stage_name, values in result['stages'].items()},
+            'genuine_pairs': len(genuine),
+            'impostor_pairs': len(impostor),
+            'threshold': result['threshold'],
+            'far': far,
+            'frr': frr,
+            'eer': eer,
+            'eer_threshold': eer_threshold,
+        }
+        report.append(entry)
+
+        print_table(f"[{name}] latensi per foto (ms):",
+                    sorted(result['stages'].items(), key=lambda item: item[0] == 'total'))
+        print(f"  dimensi {result['dim']}, muat model {result['load_seconds']:.2f} detik, "
+              f"memori model ~{result['model_mb']:.0f} MB, puncak RSS {result['peak_rss_mb']:.0f} MB")
+        print(f"  gagal ekstrak {result['failed']}/{len(samples)} foto; "
+              f"{len(genuine)} pasangan genuine, {len(impostor)} pasangan impostor")
+        eer_text = '-' if eer is None else f"{_percent(eer)} pada threshold {eer_threshold:.3f}"
+        print(f"  threshold {result['threshold']:.3f}: FAR {_percent(far)}, FRR {_percent(frr)}; EER {eer_text}")
+        print(f"  p50 total {total['p50']:.1f} ms")
+
+    eligible = [entry for entry in report if 'error' not in entry and entry['far'] is not None
+                and entry['frr'] is not None and entry['far'] <= max_far and entry['frr'] <= max_frr]
+    print()
+    if eligible:
+        fastest = min(eligible, key=lambda entry: entry['latency_ms']['total']['p50'])
+        print(f"Saran: {fastest['backend']} (tercepat dengan FAR <= {_percent(max_far)} dan FRR <= {_percent(max_frr)})")
+    else:
+        print(f"Tidak ada backend yang memenuhi FAR <= {_percent(max_far)} dan FRR <= {_percent(max_frr)} "
+              "pada threshold bawaannya.")
+
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, indent=2)
+        print(f"Laporan JSON: {json_path}")
+    return report
+
+
+if __name__ == '__main__':
+    from recognition_backends import available_backends
+
+    parser = argparse.ArgumentParser(description="Bandingkan backend pengenalan wajah pada set foto berlabel.")
+    parser.add_argument('dataset', help="Folder dengan satu subfolder foto per orang")
+    parser.add_argument('--backends', nargs='+', default=available_backends(), choices=available_backends())
+    parser.add_argument('--max-width', type=int, default=640, help="Lebar maksimum foto sebelum ekstraksi")
+    parser.add_argument('--max-far', type=float, default=0.001, help="Batas FAR untuk saran backend")
+    parser.add_argument('--max-frr', type=float, default=0.05, help="Batas FRR untuk saran backend")
+    parser.add_argument('--json', help="Simpan laporan lengkap ke file JSON")
+    args = parser.parse_args()
+    compare_backends(args.dataset, args.backends, max_width=args.max_width, max_far=args.max_far,
+                     max_frr=args.max_frr, json_path=args.json)
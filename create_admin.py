@@ -8,7 +8,7 @@ def create_admin_user():
     """
     Script command-line untuk membuat pengguna admin baru.
     """
-    app = create_app()
+    app = create_app(warmup=False)
     with app.app_context():
         print("--- Membuat Akun Admin Baru ---")
         
@@ -0,0 +1,16 @@
+from models import db
+
+
+def dialect_insert(model):
+    """
+    INSERT khusus dialek yang mendukung ON CONFLICT (PostgreSQL dan SQLite).
+    Mengembalikan None untuk database lain.
+    """
+    dialect_name = db.session.get_bind().dialect.name
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(model)
@@ -0,0 +1,131 @@
+"""
+Format biner untuk menyimpan embedding wajah di kolom User.face_encoding.
+
+Setiap blob terdiri dari header 12 byte lalu data float32 little-endian:
+
+    offset  ukuran  isi
+    0       2       magic b'HE'
+    2       1       versi format (saat ini 1)
+    3       1       id backend (lihat BACKEND_NAMES)
+    4       1       kode dtype (1 = float32)
+    5       1       flag (bit 0 = vektor sudah dinormalisasi L2)
+    6       2       dimensi vektor
+    8       4       revisi embedding (0 = vektor mentah dari backend)
+
+Ukuran blob tetap untuk setiap backend, sehingga satu galeri dapat dibaca
+dengan np.frombuffer tanpa unpickle per baris. Blob lama hasil
+pickle.dumps(np.ndarray) masih bisa dibaca melalui load_embedding().
+"""
+import pickle
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+MAGIC = b'HE'
+FORMAT_VERSION = 1
+
+BACKEND_MEDIAPIPE = 1
+BACKEND_FACE_RECOGNITION = 2
+
+BACKEND_NAMES = {
+    BACKEND_MEDIAPIPE: 'mediapipe',
+    BACKEND_FACE_RECOGNITION: 'face_recognition',
+}
+
+# Dimensi bawaan tiap backend, dipakai untuk menebak asal blob pickle lama
+BACKEND_DIMS = {
+    BACKEND_MEDIAPIPE: 478 * 3,
+    BACKEND_FACE_RECOGNITION: 128,
+}
+
+DTYPE_FLOAT32 = 1
+_DTYPES = {DTYPE_FLOAT32: np.dtype('<f4')}
+
+FLAG_NORMALIZED = 0x01
+
+_HEADER = struct.Struct('<2sBBBBHI')
+HEADER_SIZE = _HEADER.size
+
+EmbeddingHeader = namedtuple('EmbeddingHeader', ['backend', 'dim', 'dtype', 'normalized', 'revision'])
+
+
+class EmbeddingFormatError(ValueError):
+    pass
+
+
+def encode_embedding(vector, backend, normalize=False, revision=0):
+    """
+    Ubah vektor embedding menjadi blob biner berheader.
+    """
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    flags = 0
+    if normalize:
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+        flags |= FLAG_NORMALIZED
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, backend, DTYPE_FLOAT32, flags, vector.shape[0], revision)
+    return header + vector.astype('<f4', copy=False).tobytes()
+
+
+def is_legacy(blob):
+    """
+    True jika blob masih berupa pickle dari format lama.
+    """
+    return bytes(blob[:2]) != MAGIC
+
+
+def decode_header(blob):
+    magic, version, backend, dtype, flags, dim, revision = _HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise EmbeddingFormatError('Bukan blob embedding berheader.')
+    if version != FORMAT_VERSION:
+        raise EmbeddingFormatError(f'Versi format embedding tidak dikenal: {version}')
+    if dtype not in _DTYPES:
+        raise EmbeddingFormatError(f'Kode dtype embedding tidak dikenal: {dtype}')
+    return EmbeddingHeader(backend, dim, dtype, bool(flags & FLAG_NORMALIZED), revision)
+
+
+def decode_embedding(blob):
+    """
+    Kembalikan (header, vektor). Vektor adalah view read-only di atas blob,
+    tanpa salinan.
+    """
+    header = decode_header(blob)
+    vector = np.frombuffer(blob, dtype=_DTYPES[header.dtype], count=header.dim, offset=HEADER_SIZE)
+    return header, vector
+
+
+def infer_backend(dim):
+    for backend, backend_dim in BACKEND_DIMS.items():
+        if backend_dim == dim:
+            return backend
+    return None
+
+
+def load_embedding(blob):
+    """
+    Baca blob dalam format baru maupun pickle lama. Untuk blob lama, header
+    disusun dari dimensi vektor. Mengembalikan (None, None) jika blob rusak.
+    """
+    if blob is None:
+        return None, None
+    try:
+        if not is_legacy(blob):
+            return decode_embedding(blob)
+        vector = np.asarray(pickle.loads(blob), dtype=np.float32).ravel()
+    except Exception:
+        return None, None
+    header = EmbeddingHeader(infer_backend(vector.shape[0]), vector.shape[0], DTYPE_FLOAT32, False, 0)
+    return header, vector
+
+
+def stack_payloads(blobs, dim):
+    """
+    Gabungkan payload beberapa blob berheader dengan dimensi sama menjadi
+    satu matriks (n, dim) kontigu dengan satu kali np.frombuffer.
+    """
+    payload_size = dim * 4
+    buffer = b''.join(memoryview(blob)[HEADER_SIZE:HEADER_SIZE + payload_size] for blob in blobs)
+    return np.frombuffer(buffer, dtype='<f4').reshape(len(blobs), dim)
@@ -0,0 +1,73 @@
+import csv
+import io
+
+from models import db, User, MataKuliah, course_enrollment
+from face_gallery import record_enrollment_change
+from attendance_summary import refresh_enrollment
+
+
+def is_enrolled(user_id, matakuliah_id):
+    """
+    True jika user terdaftar di mata kuliah, atau jika mata kuliah tersebut
+    belum punya daftar peserta sama sekali (semua mahasiswa boleh presensi).
+    """
+    has_students = db.session.query(course_enrollment.c.user_id).filter(
+        course_enrollment.c.matakuliah_id == matakuliah_id
+    ).first() is not None
+    if not has_students:
+        return True
+    return db.session.query(course_enrollment.c.user_id).filter(
+        course_enrollment.c.matakuliah_id == matakuliah_id,
+        course_enrollment.c.user_id == user_id
+    ).first() is not None
+
+
+def import_enrollment_csv(text, replace=False):
+    """
+    Impor peserta mata kuliah dari CSV dengan kolom `kode_mk` dan `name`
+    (nama mahasiswa). Jika replace=True, peserta lama dari mata kuliah yang
+    muncul di CSV dihapus terlebih dahulu.
+
+    Mengembalikan dict laporan: jumlah baris ditambahkan, dilewati, dan
+    daftar pesan error per baris.
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    missing_columns = {'kode_mk', 'name'} - set(reader.fieldnames or [])
+    if missing_columns:
+        return {'added': 0, 'skipped': 0, 'errors': [f"Kolom wajib tidak ada: {', '.join(sorted(missing_columns))}"]}
+
+    courses = {mk.kode_mk: mk.id for mk in MataKuliah.query.all()}
+    users = dict(db.session.query(User.name, User.id).filter(User.is_admin.is_(False)).all())
+
+    pairs, errors = set(), []
+    for line_number, row in enumerate(reader, start=2):
+        kode_mk = (row.get('kode_mk') or '').strip()
+        name = (row.get('name') or '').strip()
+        if kode_mk not in courses:
+            errors.append(f"Baris {line_number}: kode mata kuliah '{kode_mk}' tidak ditemukan.")
+        elif name not in users:
+            errors.append(f"Baris {line_number}: mahasiswa '{name}' tidak ditemukan.")
+        else:
+            pairs.add((users[name], courses[kode_mk]))
+
+    touched_courses = {matakuliah_id for _, matakuliah_id in pairs}
+    if replace and touched_courses:
+        db.session.execute(course_enrollment.delete().where(course_enrollment.c.matakuliah_id.in_(touched_courses)))
+        existing = set()
+    else:
+        existing = set(db.session.query(course_enrollment.c.user_id, course_enrollment.c.matakuliah_id).filter(
+            course_enrollment.c.matakuliah_id.in_(touched_courses)
+        ).all()) if touched_courses else set()
+
+    new_pairs = pairs - existing
+    if new_pairs:
+        db.session.execute(
+            course_enrollment.insert(),
+            [{'user_id': user_id, 'matakuliah_id': matakuliah_id} for user_id, matakuliah_id in new_pairs]
+        )
+    for matakuliah_id in touched_courses:
+        record_enrollment_change(matakuliah_id)
+        refresh_enrollment(matakuliah_id)
+    db.session.commit()
+
+    return {'added': len(new_pairs), 'skipped': len(pairs) - len(new_pairs), 'errors': errors}
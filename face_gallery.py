@@ -0,0 +1,749 @@
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from sqlalchemy import func, or_
+
+from models import db, FaceTemplate, FaceGalleryEvent, course_enrollment
+from embedding_codec import (BACKEND_MEDIAPIPE, BACKEND_DIMS, is_legacy, load_embedding, decode_header,
+                             decode_embedding, stack_payloads)
+from ann_index import IVFIndex
+from gallery_snapshot import GallerySnapshot, approximate_scores, quantize_rows, read_header, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Jumlah event terakhir yang dibaca ulang saat sinkronisasi. Di PostgreSQL
+# nilai sequence bisa ter-commit tidak berurutan, jadi event dengan ID sedikit
+# lebih kecil dari generasi terakhir masih mungkin baru terlihat belakangan.
+_RESYNC_OVERLAP = 32
+
+# Batas ukuran klausa IN saat memuat ulang user yang berubah
+_IN_CHUNK = 500
+
+# Selama galeri masih berupa salinan privat (delta belum masuk snapshot),
+# header snapshot dicek paling sering sekali per interval ini
+_SNAPSHOT_RECHECK_SECONDS = 5.0
+
+# Event yang sudah tercakup snapshot dihapus paling sering sekali per interval
+_PRUNE_INTERVAL_SECONDS = 60.0
+
+# Satu baris per template. Baris milik user yang sama selalu berdampingan
+# (diurutkan per user_id) sehingga skor per user cukup dihitung dengan
+# np.maximum.reduceat. `index` memetakan user_id -> (baris awal, baris akhir).
+# `revision` adalah versi basis landmark semua baris (0 = vektor mentah).
+GalleryState = namedtuple('GalleryState', ['matrix', 'user_ids', 'template_ids', 'index', 'labels', 'quantized',
+                                           'revision'])
+
+_EMPTY_STATE = GalleryState(np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=np.int64),
+                            np.empty(0, dtype=np.int64), {}, None, None, 0)
+
+
+def _normalize_rows(matrix):
+    """
+    Normalisasi L2 per baris sehingga cosine similarity cukup dihitung
+    dengan perkalian dot.
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    if matrix.size == 0:
+        return matrix
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _decode_rows(rows, backend, dim=None, revision=0):
+    """
+    Ubah baris (template_id, user_id, blob) menjadi (template_ids, user_ids,
+    matriks ter-normalisasi, revisi) untuk satu backend. Blob berformat baru
+    digabung dengan satu kali np.frombuffer; hanya blob pickle lama yang
+    di-decode satu per satu. Jika dim None, dipakai pasangan dimensi dan
+    revisi (versi basis landmark) yang paling banyak muncul; template
+    MediaPipe pada revisi lain diproyeksikan ke revisi tersebut (lihat
+    _convert_landmark_rows) agar tidak hilang dari galeri.
+    """
+    packed, loose = [], []
+    for template_id, user_id, blob in rows:
+        if blob is None:
+            continue
+        if not is_legacy(blob):
+            try:
+                header = decode_header(blob)
+            except Exception:
+                continue
+            if header.backend == backend:
+                packed.append(((template_id, user_id), header, blob))
+        else:
+            header, vector = load_embedding(blob)
+            if header is not None and header.backend == backend:
+                loose.append(((template_id, user_id), vector))
+
+    empty_ids = np.empty(0, dtype=np.int64)
+    if dim is None:
+        # Blob pickle lama selalu vektor mentah (revisi 0)
+        keys = [(header.dim, header.revision) for _, header, _ in packed] + \
+               [(vector.shape[0], 0) for _, vector in loose]
+        if not keys:
+            return empty_ids, empty_ids, np.empty((0, 0), dtype=np.float32), 0
+        values, counts = np.unique(np.asarray(keys), axis=0, return_counts=True)
+        dim, revision = (int(value) for value in values[np.argmax(counts)])
+
+    other_packed = [item for item in packed if item[1].dim != dim or item[1].revision != revision]
+    other_loose = [item for item in loose if item[1].shape[0] != dim or revision]
+    packed = [item for item in packed if item[1].dim == dim and item[1].revision == revision]
+    loose = [item for item in loose if item[1].shape[0] == dim and not revision]
+    if other_packed or other_loose:
+        # Mis. di tengah proyeksi ulang, atau template yang ditulis dengan basis lama
+        converted = _convert_landmark_rows(other_packed, other_loose, backend, dim, revision)
+        loose.extend(converted)
+        dropped = len(other_packed) + len(other_loose) - len(converted)
+        if dropped:
+            logger.warning("%d template dilewati karena dimensi/revisinya berbeda dari galeri (dim %d, revisi %d).",
+                           dropped, dim, revision)
+
+    blocks, keys = [], []
+    if packed:
+        block = stack_payloads([blob for _, _, blob in packed], dim)
+        if not all(header.normalized for _, header, _ in packed):
+            block = _normalize_rows(block)
+        blocks.append(block)
+        keys.extend(key for key, _, _ in packed)
+    if loose:
+        blocks.append(_normalize_rows(np.stack([vector for _, vector in loose])))
+        keys.extend(key for key, _ in loose)
+
+    if not blocks:
+        return empty_ids, empty_ids, np.empty((0, dim), dtype=np.float32), revision
+    matrix = blocks[0] if len(blocks) == 1 else np.vstack(blocks)
+    keys = np.asarray(keys, dtype=np.int64)
+    return keys[:, 0], keys[:, 1], matrix, revision
+
+
+def _convert_landmark_rows(packed, loose, backend, dim, revision):
+    """
+    Bawa template MediaPipe dari revisi lain ke (dim, revision) galeri:
+    vektor mentah diambil dari blob revisi 0 atau kolom landmarks, lalu
+    diproyeksikan dengan basis galeri. Mengembalikan list (key, vektor).
+    """
+    raw_dim = BACKEND_DIMS[BACKEND_MEDIAPIPE]
+    if backend != BACKEND_MEDIAPIPE or (not revision and dim != raw_dim):
+        return []
+
+    raw, missing = [], []
+    for key, header, blob in packed:
+        if not header.revision and header.dim == raw_dim:
+            raw.append((key, decode_embedding(blob)[1]))
+        else:
+            missing.append(key)
+    raw.extend((key, vector) for key, vector in loose if vector.shape[0] == raw_dim)
+
+    # Template yang sudah diproyeksikan menyimpan vektor mentahnya di kolom landmarks
+    keys_by_id = {key[0]: key for key in missing}
+    template_ids = list(keys_by_id)
+    for start in range(0, len(template_ids), _IN_CHUNK):
+        for template_id, blob in db.session.query(FaceTemplate.id, FaceTemplate.landmarks).filter(
+                FaceTemplate.id.in_(template_ids[start:start + _IN_CHUNK]), FaceTemplate.landmarks.isnot(None)):
+            header, vector = load_embedding(blob)
+            if header is not None and header.backend == BACKEND_MEDIAPIPE and vector.shape[0] == raw_dim:
+                raw.append((keys_by_id[template_id], vector))
+
+    if not raw or not revision:
+        return raw
+    from landmark_basis import load_basis
+    try:
+        basis = load_basis(revision)
+    except LookupError:
+        return []
+    if basis.dim != dim:
+        return []
+    projected = basis.project(np.stack([vector for _, vector in raw]))
+    return [(key, row) for (key, _), row in zip(raw, projected)]
+
+
+def _segment_starts(user_ids):
+    """
+    Posisi awal setiap kelompok user_id yang berdampingan.
+    """
+    if not len(user_ids):
+        return np.empty(0, dtype=np.int64)
+    return np.flatnonzero(np.concatenate([[True], user_ids[1:] != user_ids[:-1]]))
+
+
+def _segment_max(scores, user_ids):
+    """
+    Skor tertinggi per user untuk baris yang sudah dikelompokkan per user.
+    `scores` boleh 2 dimensi (probe x baris). Mengembalikan (user_ids, skor).
+    """
+    starts = _segment_starts(user_ids)
+    return user_ids[starts], np.maximum.reduceat(scores, starts, axis=-1)
+
+
+def record_face_change(user_id):
+    """
+    Catat bahwa data wajah seorang user berubah (didaftarkan, diubah, atau
+    dihapus). Event ikut ter-commit bersama transaksi pemanggil.
+    """
+    db.session.add(FaceGalleryEvent(user_id=user_id))
+
+
+def record_gallery_reset():
+    """
+    Catat bahwa seluruh galeri harus dimuat ulang di setiap worker, mis.
+    setelah semua embedding diproyeksikan ulang ke basis landmark baru.
+    """
+    db.session.add(FaceGalleryEvent())
+
+
+def record_enrollment_change(matakuliah_id):
+    """
+    Catat bahwa daftar peserta sebuah mata kuliah berubah, sehingga
+    sub-galeri mata kuliah tersebut dibangun ulang di setiap worker.
+    """
+    db.session.add(FaceGalleryEvent(matakuliah_id=matakuliah_id))
+
+
+class FaceGallery:
+    """
+    Galeri wajah yang tinggal di memori proses.
+
+    Menyimpan satu matriks float32 yang kontigu dan sudah dinormalisasi
+    berisi semua template wajah, beserta array user_id dan template_id yang
+    sejajar. Galeri dimuat sekali, lalu hanya delta dari tabel
+    face_gallery_event yang dibaca ulang ketika generasinya berubah.
+
+    Jika snapshot diaktifkan, matriks tersebut adalah memmap dari file
+    snapshot yang dibagi semua proses, dan pencarian memakai salinan int8
+    dengan re-rank float32 untuk kandidat teratas.
+    """
+
+    def __init__(self, backend=BACKEND_MEDIAPIPE):
+        self.backend = backend
+        self._lock = threading.RLock()
+        # Diganti sekaligus agar pembaca tidak pernah melihat matriks dan
+        # array ID yang tidak sejajar
+        self._state = _EMPTY_STATE
+        self.generation = 0
+        self.loaded = False
+
+        # Sub-galeri per mata kuliah: matakuliah_id -> (state, sub_galeri)
+        self._course_cache = {}
+
+        # Indeks ANN opsional; hanya dipakai jika galeri cukup besar
+        self.ann = None
+        self.ann_path = None
+        self.ann_min_size = 10000
+
+        # Snapshot memmap bersama; None berarti setiap proses memegang salinannya sendiri
+        self.snapshot_path = None
+        self.rerank = 16
+        self._snapshot_backed = False
+        self._snapshot_checked = 0.0
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_pending = None
+        self._snapshot_thread = None
+        self._pruned_at = 0.0
+
+    def __len__(self):
+        # Jumlah user yang punya template, bukan jumlah template
+        return len(self._state.index)
+
+    @property
+    def template_count(self):
+        return len(self._state.user_ids)
+
+    @property
+    def matrix(self):
+        return self._state.matrix
+
+    @property
+    def user_ids(self):
+        return self._state.user_ids
+
+    @property
+    def revision(self):
+        return self._state.revision
+
+    @property
+    def ann_labels(self):
+        return self._state.labels
+
+    @property
+    def dim(self):
+        return self._state.matrix.shape[1] if self.template_count else 0
+
+    def configure_backend(self, backend):
+        """
+        Pilih backend (id embedding_codec) yang embedding-nya dimuat. Jika
+        berubah, galeri dimuat ulang pada sync berikutnya.
+        """
+        if backend != self.backend:
+            self.backend = backend
+            self.loaded = False
+            self._course_cache.clear()
+
+    def configure_ann(self, path, nprobe=None, min_size=10000):
+        """
+        Aktifkan indeks ANN yang tersimpan di `path` (jika file-nya ada).
+        Indeks dibangun dengan build_ann_index.py, bukan saat worker start.
+        """
+        self.ann_path = path
+        self.ann_min_size = min_size
+        self.ann = IVFIndex.load(path, nprobe=nprobe) if path and os.path.exists(path) else None
+
+    def configure_snapshot(self, path, rerank=16):
+        """
+        Aktifkan snapshot galeri di `path`. `rerank` adalah jumlah user
+        hasil scoring int8 yang dihitung ulang secara exact.
+        """
+        self.snapshot_path = path or None
+        self.rerank = max(int(rerank), 1)
+
+    def _latest_generation(self):
+        return db.session.query(func.max(FaceGalleryEvent.id)).scalar() or 0
+
+    def _set_state(self, matrix, user_ids, template_ids, ann_labels=None, quantized=None, snapshot_backed=False,
+                   revision=0):
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        template_ids = np.asarray(template_ids, dtype=np.int64)
+        if len(user_ids) > 1 and np.any(user_ids[1:] < user_ids[:-1]):
+            # Kelompokkan baris per user (urutan template dalam user tetap)
+            order = np.argsort(user_ids, kind='stable')
+            matrix, user_ids, template_ids = matrix[order], user_ids[order], template_ids[order]
+            ann_labels = ann_labels[order] if ann_labels is not None else None
+            quantized = (quantized[0][order], quantized[1][order]) if quantized is not None else None
+
+        starts = _segment_starts(user_ids)
+        stops = np.append(starts[1:], len(user_ids))
+        index = {user_id: (start, stop) for user_id, start, stop in
+                 zip(user_ids[starts].tolist(), starts.tolist(), stops.tolist())}
+        self._state = GalleryState(np.ascontiguousarray(matrix, dtype=np.float32), user_ids, template_ids,
+                                   index, ann_labels, quantized, revision)
+        self._snapshot_backed = snapshot_backed
+
+    def _ann_usable(self, matrix):
+        return self.ann is not None and matrix.shape[1] == self.ann.dim
+
+    def _ann_labels(self, user_ids, template_ids, matrix):
+        if not self._ann_usable(matrix):
+            return None
+        # Label tersimpan dipakai ulang kecuali user-nya berubah setelah
+        # indeks disimpan
+        if self._reset_since(self.ann.generation):
+            # Semua vektor berubah (proyeksi ulang); centroid lama tidak berlaku
+            logger.warning("Indeks ANN %s dibuat sebelum galeri diproyeksi ulang; bangun ulang indeksnya.",
+                           self.ann_path)
+            return None
+        stale = [user_id for (user_id,) in db.session.query(FaceGalleryEvent.user_id).filter(
+            FaceGalleryEvent.id > self.ann.generation - _RESYNC_OVERLAP,
+            FaceGalleryEvent.user_id.isnot(None)
+        ).distinct()]
+        return self.ann.labels_for(template_ids, matrix, np.isin(user_ids, stale))
+
+    def _fresh_snapshot(self, generation):
+        """
+        Header snapshot jika file-nya sudah mencakup `generation`.
+        """
+        header = read_header(self.snapshot_path)
+        if header is None or header.backend != self.backend or header.generation < generation:
+            return None
+        return header
+
+    def _attach_snapshot(self, labels=None):
+        """
+        Ganti state dengan memmap snapshot. `labels` dipakai jika urutan
+        barisnya sama dengan state saat ini (snapshot ditulis proses ini).
+        """
+        snapshot = GallerySnapshot.open(self.snapshot_path)
+        if labels is None:
+            labels = self._ann_labels(snapshot.user_ids, snapshot.template_ids, snapshot.vectors)
+        self._set_state(snapshot.vectors, snapshot.user_ids, snapshot.template_ids, labels,
+                        (snapshot.quantized, snapshot.scales), snapshot_backed=True,
+                        revision=snapshot.header.revision)
+        self.generation = snapshot.generation
+        self.loaded = True
+
+    def reload(self):
+        """
+        Muat ulang seluruh galeri dari database.
+        """
+        with self._lock:
+            generation = self._latest_generation()
+            if self.snapshot_path and self._fresh_snapshot(generation):
+                self._attach_snapshot()
+                return
+
+            rows = db.session.query(FaceTemplate.id, FaceTemplate.user_id, FaceTemplate.encoding).all()
+
+            # Encoding dari backend lain tidak bisa dibandingkan dan dilewati
+            template_ids, user_ids, matrix, revision = _decode_rows(rows, self.backend)
+            self._set_state(matrix, user_ids, template_ids, revision=revision)
+            state = self._state
+            labels = self._ann_labels(state.user_ids, state.template_ids, state.matrix)
+
+            if self.snapshot_path:
+                write_snapshot(self.snapshot_path, state.template_ids, state.user_ids, state.matrix,
+                               generation, self.backend, state.revision)
+                if self._fresh_snapshot(generation):
+                    self._attach_snapshot(labels)
+                    return
+
+            self._set_state(state.matrix, state.user_ids, state.template_ids, labels, revision=state.revision)
+            self.generation = generation
+            self.loaded = True
+
+    @staticmethod
+    def _reset_since(generation, latest=None):
+        # Event tanpa user dan mata kuliah = seluruh galeri harus dimuat ulang
+        query = db.session.query(FaceGalleryEvent.id).filter(
+            FaceGalleryEvent.id > generation,
+            FaceGalleryEvent.user_id.is_(None),
+            FaceGalleryEvent.matakuliah_id.is_(None)
+        )
+        if latest is not None:
+            query = query.filter(FaceGalleryEvent.id <= latest)
+        return query.first() is not None
+
+    def sync(self):
+        """
+        Pastikan galeri sesuai dengan database. Hanya user yang tercatat
+        berubah sejak generasi terakhir yang dimuat ulang.
+        """
+        if not self.loaded:
+            self.reload()
+            return
+
+        if self.snapshot_path and not self._snapshot_backed:
+            self._recheck_snapshot()
+
+        latest = self._latest_generation()
+        if latest <= self.generation:
+            return
+
+        with self._lock:
+            if latest <= self.generation:
+                return
+
+            # Proses lain mungkin sudah menulis snapshot yang mencakup delta ini
+            if self.snapshot_path and self._fresh_snapshot(latest):
+                self._attach_snapshot()
+                return
+            if self.snapshot_path and self._fresh_snapshot(self.generation + 1):
+                # Event sebelum generasi snapshot bisa sudah dihapus (lihat
+                # prune_events); pasang snapshot dulu lalu baca delta sisanya
+                self._attach_snapshot()
+
+            if self._reset_since(self.generation, latest):
+                self._course_cache.clear()
+                self.reload()
+                return
+
+            events = db.session.query(FaceGalleryEvent.user_id, FaceGalleryEvent.matakuliah_id).filter(
+                FaceGalleryEvent.id > self.generation - _RESYNC_OVERLAP,
+                FaceGalleryEvent.id <= latest
+            ).distinct().all()
+            changed = {user_id for user_id, _ in events if user_id is not None}
+            for matakuliah_id in {mk_id for _, mk_id in events if mk_id is not None}:
+                self._course_cache.pop(matakuliah_id, None)
+
+            if not changed:
+                self.generation = latest
+                return
+
+            # Semua template user yang berubah dimuat ulang
+            rows = []
+            changed_list = list(changed)
+            for start in range(0, len(changed_list), _IN_CHUNK):
+                chunk = changed_list[start:start + _IN_CHUNK]
+                rows.extend(db.session.query(FaceTemplate.id, FaceTemplate.user_id, FaceTemplate.encoding).filter(
+                    FaceTemplate.user_id.in_(chunk)).all())
+
+            # Template dengan dimensi/revisi lain dari galeri saat ini dilewati
+            # sampai event reset memicu pemuatan ulang penuh
+            new_template_ids, new_user_ids, new_rows, revision = _decode_rows(
+                rows, self.backend, dim=self.dim or None, revision=self.revision)
+            self._apply_delta(changed, new_template_ids, new_user_ids, new_rows, revision)
+            self.generation = latest
+
+    def _recheck_snapshot(self):
+        """
+        Setelah delta diterapkan, galeri menjadi salinan privat. Kembali ke
+        memmap bersama begitu ada snapshot yang mencakup generasi ini.
+        """
+        now = time.monotonic()
+        if now - self._snapshot_checked < _SNAPSHOT_RECHECK_SECONDS:
+            return
+        self._snapshot_checked = now
+        with self._lock:
+            if not self._snapshot_backed and self._fresh_snapshot(self.generation):
+                self._attach_snapshot()
+
+    def _apply_delta(self, changed, new_template_ids, new_user_ids, new_rows, revision):
+        matrix, user_ids, template_ids, _, labels, quantized, _ = self._state
+        keep = ~np.isin(user_ids, list(changed))
+        if len(new_user_ids):
+            kept = matrix[keep] if len(user_ids) else np.empty((0, new_rows.shape[1]), dtype=np.float32)
+            matrix = np.vstack([kept, new_rows])
+            user_ids = np.concatenate([user_ids[keep], new_user_ids])
+            template_ids = np.concatenate([template_ids[keep], new_template_ids])
+            if labels is not None:
+                # Insert inkremental: baris baru cukup ditempatkan di centroid terdekat
+                labels = np.concatenate([labels[keep], self.ann.assign(new_rows)])
+            elif self._ann_usable(matrix):
+                labels = self.ann.labels_for(template_ids, matrix)
+            if quantized is not None:
+                new_quantized, new_scales = quantize_rows(new_rows)
+                if len(keep):
+                    new_quantized = np.vstack([quantized[0][keep], new_quantized])
+                    new_scales = np.concatenate([quantized[1][keep], new_scales])
+                quantized = (new_quantized, new_scales)
+        else:
+            matrix = matrix[keep]
+            user_ids = user_ids[keep]
+            template_ids = template_ids[keep]
+            labels = labels[keep] if labels is not None else None
+            if quantized is not None:
+                quantized = (quantized[0][keep], quantized[1][keep])
+        self._set_state(matrix, user_ids, template_ids, labels, quantized, revision=revision)
+
+    def save_snapshot(self):
+        """
+        Tulis snapshot dari isi galeri saat ini lalu pakai memmap-nya.
+        Dipanggil setelah commit pada alur pendaftaran wajah.
+        """
+        if not self.snapshot_path:
+            return False
+        self.sync()
+        written = self._write_snapshot(self._state, self.generation)
+        self.prune_events()
+        return written
+
+    def publish_snapshot(self):
+        """
+        Seperti save_snapshot, tetapi file ditulis oleh thread background
+        agar request pendaftaran tidak menunggu disk. Permintaan yang datang
+        saat penulisan berjalan digabung menjadi satu penulisan berikutnya.
+        """
+        if not self.snapshot_path:
+            return
+        self.sync()
+        with self._snapshot_lock:
+            self._snapshot_pending = (self._state, self.generation)
+            if self._snapshot_thread is None:
+                self._snapshot_thread = threading.Thread(
+                    target=self._run_snapshot_writer, name='gallery-snapshot', daemon=True)
+                self._snapshot_thread.start()
+        self.prune_events()
+
+    def prune_events(self, force=False):
+        """
+        Hapus event galeri yang sudah tercakup snapshot di disk, agar tabel
+        face_gallery_event tidak tumbuh tanpa batas. Proses yang tertinggal
+        dari snapshot memasangnya dulu sebelum membaca delta (lihat sync).
+        Event sejak indeks ANN disimpan dipertahankan untuk menandai label
+        yang basi, dan event reset galeri tidak pernah dihapus. Mengembalikan
+        jumlah event yang dihapus.
+        """
+        now = time.monotonic()
+        if not self.snapshot_path or (not force and now - self._pruned_at < _PRUNE_INTERVAL_SECONDS):
+            return 0
+        self._pruned_at = now
+        header = read_header(self.snapshot_path)
+        if header is None:
+            return 0
+        cutoff = header.generation
+        if self.ann is not None:
+            cutoff = min(cutoff, self.ann.generation)
+        cutoff -= _RESYNC_OVERLAP
+        if cutoff <= 0:
+            return 0
+        # Koneksi terpisah supaya transaksi sesi pemanggil tidak ikut di-commit
+        with db.engine.begin() as connection:
+            result = connection.execute(FaceGalleryEvent.__table__.delete().where(
+                FaceGalleryEvent.id <= cutoff,
+                or_(FaceGalleryEvent.user_id.isnot(None), FaceGalleryEvent.matakuliah_id.isnot(None))
+            ))
+        return result.rowcount
+
+    def _run_snapshot_writer(self):
+        while True:
+            with self._snapshot_lock:
+                pending, self._snapshot_pending = self._snapshot_pending, None
+                if pending is None:
+                    self._snapshot_thread = None
+                    return
+            try:
+                self._write_snapshot(*pending)
+            except Exception:
+                logger.exception("Gagal menulis snapshot galeri %s", self.snapshot_path)
+
+    def _write_snapshot(self, state, generation):
+        written = write_snapshot(self.snapshot_path, state.template_ids, state.user_ids, state.matrix,
+                                 generation, self.backend, state.revision)
+        with self._lock:
+            # Baris snapshot sejajar dengan state yang ditulis, jadi label ANN-nya tetap berlaku
+            if self._state is state and self._fresh_snapshot(generation):
+                self._attach_snapshot(state.labels)
+        return written
+
+    def build_ann(self, nlist=256, nprobe=8, iterations=10, recall_queries=200, noise=0.01, seed=0):
+        """
+        Latih ulang indeks ANN dari isi galeri saat ini, ukur recall-nya
+        terhadap pencarian exact, lalu simpan ke ann_path.
+        """
+        with self._lock:
+            state = self._state
+            index = IVFIndex.train(state.matrix, nlist=nlist, iterations=iterations, nprobe=nprobe, seed=seed)
+            labels = index.assign(state.matrix)
+            index.recall = index.measure_recall(state.matrix, labels, self.sample_queries(recall_queries, noise, seed))
+            if self.ann_path:
+                index.save(self.ann_path, state.template_ids, labels, self.generation)
+            self.ann = index
+            self._state = state._replace(labels=labels)
+            return index
+
+    def sample_queries(self, count, noise=0.01, seed=0):
+        """
+        Query sintetis untuk mengukur recall: baris galeri acak yang diberi
+        sedikit noise lalu dinormalisasi ulang.
+        """
+        matrix = self.matrix
+        if not len(matrix):
+            return np.empty((0, self.dim), dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        rows = matrix[rng.choice(len(matrix), min(count, len(matrix)), replace=False)]
+        return _normalize_rows(rows + rng.normal(scale=noise, size=rows.shape).astype(np.float32))
+
+    def ann_recall(self, queries, nprobe=None):
+        state = self._state
+        if state.labels is None:
+            return None
+        return self.ann.measure_recall(state.matrix, state.labels, queries, nprobe)
+
+    def templates_for(self, user_id):
+        """
+        Matriks template ter-normalisasi milik satu user, atau None jika
+        belum terdaftar.
+        """
+        state = self._state
+        rows = state.index.get(int(user_id))
+        return None if rows is None else state.matrix[rows[0]:rows[1]]
+
+    def score_user(self, embedding, user_id):
+        """
+        Cosine similarity tertinggi antara probe dan template-template satu
+        user (verifikasi 1:1), atau None jika user belum punya template.
+        """
+        templates = self.templates_for(user_id)
+        if templates is None or templates.shape[1] != embedding.shape[0]:
+            return None
+        probe = _normalize_rows(embedding.reshape(1, -1))[0]
+        return float(np.max(templates @ probe))
+
+    def course_gallery(self, matakuliah_id):
+        """
+        Sub-galeri (user_ids, matriks) berisi template peserta satu mata
+        kuliah, tetap dikelompokkan per user. Dibangun sekali lalu di-cache
+        sampai galeri atau daftar pesertanya berubah. Mengembalikan None jika
+        mata kuliah belum punya peserta, sehingga pencocokan kembali ke
+        seluruh galeri.
+        """
+        matakuliah_id = int(matakuliah_id)
+        state = self._state
+        cached = self._course_cache.get(matakuliah_id)
+        if cached is not None and cached[0] is state:
+            return cached[1]
+
+        enrolled = db.session.query(course_enrollment.c.user_id).filter(
+            course_enrollment.c.matakuliah_id == matakuliah_id
+        ).all()
+        if not enrolled:
+            sub_gallery = None
+        else:
+            ranges = sorted(state.index[user_id] for (user_id,) in enrolled if user_id in state.index)
+            rows = np.concatenate([np.arange(start, stop) for start, stop in ranges]) if ranges \
+                else np.empty(0, dtype=np.int64)
+            sub_gallery = (state.user_ids[rows], np.ascontiguousarray(state.matrix[rows]))
+
+        self._course_cache[matakuliah_id] = (state, sub_gallery)
+        return sub_gallery
+
+    def score_matrix(self, embeddings, matakuliah_id=None):
+        """
+        Similarity banyak probe sekaligus terhadap galeri (atau sub-galeri
+        mata kuliah) dalam satu perkalian matriks, diambil maksimum per user
+        di antara template-nya. Mengembalikan (user_ids, matriks probe x user).
+        """
+        state = self._state
+        user_ids, matrix = state.user_ids, state.matrix
+        sub_gallery = self.course_gallery(matakuliah_id) if matakuliah_id is not None else None
+        if sub_gallery is not None:
+            user_ids, matrix = sub_gallery
+        probes = _normalize_rows(np.stack(embeddings))
+        if not len(user_ids):
+            return user_ids, np.empty((len(probes), 0), dtype=np.float32)
+        return _segment_max(probes @ matrix.T, user_ids)
+
+    def top_k(self, embedding, k, matakuliah_id=None):
+        """
+        Kembalikan hingga k pasangan (user_id, similarity) terbaik, urut
+        menurun; similarity seorang user adalah yang tertinggi di antara
+        template-nya. Jika matakuliah_id diberikan, hanya peserta mata kuliah
+        itu yang dibandingkan. Untuk galeri besar yang punya indeks ANN, hanya
+        kelompok terdekat yang dibandingkan.
+        """
+        state = self._state
+        matrix, user_ids, quantized = state.matrix, state.user_ids, state.quantized
+        if not len(user_ids) or matrix.shape[1] != embedding.shape[0]:
+            return []
+
+        probe = _normalize_rows(embedding.reshape(1, -1))[0]
+        sub_gallery = self.course_gallery(matakuliah_id) if matakuliah_id is not None else None
+        if sub_gallery is not None:
+            user_ids, matrix = sub_gallery
+            rows, quantized = None, None
+        elif state.labels is not None and len(state.index) >= self.ann_min_size:
+            # Baris kandidat terurut naik, jadi tetap berkelompok per user
+            rows = self.ann.candidate_rows(state.labels, probe)
+        else:
+            rows = None
+        candidate_user_ids = user_ids if rows is None else user_ids[rows]
+        if not len(candidate_user_ids):
+            return []
+
+        if quantized is None:
+            similarities = (matrix if rows is None else matrix[rows]) @ probe
+            users, best = _segment_max(similarities, candidate_user_ids)
+        else:
+            # Scoring kasar dengan int8, lalu re-rank exact dari semua
+            # template float32 milik user-user teratas
+            approximate = approximate_scores(quantized[0], quantized[1], probe, rows)
+            users, approximate_best = _segment_max(approximate, candidate_user_ids)
+            shortlist = users[_top_positions(approximate_best, max(k, self.rerank))]
+            exact_rows = np.concatenate([np.arange(*state.index[user_id]) for user_id in shortlist.tolist()])
+            users, best = _segment_max(matrix[exact_rows] @ probe, user_ids[exact_rows])
+
+        order = _top_positions(best, k)
+        return [(int(users[i]), float(best[i])) for i in order]
+
+    def best_match(self, embedding, matakuliah_id=None):
+        """
+        Kembalikan (user_id, similarity) dengan cosine similarity tertinggi,
+        atau (None, None) bila galeri kosong atau dimensinya tidak cocok.
+        """
+        matches = self.top_k(embedding, 1, matakuliah_id)
+        return matches[0] if matches else (None, None)
+
+
+def _top_positions(scores, k):
+    """
+    Posisi k skor tertinggi, urut menurun.
+    """
+    k = min(k, len(scores))
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+# Satu galeri per proses worker
+face_gallery = FaceGallery()
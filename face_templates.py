@@ -0,0 +1,113 @@
+"""
+Template wajah per user (tabel face_template).
+
+Pendaftaran wajah menambah template baru alih-alih menimpa yang lama. Jumlah
+template per user dibatasi; jika melebihi batas, template tertua dibuang,
+kecuali template pendaftaran terbaru yang selalu dipertahankan.
+"""
+from sqlalchemy import exists, literal, select
+
+from models import db, User, FaceTemplate
+from face_gallery import face_gallery, record_face_change
+from embedding_codec import encode_embedding
+from landmark_basis import project_for_gallery
+
+TEMPLATE_SOURCE_ENROLL = 'enroll'
+TEMPLATE_SOURCE_ATTENDANCE = 'attendance'
+
+# Batas ukuran klausa IN saat menghapus template lama
+_IN_CHUNK = 500
+
+
+def encode_template(embedding, backend):
+    """
+    Blob (encoding, landmarks) untuk embedding mentah. Jika galeri memakai
+    basis landmark, encoding berisi hasil proyeksi dan landmarks berisi
+    vektor mentahnya (untuk proyeksi ulang); selain itu landmarks None.
+    """
+    raw = encode_embedding(embedding, backend, normalize=True)
+    if not face_gallery.revision:
+        return raw, None
+    projected = project_for_gallery(embedding)
+    return encode_embedding(projected, backend, normalize=True, revision=face_gallery.revision), raw
+
+
+def add_template(user_id, encoding, quality=None, source=TEMPLATE_SOURCE_ENROLL, limit=5, landmarks=None):
+    """
+    Tambah satu template untuk user lalu buang template berlebih. Template
+    pendaftaran juga disalin (dalam bentuk mentah) ke User.face_encoding.
+    Commit dilakukan pemanggil.
+    """
+    db.session.add(FaceTemplate(user_id=user_id, encoding=encoding, landmarks=landmarks, quality=quality,
+                                source=source))
+    if source == TEMPLATE_SOURCE_ENROLL:
+        user = db.session.get(User, user_id)
+        user.face_encoding = encoding if landmarks is None else landmarks
+    db.session.flush()
+    evict_templates([user_id], limit)
+    record_face_change(user_id)
+
+
+def evict_templates(user_ids, limit):
+    """
+    Hapus template tertua milik user-user ini sehingga masing-masing tersisa
+    paling banyak `limit`. Mengembalikan jumlah template yang dihapus.
+    """
+    limit = max(int(limit), 1)
+    stale = []
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), _IN_CHUNK):
+        rows = db.session.query(FaceTemplate.user_id, FaceTemplate.id, FaceTemplate.source).filter(
+            FaceTemplate.user_id.in_(user_ids[start:start + _IN_CHUNK])
+        ).order_by(FaceTemplate.user_id, FaceTemplate.created_at.desc(), FaceTemplate.id.desc()).all()
+
+        templates_by_user = {}
+        for user_id, template_id, source in rows:
+            templates_by_user.setdefault(user_id, []).append((template_id, source))
+        for templates in templates_by_user.values():
+            if len(templates) <= limit:
+                continue
+            keep = templates[:limit]
+            newest_enroll = next((item for item in templates if item[1] == TEMPLATE_SOURCE_ENROLL), None)
+            if newest_enroll is not None and newest_enroll not in keep:
+                keep = keep[:limit - 1] + [newest_enroll]
+            kept_ids = {template_id for template_id, _ in keep}
+            stale.extend(template_id for template_id, _ in templates if template_id not in kept_ids)
+
+    for start in range(0, len(stale), _IN_CHUNK):
+        db.session.query(FaceTemplate).filter(
+            FaceTemplate.id.in_(stale[start:start + _IN_CHUNK])
+        ).delete(synchronize_session=False)
+    return len(stale)
+
+
+def _users_without_templates():
+    users = User.__table__
+    templates = FaceTemplate.__table__
+    return select(users.c.id).where(
+        users.c.face_encoding.isnot(None),
+        ~exists().where(templates.c.user_id == users.c.id),
+    )
+
+
+def templates_need_backfill():
+    """
+    True jika ada user yang punya face_encoding tetapi belum punya template
+    (database lama, atau data yang ditulis langsung ke User.face_encoding).
+    """
+    return db.session.execute(_users_without_templates().limit(1)).first() is not None
+
+
+def backfill_templates():
+    """
+    Salin User.face_encoding menjadi template pertama untuk user yang belum
+    punya template. Mengembalikan jumlah template yang dibuat.
+    """
+    users = User.__table__
+    missing = _users_without_templates().subquery()
+    result = db.session.execute(FaceTemplate.__table__.insert().from_select(
+        ['user_id', 'encoding', 'source'],
+        select(users.c.id, users.c.face_encoding, literal(TEMPLATE_SOURCE_ENROLL)).where(users.c.id.in_(select(missing.c.id)))
+    ))
+    db.session.commit()
+    return result.rowcount
@@ -4,6 +4,55 @@ import pickle
 import os
 import cv2
 from models import User
+from embedding_codec import BACKEND_FACE_RECOGNITION, BACKEND_DIMS
+from recognition_backends import RecognitionBackend, CLASSROOM_CROP_SCALE, CLASSROOM_CROP_SIZE
+from metrics import stage
+
+
+class FaceRecognitionBackend(RecognitionBackend):
+    """
+    Backend dlib: deteksi HOG dan descriptor ResNet 128 dimensi dari
+    library face_recognition.
+    """
+    name = 'face_recognition'
+    backend_id = BACKEND_FACE_RECOGNITION
+    dim = BACKEND_DIMS[BACKEND_FACE_RECOGNITION]
+
+    def __init__(self):
+        super().__init__()
+        # face_recognition membandingkan jarak euclidean dengan toleransi;
+        # untuk vektor ter-normalisasi, jarak d setara cosine 1 - d^2 / 2
+        tolerance = float(os.environ.get('FACE_RECOGNITION_TOLERANCE', 0.5))
+        self.threshold = 1 - tolerance ** 2 / 2
+
+    def _locations(self, image_rgb):
+        with stage('detect'):
+            return face_recognition.face_locations(image_rgb, model="hog")
+
+    def detect(self, image_rgb):
+        height, width = image_rgb.shape[:2]
+        return [(left / width, top / height, (right - left) / width, (bottom - top) / height)
+                for top, right, bottom, left in self._locations(image_rgb)]
+
+    def embed(self, image_rgb):
+        # HOG tidak memberi skor deteksi, jadi kualitas tidak diisi
+        face_locations = self._locations(image_rgb)
+        if len(face_locations) != 1:
+            return None, len(face_locations), None
+        with stage('encode'):
+            encoding = face_recognition.face_encodings(image_rgb, known_face_locations=face_locations)[0]
+        return np.asarray(encoding, dtype=np.float32), 1, None
+
+    def embed_crop(self, crop):
+        # Wajah selalu berada di tengah potongan crop_face, jadi HOG tidak
+        # perlu dijalankan lagi (dan tidak salah memilih wajah tetangga)
+        side = CLASSROOM_CROP_SIZE / CLASSROOM_CROP_SCALE
+        top = left = int(round((CLASSROOM_CROP_SIZE - side) / 2))
+        bottom = right = int(round((CLASSROOM_CROP_SIZE + side) / 2))
+        with stage('encode'):
+            encodings = face_recognition.face_encodings(crop, known_face_locations=[(top, right, bottom, left)])
+        return np.asarray(encodings[0], dtype=np.float32) if encodings else None
+
 
 def optimize_image_for_recognition(image_rgb, max_width=640):
     """
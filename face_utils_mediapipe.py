@@ -1,49 +1,269 @@
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager, ExitStack
 import cv2
 import numpy as np
-import pickle
 import mediapipe as mp
-from sklearn.metrics.pairwise import cosine_similarity
-from models import User
+from scipy.optimize import linear_sum_assignment
+from face_gallery import face_gallery
+from image_io import decode_image
+from metrics import stage, record_match_score
+from embedding_codec import BACKEND_MEDIAPIPE, BACKEND_DIMS
+from landmark_basis import project_for_gallery, gallery_threshold
+from recognition_backends import RecognitionBackend
 
 # Initialize MediaPipe Face Detection dan Face Mesh
 mp_face_detection = mp.solutions.face_detection
 mp_face_mesh = mp.solutions.face_mesh
 
+logger = logging.getLogger(__name__)
+
+
+class FaceModelPool:
+    """
+    Pool berukuran tetap berisi pasangan FaceDetection + FaceMesh yang hidup
+    lama. Graph MediaPipe tidak thread-safe, jadi setiap pasangan hanya
+    dipinjam oleh satu thread dalam satu waktu.
+
+    detection_model 0 = model jarak dekat (selfie, < 2m), 1 = model jarak
+    jauh (hingga ~5m) untuk foto satu kelas. mesh=False membuat pool berisi
+    detector saja (face_mesh None).
+    """
+
+    def __init__(self, size=2, detection_model=0, mesh=True):
+        self.size = size
+        self.detection_model = detection_model
+        self.mesh = mesh
+        self.ready = threading.Event()
+        self.warmup_seconds = None
+        # Pesan error warmup terakhir; ditampilkan /health daripada "warming up" selamanya
+        self.warmup_error = None
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def configure(self, size):
+        with self._lock:
+            self.size = max(int(size), 1)
+
+    def _create_models(self):
+        face_detection = mp_face_detection.FaceDetection(model_selection=self.detection_model,
+                                                         min_detection_confidence=0.5)
+        if not self.mesh:
+            return face_detection, None
+        face_mesh = mp_face_mesh.FaceMesh(static_image_mode=True, max_num_faces=1,
+                                          refine_landmarks=True, min_detection_confidence=0.5)
+        return face_detection, face_mesh
+
+    @contextmanager
+    def acquire(self):
+        """
+        Pinjam satu pasangan (face_detection, face_mesh). Instance baru hanya
+        dibuat selama ukuran pool belum tercapai; selebihnya menunggu.
+        """
+        try:
+            models = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    models = self._create_models()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                models = self._idle.get()
+        try:
+            yield models
+        finally:
+            self._idle.put(models)
+
+    def warmup(self):
+        """
+        Buat semua instance dan jalankan satu frame kosong melalui setiap
+        graph sehingga model TFLite sudah termuat sebelum request pertama.
+        Jika gagal, error dicatat ke log dan warmup_error lalu dilempar ulang.
+        """
+        started = time.perf_counter()
+        dummy = np.zeros((480, 640, 3), dtype=np.uint8)
+        try:
+            with ExitStack() as stack:
+                for _ in range(self.size):
+                    face_detection, face_mesh = stack.enter_context(self.acquire())
+                    face_detection.process(dummy)
+                    if face_mesh is not None:
+                        face_mesh.process(dummy)
+        except Exception as e:
+            self.warmup_error = f"{type(e).__name__}: {e}"
+            logger.exception("Warmup model MediaPipe gagal")
+            raise
+        self.warmup_error = None
+        self.warmup_seconds = time.perf_counter() - started
+        self.ready.set()
+
+    def start_warmup(self):
+        """
+        Jalankan warmup di background thread; `ready` ter-set saat selesai.
+        """
+        thread = threading.Thread(target=_quiet_warmup, args=(self,), name='face-model-warmup', daemon=True)
+        thread.start()
+        return thread
+
+
+def _quiet_warmup(target):
+    # Untuk background thread: kegagalan sudah dicatat oleh warmup() sendiri
+    try:
+        target.warmup()
+    except Exception:
+        pass
+
+
+face_model_pool = FaceModelPool()
+# Mesh untuk potongan wajah mode kelas dan kiosk; instance dibuat saat pertama dipakai
+classroom_model_pool = FaceModelPool(size=1, detection_model=1)
+# Detector jarak jauh saja untuk foto kelas dan setiap frame kiosk, terpisah
+# dari mesh di atas agar kiosk tidak mengantre di belakang foto kelas
+detection_model_pool = FaceModelPool(size=2, detection_model=1, mesh=False)
+
+# Threshold untuk kecocokan (adjust sesuai kebutuhan)
+MATCH_THRESHOLD = 0.85
+
+# Skor pengganti pasangan di bawah threshold pada penugasan mode kelas
+_REJECTED_SCORE = -1e6
+
+
 def extract_face_embedding_mediapipe(image_rgb):
     """
     Extract face embedding menggunakan MediaPipe (alternative untuk face_recognition)
     """
-    with mp_face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5) as face_detection:
-        with mp_face_mesh.FaceMesh(static_image_mode=True, max_num_faces=1, 
-                                   refine_landmarks=True, min_detection_confidence=0.5) as face_mesh:
-            
-            # Convert BGR to RGB if needed
-            if len(image_rgb.shape) == 3:
-                rgb_image = image_rgb
-            else:
-                rgb_image = cv2.cvtColor(image_rgb, cv2.COLOR_BGR2RGB)
-            
-            # Detect faces
+    embedding, _ = extract_face_embedding_with_count(image_rgb)
+    return embedding
+
+def extract_face_embedding_with_count(image_rgb):
+    """
+    Seperti extract_face_embedding_mediapipe, tetapi juga mengembalikan jumlah
+    wajah yang terdeteksi agar pemanggil bisa membedakan foto tanpa wajah dan
+    foto dengan banyak wajah.
+    """
+    embedding, face_count, _ = extract_face_embedding_with_quality(image_rgb)
+    return embedding, face_count
+
+def extract_face_embedding_with_quality(image_rgb):
+    """
+    Seperti extract_face_embedding_with_count, ditambah skor deteksi wajah
+    (0-1) sebagai ukuran kualitas foto untuk template wajah.
+    """
+    with face_model_pool.acquire() as (face_detection, face_mesh):
+        # Convert BGR to RGB if needed
+        if len(image_rgb.shape) == 3:
+            rgb_image = image_rgb
+        else:
+            rgb_image = cv2.cvtColor(image_rgb, cv2.COLOR_BGR2RGB)
+        
+        # Detect faces
+        with stage('detect'):
             results = face_detection.process(rgb_image)
-            
-            if not results.detections or len(results.detections) != 1:
-                return None
-            
-            # Get face mesh landmarks
+        face_count = len(results.detections) if results.detections else 0
+        
+        if face_count != 1:
+            return None, face_count, None
+        quality = float(results.detections[0].score[0])
+        
+        # Get face mesh landmarks
+        with stage('mesh'):
             mesh_results = face_mesh.process(rgb_image)
-            
-            if not mesh_results.multi_face_landmarks:
-                return None
-            
-            # Extract landmarks sebagai feature vector
-            landmarks = mesh_results.multi_face_landmarks[0]
-            
-            # Convert landmarks ke array numpy
-            face_embedding = []
-            for landmark in landmarks.landmark:
-                face_embedding.extend([landmark.x, landmark.y, landmark.z])
-            
-            return np.array(face_embedding, dtype=np.float32)
+        
+        if not mesh_results.multi_face_landmarks:
+            return None, face_count, quality
+        
+        # Extract landmarks sebagai feature vector
+        landmarks = mesh_results.multi_face_landmarks[0]
+        
+        # Convert landmarks ke array numpy
+        face_embedding = []
+        for landmark in landmarks.landmark:
+            face_embedding.extend([landmark.x, landmark.y, landmark.z])
+        
+        return np.array(face_embedding, dtype=np.float32), face_count, quality
+
+
+class MediaPipeBackend(RecognitionBackend):
+    """
+    Backend MediaPipe: 478 landmark Face Mesh (x, y, z) sebagai embedding,
+    dengan skor deteksi sebagai kualitas.
+    """
+    name = 'mediapipe'
+    backend_id = BACKEND_MEDIAPIPE
+    dim = BACKEND_DIMS[BACKEND_MEDIAPIPE]
+    threshold = MATCH_THRESHOLD
+
+    def __init__(self):
+        super().__init__()
+        # Status warmup mengikuti pool model yang dipakai bersama
+        self.ready = face_model_pool.ready
+
+    def detect(self, image_rgb):
+        with face_model_pool.acquire() as (face_detection, _):
+            with stage('detect'):
+                results = face_detection.process(image_rgb)
+        return _relative_boxes(results)
+
+    def embed(self, image_rgb):
+        return extract_face_embedding_with_quality(image_rgb)
+
+    def detect_faces(self, image_rgb):
+        return detect_faces(image_rgb)
+
+    def embed_crop(self, crop):
+        return embedding_from_face_crop(crop)
+
+    @property
+    def warmup_error(self):
+        return face_model_pool.warmup_error
+
+    def warmup(self):
+        face_model_pool.warmup()
+        self.warmup_seconds = face_model_pool.warmup_seconds
+
+
+def _relative_boxes(results):
+    boxes = []
+    for detection in results.detections or []:
+        box = detection.location_data.relative_bounding_box
+        boxes.append((box.xmin, box.ymin, box.width, box.height))
+    return boxes
+
+
+def detect_faces(image_rgb):
+    """
+    Kotak relatif (xmin, ymin, width, height) semua wajah di frame, memakai
+    detector jarak jauh saja (tanpa mesh) sehingga murah untuk setiap frame.
+    """
+    with detection_model_pool.acquire() as (face_detection, _):
+        with stage('detect'):
+            results = face_detection.process(image_rgb)
+    return _relative_boxes(results)
+
+
+def embedding_from_face_crop(crop):
+    """
+    Embedding landmark dari potongan wajah hasil crop_face, atau None jika
+    landmark tidak terbaca. Fungsi top-level agar bisa dijalankan di executor.
+    """
+    with classroom_model_pool.acquire() as (_, face_mesh):
+        with stage('mesh'):
+            mesh_results = face_mesh.process(crop)
+    if not mesh_results.multi_face_landmarks:
+        return None
+    landmarks = mesh_results.multi_face_landmarks[0].landmark
+    return np.array([[lm.x, lm.y, lm.z] for lm in landmarks], dtype=np.float32).ravel()
+
 
 def optimize_image_for_recognition(image_rgb, max_width=640):
     """
@@ -62,62 +282,144 @@ def generate_encoding_from_image(image_rgb):
     Generate encoding menggunakan MediaPipe (replacement untuk face_recognition)
     """
     # Optimasi ukuran gambar
-    optimized_image = optimize_image_for_recognition(image_rgb)
+    with stage('resize'):
+        optimized_image = optimize_image_for_recognition(image_rgb)
     
     # Extract embedding
     embedding = extract_face_embedding_mediapipe(optimized_image)
     
     return embedding
 
-def find_match_in_db(unknown_image_rgb):
+def encoding_from_image_bytes(img_bytes):
     """
-    Mencari kecocokan wajah menggunakan MediaPipe dan cosine similarity
+    Decode bytes gambar (JPEG/PNG) lalu hasilkan encoding wajah. Dibuat
+    sebagai fungsi top-level agar bisa dijalankan di proses worker.
+    Melempar ValueError jika bytes bukan gambar yang valid.
+    """
+    # JPEG besar langsung di-decode pada resolusi yang sudah dikecilkan
+    with stage('decode'):
+        frame = decode_image(img_bytes, target_width=640)
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    return generate_encoding_from_image(rgb_frame)
+
+def find_match_in_db(unknown_image_rgb, matakuliah_id=None):
+    """
+    Mencari kecocokan wajah menggunakan MediaPipe dan cosine similarity.
+    Jika matakuliah_id diberikan, hanya peserta mata kuliah itu yang dicocokkan.
+    """
+    return match_embedding_in_db(generate_encoding_from_image(unknown_image_rgb), matakuliah_id)
+
+
+def match_embedding_in_db(unknown_embedding, matakuliah_id=None, threshold=MATCH_THRESHOLD):
+    """
+    Pencocokan 1:N untuk embedding yang sudah diekstrak.
     """
-    # Optimasi ukuran gambar
-    optimized_image = optimize_image_for_recognition(unknown_image_rgb)
-    
-    # Extract embedding dari gambar unknown
-    unknown_embedding = extract_face_embedding_mediapipe(optimized_image)
-    
     if unknown_embedding is None:
         return None, "Tidak ada wajah terdeteksi di kamera."
     
-    # Ambil semua pengguna yang sudah punya data encoding wajah
-    users_with_faces = User.query.filter(User.face_encoding.isnot(None)).all()
-    if not users_with_faces:
+    # Galeri wajah di memori; hanya delta yang dimuat ulang dari database
+    with stage('gallery_sync'):
+        face_gallery.sync()
+    if not len(face_gallery):
         return None, "Database wajah kosong. Tidak ada referensi untuk perbandingan."
+    unknown_embedding = project_for_gallery(unknown_embedding)
+    threshold = gallery_threshold(threshold)
 
-    # Siapkan data untuk perbandingan
-    known_embeddings = []
-    known_user_ids = []
-    
-    for user in users_with_faces:
-        try:
-            user_embedding = pickle.loads(user.face_encoding)
-            known_embeddings.append(user_embedding)
-            known_user_ids.append(user.id)
-        except:
-            continue
-    
-    if not known_embeddings:
+    with stage('match'):
+        matched_user_id, max_similarity = face_gallery.best_match(unknown_embedding, matakuliah_id)
+    record_match_score('identify', max_similarity)
+    if matched_user_id is None:
         return None, "Tidak ada data encoding valid di database."
     
-    # Reshape untuk cosine similarity
-    unknown_embedding = unknown_embedding.reshape(1, -1)
-    known_embeddings = np.array(known_embeddings)
+    if max_similarity >= threshold:
+        return matched_user_id, f"Wajah dikenali dengan confidence: {max_similarity:.2f}"
     
-    # Hitung cosine similarity
-    similarities = cosine_similarity(unknown_embedding, known_embeddings)[0]
+    return None, f"Wajah tidak dikenali. Max similarity: {max_similarity:.2f}"
+
+
+def match_classroom_embeddings(embeddings, matakuliah_id=None, threshold=MATCH_THRESHOLD, groups=None):
+    """
+    Cocokkan semua wajah dari foto kelas sekaligus: satu perkalian matriks
+    probe x galeri mata kuliah, lalu penugasan satu-satu (Hungarian) agar
+    tidak ada mahasiswa yang dipasangkan ke dua wajah dalam satu foto.
+    Pasangan di bawah threshold diblokir sebelum penugasan, sehingga wajah
+    asing tidak bisa menggeser pasangan yang benar. groups (mis. indeks foto
+    per embedding) memisahkan penugasan per foto; mahasiswa yang muncul di
+    beberapa foto memakai skor terbaiknya. Mengembalikan list (indeks probe,
+    user_id, similarity), satu per user.
+    """
+    with stage('gallery_sync'):
+        face_gallery.sync()
+    embeddings = [project_for_gallery(embedding) for embedding in embeddings]
+    threshold = gallery_threshold(threshold)
+    probes = [index for index, embedding in enumerate(embeddings)
+              if embedding is not None and embedding.shape[0] == face_gallery.dim]
+    if not probes:
+        return []
+
+    with stage('match'):
+        user_ids, similarities = face_gallery.score_matrix([embeddings[index] for index in probes], matakuliah_id)
+        if not len(user_ids):
+            return []
+        allowed = similarities >= threshold
+        masked = np.where(allowed, similarities, _REJECTED_SCORE)
+        groups = np.zeros(len(probes), dtype=int) if groups is None else np.asarray(groups)[probes]
+        best = {}
+        for group in np.unique(groups):
+            members = np.flatnonzero(groups == group)
+            rows, columns = linear_sum_assignment(masked[members], maximize=True)
+            for row, column in zip(members[rows], columns):
+                if not allowed[row, column]:
+                    continue
+                user_id, similarity = int(user_ids[column]), float(similarities[row, column])
+                if user_id not in best or similarity > best[user_id][2]:
+                    best[user_id] = (probes[row], user_id, similarity)
+
+    for similarity in similarities.max(axis=1):
+        record_match_score('classroom', float(similarity))
+    return list(best.values())
+
+
+def verify_user_in_db(unknown_image_rgb, claimed_user_id, impostor_top_k=0, matakuliah_id=None):
+    """
+    Verifikasi 1:1: bandingkan wajah hanya dengan template milik user yang
+    sedang login, sehingga biaya pencocokan tidak bergantung pada jumlah
+    user di galeri. Jika impostor_top_k > 0, dijalankan juga pengecekan
+    top-k untuk mendeteksi wajah yang lebih mirip user lain; pengecekan ini
+    memindai galeri mata kuliah (atau seluruh galeri/kandidat ANN), jadi
+    biayanya kembali bergantung pada jumlah template.
+    """
+    return verify_embedding_in_db(
+        generate_encoding_from_image(unknown_image_rgb), claimed_user_id, impostor_top_k, matakuliah_id
+    )
+
+
+def verify_embedding_in_db(unknown_embedding, claimed_user_id, impostor_top_k=0, matakuliah_id=None,
+                           threshold=MATCH_THRESHOLD):
+    """
+    Verifikasi 1:1 untuk embedding yang sudah diekstrak.
+    """
+    if unknown_embedding is None:
+        return None, "Tidak ada wajah terdeteksi di kamera."
     
-    # Threshold untuk kecocokan (adjust sesuai kebutuhan)
-    threshold = 0.85
+    with stage('gallery_sync'):
+        face_gallery.sync()
+    unknown_embedding = project_for_gallery(unknown_embedding)
+    threshold = gallery_threshold(threshold)
+    with stage('verify'):
+        similarity = face_gallery.score_user(unknown_embedding, claimed_user_id)
+    if similarity is None:
+        return None, "Data wajah Anda belum terdaftar. Silakan daftarkan wajah terlebih dahulu."
+    record_match_score('verify', similarity)
     
-    # Cari similarity tertinggi
-    max_similarity_idx = np.argmax(similarities)
-    max_similarity = similarities[max_similarity_idx]
+    if impostor_top_k:
+        with stage('impostor_check'):
+            candidates = face_gallery.top_k(unknown_embedding, impostor_top_k, matakuliah_id)
+        for user_id, other_similarity in candidates:
+            if user_id != claimed_user_id and other_similarity > similarity and other_similarity >= threshold:
+                return user_id, f"Wajah lebih mirip user lain. Max similarity: {other_similarity:.2f}"
     
-    if max_similarity >= threshold:
-        matched_user_id = known_user_ids[max_similarity_idx]
-        return matched_user_id, f"Wajah dikenali dengan confidence: {max_similarity:.2f}"
+    if similarity >= threshold:
+        return claimed_user_id, f"Wajah dikenali dengan confidence: {similarity:.2f}"
     
-    return None, f"Wajah tidak dikenali. Max similarity: {max_similarity:.2f}"
+    return None, f"Wajah tidak dikenali. Similarity: {similarity:.2f}"
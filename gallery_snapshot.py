@@ -0,0 +1,181 @@
+"""
+Snapshot galeri wajah dalam satu file yang di-memory-map oleh semua proses.
+
+Setiap worker gunicorn yang memuat galeri sendiri menyimpan salinan matriks
+embedding-nya (20 ribu mahasiswa x 1434 float32 ~ 115MB per proses). Dengan
+snapshot, worker cukup np.memmap file yang sama secara read-only sehingga
+hanya ada satu salinan di page cache sistem operasi.
+
+Susunan file (little-endian, setiap bagian diawali pada kelipatan 64 byte):
+
+    header          64 byte (lihat _HEADER)
+    template_ids    int64[count]
+    user_ids        int64[count]        baris dikelompokkan per user
+    scales          float32[count]      skala kuantisasi per baris
+    quantized       int8[count, dim]    dipakai untuk scoring kasar
+    vectors         float32[count, dim] vektor ter-normalisasi untuk re-rank
+
+Pencarian memindai bagian int8 (seperempat ukuran float32), lalu hanya
+beberapa kandidat teratas yang dihitung ulang secara exact dari bagian
+float32, sehingga halaman float32 yang jarang disentuh tidak perlu berada
+di memori.
+"""
+import os
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+MAGIC = b'HGSN'
+FORMAT_VERSION = 3
+
+_HEADER = struct.Struct('<4sBBHIQQI')
+_ALIGN = 64
+
+# Jumlah baris int8 yang dikonversi sekaligus saat scoring agar memori
+# sementara tetap kecil (2048 x 1434 float32 ~ 12MB)
+_SCORE_BLOCK = 2048
+
+# revision = versi basis landmark semua baris (lihat landmark_basis.py)
+SnapshotHeader = namedtuple('SnapshotHeader', ['backend', 'dim', 'count', 'generation', 'revision'])
+
+
+class SnapshotFormatError(ValueError):
+    pass
+
+
+def _aligned(offset):
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+def _layout(dim, count):
+    """
+    Offset setiap bagian di dalam file.
+    """
+    template_ids_offset = _aligned(_HEADER.size)
+    ids_offset = _aligned(template_ids_offset + 8 * count)
+    scales_offset = _aligned(ids_offset + 8 * count)
+    quantized_offset = _aligned(scales_offset + 4 * count)
+    vectors_offset = _aligned(quantized_offset + count * dim)
+    return (template_ids_offset, ids_offset, scales_offset, quantized_offset, vectors_offset,
+            vectors_offset + 4 * count * dim)
+
+
+def quantize_rows(matrix):
+    """
+    Kuantisasi int8 simetris per baris: baris ~ quantized * scale.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if not len(matrix):
+        return np.empty(matrix.shape, dtype=np.int8), np.empty(0, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def approximate_scores(quantized, scales, probe, rows=None):
+    """
+    Perkiraan cosine similarity dari matriks int8, dihitung per blok.
+    """
+    count = len(rows) if rows is not None else len(quantized)
+    scores = np.empty(count, dtype=np.float32)
+    for start in range(0, count, _SCORE_BLOCK):
+        block_rows = slice(start, start + _SCORE_BLOCK) if rows is None else rows[start:start + _SCORE_BLOCK]
+        block = quantized[block_rows].astype(np.float32)
+        scores[start:start + _SCORE_BLOCK] = (block @ probe) * scales[block_rows]
+    return scores
+
+
+def read_header(path):
+    """
+    Baca header snapshot, atau None jika file tidak ada atau rusak.
+    """
+    try:
+        with open(path, 'rb') as handle:
+            data = handle.read(_HEADER.size)
+    except OSError:
+        return None
+    if len(data) < _HEADER.size:
+        return None
+    magic, version, backend, _, dim, count, generation, revision = _HEADER.unpack(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        return None
+    return SnapshotHeader(backend, dim, count, generation, revision)
+
+
+def write_snapshot(path, template_ids, user_ids, matrix, generation, backend, revision=0):
+    """
+    Tulis snapshot secara atomik (file sementara lalu os.replace). Snapshot
+    yang sudah ada dengan generasi lebih baru tidak ditimpa. Mengembalikan
+    True jika file ditulis.
+    """
+    existing = read_header(path)
+    if existing is not None and existing.generation > generation:
+        return False
+
+    matrix = np.asarray(matrix, dtype=np.float32)
+    count = len(user_ids)
+    dim = matrix.shape[1] if matrix.ndim == 2 else 0
+    quantized, scales = quantize_rows(matrix)
+    template_ids_offset, ids_offset, scales_offset, quantized_offset, vectors_offset, size = _layout(dim, count)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as handle:
+        handle.write(_HEADER.pack(MAGIC, FORMAT_VERSION, backend, 0, dim, count, generation, revision))
+        for offset, array in ((template_ids_offset, np.asarray(template_ids, dtype='<i8')),
+                              (ids_offset, np.asarray(user_ids, dtype='<i8')),
+                              (scales_offset, scales.astype('<f4', copy=False)),
+                              (quantized_offset, quantized),
+                              (vectors_offset, matrix.astype('<f4', copy=False))):
+            handle.seek(offset)
+            handle.write(np.ascontiguousarray(array).tobytes())
+        handle.truncate(size)
+    os.replace(tmp_path, path)
+    return True
+
+
+class GallerySnapshot:
+    """
+    Snapshot yang sudah dibuka sebagai memmap read-only.
+    """
+
+    def __init__(self, header, template_ids, user_ids, scales, quantized, vectors):
+        self.header = header
+        self.template_ids = template_ids
+        self.user_ids = user_ids
+        self.scales = scales
+        self.quantized = quantized
+        self.vectors = vectors
+
+    @property
+    def generation(self):
+        return self.header.generation
+
+    @classmethod
+    def open(cls, path):
+        header = read_header(path)
+        if header is None:
+            raise SnapshotFormatError(f"Snapshot galeri tidak valid: {path}")
+        dim, count = header.dim, header.count
+        template_ids_offset, ids_offset, scales_offset, quantized_offset, vectors_offset, size = _layout(dim, count)
+        if os.path.getsize(path) < size:
+            raise SnapshotFormatError(f"Snapshot galeri terpotong: {path}")
+        if not count:
+            return cls(header, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32),
+                       np.empty((0, dim), dtype=np.int8), np.empty((0, dim), dtype=np.float32))
+
+        def section(dtype, offset, shape):
+            return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+        return cls(
+            header,
+            section('<i8', template_ids_offset, (count,)),
+            section('<i8', ids_offset, (count,)),
+            section('<f4', scales_offset, (count,)),
+            section(np.int8, quantized_offset, (count, dim)),
+            section('<f4', vectors_offset, (count, dim)),
+        )
@@ -0,0 +1,62 @@
+"""
+Konfigurasi gunicorn. Semua nilai bisa diubah lewat environment variable.
+"""
+import multiprocessing
+import os
+import threading
+import time
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+
+# Satu proses per core; MediaPipe memakai CPU penuh per inferensi, jadi
+# menambah proses melebihi jumlah core hanya menambah antrean dan memori.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# Thread per worker untuk request ringan (halaman, riwayat, admin) selama
+# request lain menunggu model wajah dari FaceModelPool.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Muat aplikasi dan galeri wajah sekali di master, lalu fork
+preload_app = True
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+# Daur ulang worker secara berkala; worker baru di-fork dari master yang
+# sudah memuat aplikasi, jadi hanya warmup MediaPipe yang diulang.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = 200
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    from wsgi import startup_seconds
+    server.log.info("Master siap, preload aplikasi %.2f detik; %d worker x %d thread",
+                    startup_seconds, workers, threads)
+
+
+def post_fork(server, worker):
+    from wsgi import app
+    from models import db
+    from recognition_backends import get_backend
+
+    forked_at = time.perf_counter()
+    with app.app_context():
+        # Pool koneksi baru per worker
+        db.engine.dispose(close=False)
+
+    backend = get_backend()
+
+    def warmup():
+        try:
+            backend.warmup()
+        except Exception:
+            # Sudah dicatat oleh warmup(); /health melaporkan warmup_error
+            return
+        server.log.info("Worker %s siap dalam %.2f detik setelah fork (warmup %s %.2f detik)",
+                        worker.pid, time.perf_counter() - forked_at, backend.name, backend.warmup_seconds)
+
+    threading.Thread(target=warmup, name='face-model-warmup', daemon=True).start()
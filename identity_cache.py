@@ -0,0 +1,149 @@
+"""
+Cache identitas user per proses worker untuk user_loader Flask-Login.
+
+Setiap request yang login memanggil user_loader. Daripada membaca baris User
+(termasuk blob embedding) dari database setiap kali, identitas ringan
+(id, nama, status admin, sudah punya wajah) disimpan sebentar di memori.
+
+Perubahan nama/status admin/wajah dan user yang dihapus dicatat sebagai
+UserIdentityEvent. Paling sering sekali per check_interval detik, cache
+membaca ID event terakhir (query index-only); jika bertambah, entri user
+yang berubah dibuang, sehingga semua proses worker melihat perubahan itu
+dalam hitungan detik tanpa query tambahan di setiap request.
+"""
+import threading
+import time
+
+from flask_login import UserMixin
+from sqlalchemy import event, func, inspect
+
+from models import db, User, UserIdentityEvent
+
+# Jika event yang harus dibaca lebih banyak dari ini (atau sebagian sudah
+# dihapus), seluruh cache dikosongkan saja
+_MAX_EVENTS = 1000
+
+# Sama seperti galeri: beberapa event terakhir dibaca ulang karena ID
+# sequence bisa ter-commit tidak berurutan
+_RESYNC_OVERLAP = 32
+
+# Kolom User yang disalin ke UserIdentity
+_IDENTITY_FIELDS = ('name', 'is_admin', 'has_face')
+
+
+class UserIdentity(UserMixin):
+    """
+    Pengganti objek User untuk current_user. Kode yang butuh data lengkap
+    tetap memuat User dari database berdasarkan id.
+    """
+
+    def __init__(self, id, name, is_admin, has_face):
+        self.id = id
+        self.name = name
+        self.is_admin = is_admin
+        self.has_face = has_face
+
+    def __str__(self):
+        return self.name
+
+
+class IdentityCache:
+
+    def __init__(self, ttl=30, max_entries=10000, check_interval=2):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+        # ID UserIdentityEvent terakhir yang sudah diterapkan ke cache
+        self.generation = None
+        self._checked_at = None
+
+    def configure(self, ttl=30, check_interval=2):
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.invalidate()
+
+    def _load(self, user_id):
+        row = db.session.query(User.id, User.name, User.is_admin, User.has_face).filter(User.id == user_id).first()
+        return UserIdentity(*row) if row else None
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        latest = db.session.query(func.max(UserIdentityEvent.id)).scalar() or 0
+        if latest == self.generation:
+            return
+        if self.generation is None or latest < self.generation:
+            self.invalidate()
+        else:
+            events = db.session.query(UserIdentityEvent.id, UserIdentityEvent.user_id).filter(
+                UserIdentityEvent.id > self.generation - _RESYNC_OVERLAP,
+                UserIdentityEvent.id <= latest
+            ).order_by(UserIdentityEvent.id).limit(_MAX_EVENTS + 1).all()
+            # ID pertama yang melompat berarti event di antaranya mungkin sudah dihapus
+            if len(events) > _MAX_EVENTS or not events or events[0][0] > self.generation + 1:
+                self.invalidate()
+            else:
+                for _, changed_user_id in events:
+                    self.invalidate(changed_user_id)
+        self.generation = latest
+
+    def get(self, user_id):
+        if not self.ttl:
+            return self._load(user_id)
+
+        self._refresh()
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        identity = self._load(user_id)
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries = {key: value for key, value in self._entries.items() if value[0] > now}
+            if identity is not None:
+                self._entries[user_id] = (now + self.ttl, identity)
+            else:
+                self._entries.pop(user_id, None)
+        return identity
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+
+identity_cache = IdentityCache()
+
+
+def record_identity_change(user_ids):
+    """
+    Catat perubahan identitas yang tidak lewat event ORM (mis.
+    bulk_update_mappings). Commit dilakukan pemanggil.
+    """
+    user_ids = list(user_ids)
+    for user_id in user_ids:
+        identity_cache.invalidate(user_id)
+    if user_ids:
+        db.session.execute(UserIdentityEvent.__table__.insert(), [{'user_id': user_id} for user_id in user_ids])
+
+
+@event.listens_for(User, 'after_update')
+def _invalidate_updated_user(mapper, connection, target):
+    # Ganti password atau blob wajah saja tidak mengubah identitas yang di-cache
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in _IDENTITY_FIELDS):
+        _invalidate_user(mapper, connection, target)
+
+
+@event.listens_for(User, 'after_delete')
+def _invalidate_user(mapper, connection, target):
+    identity_cache.invalidate(target.id)
+    # Ikut transaksi yang sama, sehingga worker lain membuang entrinya setelah commit
+    connection.execute(UserIdentityEvent.__table__.insert().values(user_id=target.id))
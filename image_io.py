@@ -0,0 +1,120 @@
+import base64
+import struct
+
+import cv2
+import numpy as np
+
+# Marker SOF (Start Of Frame) JPEG yang menyimpan tinggi dan lebar gambar.
+# 0xC4 (DHT), 0xC8 (JPG) dan 0xCC (DAC) bukan SOF walaupun berada di rentang yang sama.
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# Faktor reduksi yang didukung decoder JPEG libjpeg lewat OpenCV
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def jpeg_dimensions(data):
+    """
+    Baca (lebar, tinggi) dari header JPEG tanpa men-decode piksel.
+    Mengembalikan None jika data bukan JPEG atau header tidak lengkap.
+    """
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        # Byte pengisi 0xFF dan marker tanpa panjang (RSTn, TEM)
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        segment_length = struct.unpack('>H', data[offset + 2:offset + 4])[0]
+        if marker in _SOF_MARKERS:
+            if offset + 9 > len(data):
+                return None
+            height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + segment_length
+    return None
+
+
+def reduced_decode_flag(width, target_width=640):
+    """
+    Pilih flag imdecode terbesar yang hasilnya masih selebar target_width,
+    sehingga decoder tidak menghasilkan piksel yang nanti dibuang saat resize.
+    """
+    for factor, flag in _REDUCED_FLAGS:
+        if width // factor >= target_width:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def decode_image(img_bytes, target_width=640):
+    """
+    Decode bytes gambar ke frame BGR. Untuk JPEG besar, decode langsung pada
+    resolusi 1/2, 1/4 atau 1/8. Melempar ValueError jika gambar tidak valid.
+    """
+    flag = cv2.IMREAD_COLOR
+    dimensions = jpeg_dimensions(img_bytes)
+    if dimensions is not None:
+        flag = reduced_decode_flag(dimensions[0], target_width)
+
+    frame = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), flag)
+    if frame is None:
+        raise ValueError("Gambar tidak dapat di-decode.")
+    return frame
+
+
+def make_thumbnail(img_bytes, width=128, quality=80):
+    """
+    Buat thumbnail JPEG selebar `width` piksel dari bytes gambar.
+    """
+    frame = decode_image(img_bytes, target_width=width)
+    height = max(int(round(frame.shape[0] * width / frame.shape[1])), 1)
+    if frame.shape[1] > width:
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Thumbnail tidak dapat dibuat.")
+    return buffer.tobytes()
+
+
+def read_capture_upload(req):
+    """
+    Ambil bytes gambar dan metadata dari request presensi/pendaftaran wajah.
+
+    Mendukung tiga bentuk request:
+    - multipart/form-data: file `image`, metadata di field form
+    - application/octet-stream atau image/jpeg: body berisi bytes JPEG,
+      metadata di query string
+    - application/json (format lama): `image_data` berupa data URL base64
+      dan `location` berupa objek {latitude, longitude}
+
+    Mengembalikan (img_bytes, fields). img_bytes None jika gambar tidak ada.
+    Melempar ValueError jika data gambar tidak bisa dibaca.
+    """
+    if req.mimetype == 'multipart/form-data':
+        upload = req.files.get('image')
+        img_bytes = upload.read() if upload else None
+        return img_bytes, req.form.to_dict()
+
+    if req.mimetype in ('application/octet-stream', 'image/jpeg'):
+        return req.get_data(cache=False) or None, req.args.to_dict()
+
+    data = req.get_json(silent=True) or {}
+    fields = {key: value for key, value in data.items() if key not in ('image_data', 'location')}
+    location = data.get('location')
+    if isinstance(location, dict):
+        fields['latitude'] = location.get('latitude')
+        fields['longitude'] = location.get('longitude')
+
+    if 'image_data' not in data:
+        return None, fields
+    try:
+        img_bytes = base64.b64decode(data['image_data'].split(',')[1])
+    except Exception as e:
+        raise ValueError(e)
+    return img_bytes, fields
@@ -0,0 +1,27 @@
+import argparse
+
+from app import create_app
+from enrollment import import_enrollment_csv
+
+
+def import_enrollment(path, replace=False):
+    """
+    Script command-line untuk mengimpor peserta mata kuliah dari file CSV
+    dengan kolom `kode_mk` dan `name`.
+    """
+    app = create_app(warmup=False)
+    with app.app_context():
+        with open(path, encoding='utf-8-sig') as handle:
+            report = import_enrollment_csv(handle.read(), replace=replace)
+
+        for error in report['errors']:
+            print(f"  ! {error}")
+        print(f"\n{report['added']} peserta ditambahkan, {report['skipped']} sudah terdaftar.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Impor peserta mata kuliah dari CSV.")
+    parser.add_argument('path', help="File CSV dengan kolom kode_mk,name")
+    parser.add_argument('--replace', action='store_true', help="Ganti peserta lama untuk mata kuliah di file.")
+    args = parser.parse_args()
+    import_enrollment(args.path, replace=args.replace)
@@ -0,0 +1,18 @@
+import time
+
+from app import create_app, initialize_database
+
+
+def init_db():
+    """
+    Script command-line (sekali per deploy) untuk membuat tabel, menambah
+    kolom/index baru, dan mengisi data awal sebelum server produksi start.
+    """
+    started = time.perf_counter()
+    app = create_app(init_database=False, warmup=False)
+    initialize_database(app)
+    print(f"Database siap dalam {time.perf_counter() - started:.2f} detik.")
+
+
+if __name__ == '__main__':
+    init_db()
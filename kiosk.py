@@ -0,0 +1,314 @@
+"""
+Mode kiosk untuk kamera di pintu kelas.
+
+Kiosk mengirim frame terus-menerus dalam satu request POST ber-chunk: setiap
+frame adalah panjang 4 byte (big-endian) diikuti bytes JPEG, dan panjang 0
+menandai akhir stream. Server membalas dengan satu baris JSON per kejadian.
+
+Setiap frame hanya melewati deteksi wajah (murah). Wajah dilacak antar frame
+dengan IoU kotak deteksi; embedding (backend aktif) dan pencocokan galeri hanya
+dijalankan beberapa kali per track sampai suara (vote) cukup untuk satu
+mahasiswa, setelah itu track tersebut tidak diproses lagi. Jika pemrosesan
+tertinggal, frame lama dibuang dan hanya frame terbaru yang diproses.
+"""
+import json
+import struct
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from image_io import decode_image
+from face_gallery import face_gallery
+from recognition_backends import get_backend, crop_face, embedding_from_crop
+from landmark_basis import project_for_gallery, gallery_threshold
+from recognition_executor import recognition_executor, RecognitionBusy
+from attendance import insert_attendance
+from capture_store import capture_store
+from models import db, User
+from metrics import stage, record_match_score
+
+_FRAME_HEADER = struct.Struct('>I')
+
+TRACK_PENDING = 'pending'
+TRACK_PRESENT = 'present'
+TRACK_UNKNOWN = 'unknown'
+
+
+def iter_frames(stream, max_frame_bytes=2 * 1024 * 1024):
+    """
+    Baca frame berawalan panjang dari stream body request sampai EOF atau
+    frame berpanjang 0. Melempar ValueError jika framing tidak valid.
+    """
+    while True:
+        header = stream.read(_FRAME_HEADER.size)
+        if len(header) < _FRAME_HEADER.size:
+            return
+        (length,) = _FRAME_HEADER.unpack(header)
+        if length == 0:
+            return
+        if length > max_frame_bytes:
+            raise ValueError(f"Frame terlalu besar ({length} byte).")
+        frame = stream.read(length)
+        if len(frame) < length:
+            return
+        yield frame
+
+
+class FrameBuffer:
+    """
+    Antrean frame berkapasitas kecil. Jika penuh, frame tertua dibuang
+    sehingga yang diproses selalu frame terbaru.
+    """
+
+    def __init__(self, capacity=2):
+        self._frames = deque(maxlen=max(int(capacity), 1))
+        self._condition = threading.Condition()
+        self.received = 0
+        self.dropped = 0
+        self.closed = False
+        self.error = None
+
+    def put(self, frame):
+        with self._condition:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1
+            self._frames.append(frame)
+            self.received += 1
+            self._condition.notify()
+
+    def close(self, error=None):
+        with self._condition:
+            self.closed = True
+            self.error = error
+            self._condition.notify()
+
+    def get(self):
+        """
+        Frame berikutnya, atau None jika stream sudah selesai.
+        """
+        with self._condition:
+            while not self._frames and not self.closed:
+                self._condition.wait()
+            return self._frames.popleft() if self._frames else None
+
+    def fill_from(self, stream):
+        """
+        Dijalankan di thread pembaca: salin frame dari body request ke buffer.
+        """
+        try:
+            for frame in iter_frames(stream):
+                self.put(frame)
+        except Exception as e:
+            self.close(e)
+        else:
+            self.close()
+
+
+def box_iou(first, second):
+    """
+    Intersection-over-union dua kotak relatif (xmin, ymin, width, height).
+    """
+    left = max(first[0], second[0])
+    top = max(first[1], second[1])
+    right = min(first[0] + first[2], second[0] + second[2])
+    bottom = min(first[1] + first[3], second[1] + second[3])
+    intersection = max(right - left, 0) * max(bottom - top, 0)
+    union = first[2] * first[3] + second[2] * second[3] - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+class Track:
+
+    def __init__(self, track_id, box, frame_number):
+        self.id = track_id
+        self.box = box
+        self.misses = 0
+        self.status = TRACK_PENDING
+        self.user_id = None
+        self.samples = 0
+        self.last_sample_frame = None
+        # user_id -> [jumlah vote, jumlah similarity]
+        self.votes = {}
+        self.first_frame = frame_number
+
+    def add_vote(self, user_id, similarity):
+        votes = self.votes.setdefault(user_id, [0, 0.0])
+        votes[0] += 1
+        votes[1] += similarity
+        return votes[0]
+
+
+class IoUTracker:
+    """
+    Pelacak sederhana: deteksi di frame baru dipasangkan satu-satu dengan
+    track yang ada berdasarkan IoU tertinggi. Track yang tidak terlihat
+    lebih dari max_misses frame dihapus.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_misses=10):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.tracks = []
+        self.created = 0
+
+    def update(self, boxes, frame_number):
+        """
+        Perbarui track dengan kotak deteksi frame ini. Mengembalikan list
+        (track, kotak) untuk track yang terlihat di frame ini.
+        """
+        matched, unmatched = {}, set(range(len(boxes)))
+        if self.tracks and boxes:
+            overlap = np.array([[box_iou(track.box, box) for box in boxes] for track in self.tracks])
+            for row, column in zip(*linear_sum_assignment(overlap, maximize=True)):
+                if overlap[row, column] >= self.iou_threshold:
+                    matched[row] = column
+                    unmatched.discard(column)
+
+        visible, alive = [], []
+        for row, track in enumerate(self.tracks):
+            if row in matched:
+                track.box = boxes[matched[row]]
+                track.misses = 0
+                visible.append((track, track.box))
+            else:
+                track.misses += 1
+            if track.misses <= self.max_misses:
+                alive.append(track)
+        for column in sorted(unmatched):
+            self.created += 1
+            track = Track(self.created, boxes[column], frame_number)
+            alive.append(track)
+            visible.append((track, track.box))
+        self.tracks = alive
+        return visible
+
+
+class KioskSession:
+    """
+    Status satu stream kiosk untuk satu mata kuliah.
+    """
+
+    def __init__(self, matakuliah_id, votes_needed=2, max_samples=4, sample_every=3,
+                 threshold=None, detect_width=640):
+        # Deteksi dan embedding memakai backend pengenalan yang aktif
+        self.backend = get_backend()
+        self.matakuliah_id = int(matakuliah_id)
+        self.votes_needed = votes_needed
+        self.max_samples = max_samples
+        self.sample_every = sample_every
+        self.threshold = self.backend.threshold if threshold is None else threshold
+        self.detect_width = detect_width
+        self.tracker = IoUTracker()
+        self.frames = 0
+        self.recognitions = 0
+
+    def _needs_sample(self, track):
+        return track.status == TRACK_PENDING and (
+            track.last_sample_frame is None or self.frames - track.last_sample_frame >= self.sample_every)
+
+    def process(self, frame_bytes):
+        """
+        Proses satu frame JPEG dan kembalikan list kejadian (dict).
+        """
+        self.frames += 1
+        with stage('decode'):
+            frame = decode_image(frame_bytes, target_width=self.detect_width)
+            if frame.shape[1] > self.detect_width:
+                scale = self.detect_width / frame.shape[1]
+                frame = cv2.resize(frame, (self.detect_width, int(frame.shape[0] * scale)))
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+        events = []
+        for track, box in self.tracker.update(self.backend.detect_faces(rgb_frame), self.frames):
+            if not self._needs_sample(track):
+                continue
+            crop = crop_face(rgb_frame, box)
+            if crop is None:
+                continue
+            try:
+                embedding = recognition_executor.submit(embedding_from_crop, crop, self.backend.name)
+            except RecognitionBusy:
+                # Coba lagi di frame berikutnya
+                continue
+            track.last_sample_frame = self.frames
+            track.samples += 1
+            self.recognitions += 1
+            event = self._vote(track, embedding, frame_bytes)
+            if event:
+                events.append(event)
+        return events
+
+    def _vote(self, track, embedding, frame_bytes):
+        if embedding is not None:
+            with stage('gallery_sync'):
+                face_gallery.sync()
+            embedding = project_for_gallery(embedding)
+            with stage('match'):
+                user_id, similarity = face_gallery.best_match(embedding, self.matakuliah_id)
+            record_match_score('kiosk', similarity)
+            if user_id is not None and similarity >= gallery_threshold(self.threshold):
+                if track.add_vote(user_id, similarity) >= self.votes_needed:
+                    return self._commit(track, user_id, frame_bytes)
+
+        if track.samples >= self.max_samples:
+            track.status = TRACK_UNKNOWN
+            return {'event': 'unknown', 'track': track.id}
+        return None
+
+    def _commit(self, track, user_id, frame_bytes):
+        track.status = TRACK_PRESENT
+        track.user_id = user_id
+        count, total = track.votes[user_id]
+        with stage('db_insert'):
+            inserted = insert_attendance(user_id, self.matakuliah_id, capture_store.key_for(frame_bytes))
+        if inserted:
+            with stage('capture_enqueue'):
+                capture_store.save(frame_bytes)
+        user = db.session.get(User, user_id)
+        return {
+            'event': 'present' if inserted else 'already_present',
+            'track': track.id,
+            'user_id': user_id,
+            'name': user.name if user else None,
+            'similarity': round(total / count, 4),
+        }
+
+    def summary(self, buffer):
+        return {
+            'event': 'summary',
+            'frames_received': buffer.received,
+            'frames_processed': self.frames,
+            'frames_dropped': buffer.dropped,
+            'tracks': self.tracker.created,
+            'recognitions': self.recognitions,
+        }
+
+
+def stream_events(session, stream, max_backlog=2):
+    """
+    Generator baris NDJSON untuk respons stream. Body request dibaca oleh
+    thread terpisah ke FrameBuffer sehingga frame yang datang saat frame
+    lain sedang diproses tidak menumpuk.
+    """
+    buffer = FrameBuffer(max_backlog)
+    reader = threading.Thread(target=buffer.fill_from, args=(stream,), name='kiosk-reader', daemon=True)
+    reader.start()
+    try:
+        while True:
+            frame = buffer.get()
+            if frame is None:
+                break
+            try:
+                events = session.process(frame)
+            except ValueError:
+                events = [{'event': 'error', 'message': 'Frame tidak dapat di-decode.'}]
+            for event in events:
+                yield json.dumps(event) + '\n'
+        if buffer.error is not None:
+            yield json.dumps({'event': 'error', 'message': str(buffer.error)}) + '\n'
+        yield json.dumps(session.summary(buffer)) + '\n'
+    finally:
+        buffer.close()
@@ -0,0 +1,120 @@
+import argparse
+import http.client
+import json
+import struct
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+import cv2
+
+
+def _connection(parts):
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    return connection_class(parts.hostname, parts.port)
+
+
+def login(parts, name, password):
+    """
+    Login sebagai admin/dosen dan kembalikan cookie sesi.
+    """
+    connection = _connection(parts)
+    connection.request('POST', '/login', body=urlencode({'name': name, 'password': password}),
+                       headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    response = connection.getresponse()
+    response.read()
+    cookies = [header.split(';', 1)[0] for key, header in response.getheaders() if key.lower() == 'set-cookie']
+    if response.status != 302 or not cookies or response.getheader('Location', '').endswith('/login'):
+        raise SystemExit("Login gagal. Periksa nama dan password.")
+    return '; '.join(cookies)
+
+
+def _send_frames(connection, camera, fps, jpeg_quality, max_frames, stop):
+    # Body chunked: setiap chunk berisi satu frame berawalan panjang 4 byte
+    interval = 1.0 / fps if fps else 0
+    sent = 0
+    try:
+        while not stop.is_set() and (not max_frames or sent < max_frames):
+            started = time.perf_counter()
+            ok, frame = camera.read()
+            if not ok:
+                break
+            ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+            if not ok:
+                continue
+            payload = struct.pack('>I', len(buffer)) + buffer.tobytes()
+            connection.send(b'%x\r\n%s\r\n' % (len(payload), payload))
+            sent += 1
+            if interval:
+                time.sleep(max(interval - (time.perf_counter() - started), 0))
+    finally:
+        end = struct.pack('>I', 0)
+        connection.send(b'%x\r\n%s\r\n0\r\n\r\n' % (len(end), end))
+
+
+def run_kiosk(server, course, name, password, camera_index=0, fps=10, jpeg_quality=80, max_frames=0):
+    """
+    Script command-line untuk kiosk di pintu kelas: kirim frame kamera secara
+    terus-menerus ke /kiosk/stream dan tampilkan presensi yang tercatat.
+    """
+    parts = urlsplit(server)
+    cookie = login(parts, name, password)
+
+    camera = cv2.VideoCapture(camera_index)
+    if not camera.isOpened():
+        raise SystemExit(f"Kamera {camera_index} tidak dapat dibuka.")
+
+    connection = _connection(parts)
+    connection.putrequest('POST', f"/kiosk/stream?{urlencode({'course': course})}")
+    connection.putheader('Cookie', cookie)
+    connection.putheader('Content-Type', 'application/octet-stream')
+    connection.putheader('Transfer-Encoding', 'chunked')
+    connection.endheaders()
+
+    # Frame dikirim dari thread lain selagi respons dibaca baris per baris
+    stop = threading.Event()
+    sender = threading.Thread(target=_send_frames, args=(connection, camera, fps, jpeg_quality, max_frames, stop),
+                              daemon=True)
+    sender.start()
+
+    print(f"--- Kiosk Presensi (mata kuliah {course}) --- Ctrl+C untuk berhenti")
+    try:
+        response = connection.getresponse()
+        if response.status != 200:
+            raise SystemExit(f"Server menolak stream: {response.status} {response.read().decode(errors='replace')}")
+        for line in response:
+            event = json.loads(line)
+            if event['event'] == 'present':
+                print(f"  ✓ {event['name']} hadir (similarity {event['similarity']:.2f})")
+            elif event['event'] == 'already_present':
+                print(f"  - {event['name']} sudah presensi hari ini")
+            elif event['event'] == 'unknown':
+                print(f"  ? Wajah tidak dikenali (track {event['track']})")
+            elif event['event'] == 'summary':
+                print(f"\nSelesai: {event['frames_processed']}/{event['frames_received']} frame diproses, "
+                      f"{event['frames_dropped']} dibuang, {event['tracks']} track, "
+                      f"{event['recognitions']} pencocokan wajah.")
+            else:
+                print(f"  ! {event.get('message')}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        sender.join(timeout=5)
+        camera.release()
+        connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Kiosk presensi: stream kamera ke server.")
+    parser.add_argument('server', help="URL server, mis. http://localhost:8080")
+    parser.add_argument('--course', type=int, required=True, help="ID mata kuliah")
+    parser.add_argument('--name', required=True, help="Nama akun admin/dosen")
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--camera', type=int, default=0, help="Indeks kamera OpenCV")
+    parser.add_argument('--fps', type=float, default=10, help="Frame per detik yang dikirim (0 = secepatnya)")
+    parser.add_argument('--quality', type=int, default=80, help="Kualitas JPEG frame")
+    parser.add_argument('--max-frames', type=int, default=0, help="Berhenti setelah N frame (0 = tanpa batas)")
+    args = parser.parse_args()
+    run_kiosk(args.server, args.course, args.name, args.password, camera_index=args.camera, fps=args.fps,
+              jpeg_quality=args.quality, max_frames=args.max_frames)
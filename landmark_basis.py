@@ -0,0 +1,208 @@
+"""
+Basis normalisasi untuk embedding landmark MediaPipe.
+
+Embedding mentah MediaPipe adalah 478 titik (x, y, z) ter-normalisasi
+terhadap frame, sehingga berubah jika wajah bergeser, menjauh, atau sedikit
+menoleh. Basis berisi:
+
+    canonical   bentuk wajah kanonik (478 x 3), rata-rata gallery hasil
+                generalized Procrustes analysis
+    mean        rata-rata vektor yang sudah di-align (opsional)
+    components  sumbu PCA (k x 1434) hasil fit pada galeri (opsional)
+
+Setiap landmark digeser ke pusatnya, diskalakan ke norma 1, lalu dirotasi
+ke bentuk kanonik (orthogonal Procrustes). Jika basis punya komponen PCA,
+hasilnya diproyeksikan ke k dimensi (mis. 64-128 dari 1434).
+
+Basis disimpan di tabel embedding_basis. ID barisnya adalah versi basis dan
+ditulis sebagai `revision` di header blob embedding (0 = vektor mentah),
+sehingga galeri tahu basis mana yang dipakai setiap template.
+
+Normalisasi ini opt-in: selama reproject_embeddings.py belum dijalankan
+(galeri masih di revisi 0), probe dan template tetap berupa landmark mentah
+yang bergantung pada posisi wajah di frame, dengan threshold bawaan backend.
+"""
+import io
+import threading
+
+import numpy as np
+
+from models import db, EmbeddingBasis
+from face_gallery import face_gallery
+from metrics import stage
+
+LANDMARK_COUNT = 478
+
+# Ukuran blok saat meng-align banyak vektor agar memori sementara kecil
+_ALIGN_BLOCK = 4096
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _shapes(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors.reshape(len(vectors), -1, 3)
+
+
+def _centre_and_scale(points):
+    points = points - points.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(points, axis=(1, 2), keepdims=True)
+    norms[norms == 0] = 1.0
+    return points / norms
+
+
+def _rotate_onto(points, canonical):
+    # Rotasi R yang meminimalkan ||P R - C||: R = U V^T dari SVD P^T C,
+    # dengan tanda sumbu terakhir dibalik jika hasilnya berupa refleksi
+    u, _, vt = np.linalg.svd(np.einsum('nki,kj->nij', points, canonical))
+    u[:, :, -1] *= np.where(np.linalg.det(u @ vt) < 0, -1.0, 1.0)[:, None]
+    return points @ (u @ vt)
+
+
+def align_landmarks(vectors, canonical=None):
+    """
+    Pusatkan, skalakan, dan (jika canonical diberikan) rotasikan setiap
+    baris (n, 478*3) ke bentuk kanonik. Mengembalikan (n, 478*3) float32.
+    """
+    points = _shapes(vectors)
+    aligned = np.empty_like(points)
+    for start in range(0, len(points), _ALIGN_BLOCK):
+        block = _centre_and_scale(points[start:start + _ALIGN_BLOCK])
+        if canonical is not None:
+            block = _rotate_onto(block, canonical)
+        aligned[start:start + _ALIGN_BLOCK] = block
+    return aligned.reshape(len(points), -1)
+
+
+def fit_canonical(vectors, iterations=5):
+    """
+    Bentuk kanonik dengan generalized Procrustes analysis: align semua
+    bentuk ke rata-rata, hitung ulang rata-ratanya, ulangi.
+    """
+    points = _centre_and_scale(_shapes(vectors))
+    canonical = _centre_and_scale(points.mean(axis=0, keepdims=True))[0]
+    for _ in range(iterations):
+        canonical = _centre_and_scale(_rotate_onto(points, canonical).mean(axis=0, keepdims=True))[0]
+    return canonical.astype(np.float32)
+
+
+class LandmarkBasis:
+
+    def __init__(self, canonical, mean=None, components=None, version=None, explained_variance=None,
+                 threshold=None):
+        self.canonical = np.ascontiguousarray(canonical, dtype=np.float32)
+        self.mean = None if mean is None else np.ascontiguousarray(mean, dtype=np.float32)
+        self.components = None if components is None else np.ascontiguousarray(components, dtype=np.float32)
+        self.version = version
+        # Proporsi varians yang dipertahankan komponen PCA
+        self.explained_variance = explained_variance
+        # Skala cosine berubah setelah align/PCA, jadi threshold ikut basis
+        self.threshold = threshold
+
+    @property
+    def dim(self):
+        return self.components.shape[0] if self.components is not None else self.canonical.size
+
+    @classmethod
+    def fit(cls, vectors, components=96, iterations=5, sample_size=50000, seed=0):
+        """
+        Fit bentuk kanonik dan (jika components > 0) basis PCA dari vektor
+        landmark mentah galeri.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) > sample_size:
+            rng = np.random.default_rng(seed)
+            vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        canonical = fit_canonical(vectors, iterations)
+        if not components:
+            return cls(canonical)
+
+        aligned = align_landmarks(vectors, canonical).astype(np.float64)
+        mean = aligned.mean(axis=0)
+        centred = aligned - mean
+        # Matriks kovarians 1434 x 1434 jauh lebih kecil daripada SVD n x 1434
+        eigenvalues, eigenvectors = np.linalg.eigh(centred.T @ centred)
+        order = np.argsort(eigenvalues)[::-1][:min(components, len(vectors) - 1, aligned.shape[1])]
+        total = eigenvalues.sum()
+        explained = float(eigenvalues[order].sum() / total) if total > 0 else None
+        return cls(canonical, mean, eigenvectors[:, order].T, explained_variance=explained)
+
+    def project(self, vectors):
+        """
+        Align (lalu proyeksikan jika ada PCA) vektor landmark mentah.
+        """
+        aligned = align_landmarks(vectors, self.canonical)
+        if self.components is None:
+            return aligned
+        return ((aligned - self.mean) @ self.components.T).astype(np.float32)
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        arrays = {'canonical': self.canonical}
+        if self.components is not None:
+            arrays.update(mean=self.mean, components=self.components)
+        np.savez(buffer, **arrays)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data, version=None, explained_variance=None, threshold=None):
+        with np.load(io.BytesIO(data)) as arrays:
+            return cls(arrays['canonical'], arrays['mean'] if 'mean' in arrays.files else None,
+                       arrays['components'] if 'components' in arrays.files else None,
+                       version=version, explained_variance=explained_variance, threshold=threshold)
+
+
+def save_basis(basis, sample_count):
+    """
+    Simpan basis sebagai versi baru dan kembalikan nomor versinya. Commit
+    dilakukan pemanggil.
+    """
+    row = EmbeddingBasis(dim=basis.dim, sample_count=sample_count, explained_variance=basis.explained_variance,
+                         threshold=basis.threshold, data=basis.to_bytes())
+    db.session.add(row)
+    db.session.flush()
+    basis.version = row.id
+    return row.id
+
+
+def load_basis(version):
+    """
+    Basis untuk versi tertentu (di-cache per proses karena isinya tidak
+    pernah berubah), atau None untuk versi 0 (vektor mentah).
+    """
+    if not version:
+        return None
+    basis = _cache.get(version)
+    if basis is None:
+        row = db.session.get(EmbeddingBasis, version)
+        if row is None:
+            raise LookupError(f"Basis landmark versi {version} tidak ditemukan.")
+        basis = LandmarkBasis.from_bytes(row.data, version=row.id, explained_variance=row.explained_variance,
+                                         threshold=row.threshold)
+        with _cache_lock:
+            _cache[version] = basis
+    return basis
+
+
+def project_for_gallery(embedding):
+    """
+    Align/proyeksikan embedding landmark mentah ke basis yang dipakai galeri
+    saat ini. Dipanggil setelah face_gallery.sync(). Jika galeri masih di
+    revisi 0, embedding dikembalikan apa adanya (tanpa centre/scale).
+    """
+    if embedding is None or not face_gallery.revision:
+        return embedding
+    with stage('postprocess'):
+        return load_basis(face_gallery.revision).project(embedding.reshape(1, -1))[0]
+
+
+def gallery_threshold(threshold):
+    """
+    Threshold yang berlaku untuk basis galeri saat ini: threshold basis jika
+    ada dan positif, selain itu threshold bawaan yang diberikan.
+    """
+    if not face_gallery.revision:
+        return threshold
+    basis = load_basis(face_gallery.revision)
+    return threshold if basis.threshold is None or basis.threshold <= 0 else basis.threshold
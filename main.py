@@ -1,20 +1,43 @@
-import os
-import base64
-import pickle
-from datetime import date, datetime
-import numpy as np
-import cv2
-import pytz
-
-from flask import Blueprint, render_template, jsonify, request, current_app, redirect, url_for, flash
+from datetime import datetime
+
+from flask import (Blueprint, render_template, jsonify, request, current_app, redirect, url_for, flash, abort,
+                   Response, stream_with_context)
 from flask_login import login_required, current_user
-from sqlalchemy.orm import joinedload
+from sqlalchemy import tuple_
 
 from models import db, User, MataKuliah, AttendanceRecord
-from face_utils_mediapipe import generate_encoding_from_image, find_match_in_db
+from face_utils_mediapipe import match_embedding_in_db, verify_embedding_in_db
+from recognition_backends import get_backend, embedding_from_image_bytes
+from recognition_executor import recognition_executor, RecognitionBusy
+from face_gallery import face_gallery
+from face_templates import add_template, encode_template, TEMPLATE_SOURCE_ENROLL, TEMPLATE_SOURCE_ATTENDANCE
+from landmark_basis import project_for_gallery, gallery_threshold
+from enrollment import is_enrolled
+from image_io import read_capture_upload
+from capture_store import capture_store
+from attendance import has_attended_today, insert_attendance
+from timezone_utils import wib_timestamp
+from metrics import stage
+from kiosk import KioskSession, stream_events
 
 main = Blueprint('main', __name__)
 
+# Jumlah presensi per halaman di /records
+RECORDS_PAGE_SIZE = 20
+
+
+def _busy_response(error):
+    response = jsonify({'status': 'error', 'message': 'Server sedang sibuk memproses wajah lain. Silakan coba lagi sebentar.'})
+    return response, 503, {'Retry-After': str(error.retry_after)}
+
+
+def _float_or_none(value):
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
 @main.route('/')
 @login_required
 def index():
@@ -22,7 +45,7 @@ def index():
         return redirect(url_for('admin.index'))
     else:
         # Cek apakah pengguna sudah mendaftarkan wajah (punya encoding)
-        if current_user.face_encoding is None:
+        if not current_user.has_face:
             flash('Anda belum mendaftarkan wajah. Silakan selesaikan pendaftaran.', 'warning')
             return redirect(url_for('main.register_face'))
         
@@ -36,61 +59,139 @@ def records():
     if current_user.is_admin:
         return redirect(url_for('admin.index'))
 
-    wib = pytz.timezone('Asia/Jakarta')
-    user_records = AttendanceRecord.query.options(
-        joinedload(AttendanceRecord.matakuliah)
-    ).filter_by(user_id=current_user.id).order_by(AttendanceRecord.timestamp.desc()).all()
+    matakuliah_id = request.args.get('course', type=int)
+    cursor = _parse_records_cursor(request.args.get('before'))
 
-    for record in user_records:
-        record.local_time = record.timestamp.replace(tzinfo=pytz.utc).astimezone(wib)
-        
-    return render_template('records.html', records=user_records, name=current_user.name)
+    # Hanya kolom yang ditampilkan; waktu WIB dihitung di database
+    query = db.session.query(
+        AttendanceRecord.id,
+        AttendanceRecord.timestamp,
+        wib_timestamp(AttendanceRecord.timestamp).label('local_time'),
+        AttendanceRecord.latitude,
+        AttendanceRecord.longitude,
+        AttendanceRecord.image_path,
+        MataKuliah.kode_mk,
+        MataKuliah.nama_mk,
+        MataKuliah.dosen_pengampu,
+    ).join(MataKuliah, MataKuliah.id == AttendanceRecord.matakuliah_id).filter(
+        AttendanceRecord.user_id == current_user.id
+    )
+    if matakuliah_id:
+        query = query.filter(AttendanceRecord.matakuliah_id == matakuliah_id)
+    if cursor:
+        query = query.filter(tuple_(AttendanceRecord.timestamp, AttendanceRecord.id) < cursor)
+
+    # Keyset pagination: satu baris ekstra untuk tahu apakah ada halaman berikutnya
+    user_records = query.order_by(
+        AttendanceRecord.timestamp.desc(), AttendanceRecord.id.desc()
+    ).limit(RECORDS_PAGE_SIZE + 1).all()
+    next_cursor = None
+    if len(user_records) > RECORDS_PAGE_SIZE:
+        user_records = user_records[:RECORDS_PAGE_SIZE]
+        last = user_records[-1]
+        next_cursor = f"{last.timestamp.isoformat()}_{last.id}"
+
+    courses = MataKuliah.query.order_by(MataKuliah.nama_mk).all()
+    return render_template('records.html', records=user_records, name=current_user.name, courses=courses,
+                           course_id=matakuliah_id, next_cursor=next_cursor, is_first_page=cursor is None)
+
+
+def _parse_records_cursor(value):
+    """
+    Cursor halaman berikutnya berbentuk `<timestamp ISO>_<id>`.
+    """
+    if not value:
+        return None
+    try:
+        timestamp, record_id = value.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(record_id)
+    except ValueError:
+        return None
+
+
+@main.route('/captures/thumbnail/<path:key>')
+@login_required
+def capture_thumbnail(key):
+    # Thumbnail dibuat saat foto disimpan, atau di sini saat pertama kali diminta;
+    # hanya key foto presensi yang dilayani, bukan sembarang file static
+    if not capture_store.is_capture_key(key):
+        abort(404)
+    try:
+        thumbnail = capture_store.thumbnail(key)
+    except (FileNotFoundError, ValueError):
+        abort(404)
+
+    response = current_app.response_class(thumbnail, mimetype='image/jpeg')
+    # Key berbasis hash isi foto, jadi thumbnail tidak pernah berubah
+    response.cache_control.private = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    response.add_etag()
+    return response.make_conditional(request)
 
 
 @main.route('/mark_attendance', methods=['POST'])
 @login_required
 def mark_attendance():
-    data = request.get_json()
-    if not all(k in data for k in ['image_data', 'location', 'matakuliah_id']):
+    # Menerima upload JPEG biner (multipart/octet-stream) maupun JSON base64 lama
+    try:
+        with stage('read_upload'):
+            img_bytes, data = read_capture_upload(request)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f'Format data gambar tidak valid: {e}'})
+    if not img_bytes or not all(k in data for k in ['latitude', 'longitude', 'matakuliah_id']):
         return jsonify({'status': 'error', 'message': 'Permintaan tidak lengkap.'}), 400
 
-    # Cek absensi duplikat
-    today = date.today()
-    if AttendanceRecord.query.filter(
-        AttendanceRecord.user_id == current_user.id,
-        AttendanceRecord.matakuliah_id == data['matakuliah_id'],
-        db.func.date(AttendanceRecord.timestamp) == today
-    ).first():
+    # Mata kuliah yang punya daftar peserta hanya bisa dipresensi pesertanya
+    with stage('enrollment_check'):
+        enrolled = is_enrolled(current_user.id, data['matakuliah_id'])
+    if not enrolled:
+        return jsonify({'status': 'error', 'message': 'Anda tidak terdaftar sebagai peserta mata kuliah ini.'})
+
+    # Cek absensi duplikat (hari WIB); insert di bawah tetap atomik terhadap race
+    with stage('duplicate_check'):
+        already_attended = has_attended_today(current_user.id, data['matakuliah_id'])
+    if already_attended:
         return jsonify({'status': 'warning', 'message': 'Anda sudah presensi untuk mata kuliah ini hari ini.'})
 
-    # Decode gambar dan konversi ke RGB
+    # Decode gambar dan ekstraksi embedding dijalankan di executor pengenalan
+    backend = get_backend()
     try:
-        image_data = data['image_data'].split(',')[1]
-        img_bytes = base64.b64decode(image_data)
-        np_arr = np.frombuffer(img_bytes, np.uint8)
-        frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        with stage('recognition'):
+            embedding, quality = recognition_executor.submit(embedding_from_image_bytes, img_bytes, backend.name)
+    except RecognitionBusy as e:
+        return _busy_response(e)
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'Format data gambar tidak valid: {e}'})
 
     # Panggil fungsi pencocokan dari face_utils
-    matched_user_id, message = find_match_in_db(rgb_frame)
+    if current_app.config['FACE_MATCH_MODE'] == 'verify':
+        matched_user_id, message = verify_embedding_in_db(
+            embedding, current_user.id, impostor_top_k=current_app.config['FACE_IMPOSTOR_TOP_K'],
+            matakuliah_id=data['matakuliah_id'], threshold=backend.threshold
+        )
+    else:
+        matched_user_id, message = match_embedding_in_db(embedding, matakuliah_id=data['matakuliah_id'],
+                                                         threshold=backend.threshold)
 
     if matched_user_id == current_user.id:
-        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-        image_filename = f"{current_user.name}_{timestamp_str}.jpg"
-        full_image_path = os.path.join(current_app.static_folder, 'captures', image_filename)
-        cv2.imwrite(full_image_path, frame)
-        
-        new_record = AttendanceRecord(
-            user_id=current_user.id,
-            matakuliah_id=data['matakuliah_id'],
-            latitude=data['location'].get('latitude'),
-            longitude=data['location'].get('longitude'),
-            image_path=f"captures/{image_filename}"
-        )
-        db.session.add(new_record)
-        db.session.commit()
+        # Bytes JPEG dari browser disimpan apa adanya oleh writer background,
+        # hanya jika presensi benar-benar tersimpan
+        with stage('db_insert'):
+            inserted = insert_attendance(
+                user_id=current_user.id,
+                matakuliah_id=data['matakuliah_id'],
+                image_path=capture_store.key_for(img_bytes),
+                latitude=_float_or_none(data['latitude']),
+                longitude=_float_or_none(data['longitude']),
+            )
+        if not inserted:
+            return jsonify({'status': 'warning', 'message': 'Anda sudah presensi untuk mata kuliah ini hari ini.'})
+        with stage('capture_enqueue'):
+            capture_store.save(img_bytes)
+        if current_app.config['FACE_TEMPLATE_AUTO_ADD']:
+            with stage('template_auto_add'):
+                _auto_add_template(backend, current_user.id, embedding, quality)
         return jsonify({'status': 'success', 'message': f'Presensi untuk {current_user.name} berhasil!'})
     
     elif matched_user_id is not None:
@@ -100,6 +201,48 @@ def mark_attendance():
         return jsonify({'status': 'error', 'message': message})
 
 
+def _auto_add_template(backend, user_id, embedding, quality):
+    """
+    Simpan probe presensi sebagai template baru jika sangat mirip dengan
+    template yang sudah ada, agar galeri mengikuti perubahan wajah/kamera.
+    Batasnya diturunkan dari threshold galeri saat ini (mentah atau basis).
+    """
+    threshold = gallery_threshold(backend.threshold)
+    cutoff = threshold + (1.0 - threshold) * current_app.config['FACE_TEMPLATE_AUTO_ADD_MARGIN']
+    similarity = face_gallery.score_user(project_for_gallery(embedding), user_id)
+    if similarity is None or similarity < cutoff:
+        return
+    encoding, landmarks = encode_template(embedding, backend.backend_id)
+    add_template(user_id, encoding, quality, TEMPLATE_SOURCE_ATTENDANCE,
+                 limit=current_app.config['FACE_TEMPLATE_LIMIT'], landmarks=landmarks)
+    db.session.commit()
+    face_gallery.publish_snapshot()
+
+
+@main.route('/kiosk/stream', methods=['POST'])
+@login_required
+def kiosk_stream():
+    """
+    Stream frame dari kamera kiosk (lihat kiosk.py dan kiosk_client.py).
+    Respons berupa NDJSON yang dikirim selama stream berjalan.
+    """
+    if not current_user.is_admin:
+        abort(403)
+    matakuliah_id = request.args.get('course', type=int)
+    if not matakuliah_id or db.session.get(MataKuliah, matakuliah_id) is None:
+        return jsonify({'status': 'error', 'message': 'Mata kuliah tidak ditemukan.'}), 400
+
+    session = KioskSession(
+        matakuliah_id,
+        threshold=get_backend().threshold,
+        votes_needed=current_app.config['KIOSK_VOTES_NEEDED'],
+        max_samples=current_app.config['KIOSK_MAX_SAMPLES'],
+    )
+    events = stream_events(session, request.stream, current_app.config['KIOSK_MAX_BACKLOG'])
+    return Response(stream_with_context(events), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
+
+
 @main.route('/register_face')
 @login_required
 def register_face():
@@ -109,27 +252,38 @@ def register_face():
 @main.route('/save_face', methods=['POST'])
 @login_required
 def save_face():
-    data = request.get_json()
-    if 'image_data' not in data:
+    try:
+        with stage('read_upload'):
+            img_bytes, _ = read_capture_upload(request)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Format data gambar tidak valid.'})
+    if not img_bytes:
         return jsonify({'status': 'error', 'message': 'Data gambar tidak ditemukan.'})
 
+    backend = get_backend()
     try:
-        image_data = data['image_data'].split(',')[1]
-        img_bytes = base64.b64decode(image_data)
-        np_arr = np.frombuffer(img_bytes, np.uint8)
-        frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        with stage('recognition'):
+            encoding, quality = recognition_executor.submit(embedding_from_image_bytes, img_bytes, backend.name)
+    except RecognitionBusy as e:
+        return _busy_response(e)
     except Exception:
         return jsonify({'status': 'error', 'message': 'Format data gambar tidak valid.'})
-
-    encoding = generate_encoding_from_image(rgb_frame)
     
     if encoding is None:
         return jsonify({'status': 'error', 'message': 'Gagal memproses wajah. Pastikan hanya ada SATU wajah di foto dan terlihat jelas.'})
 
-    user = User.query.get(current_user.id)
-    user.face_encoding = pickle.dumps(encoding)
-    db.session.commit()
+    # Template disimpan pada basis landmark yang sedang dipakai galeri
+    with stage('gallery_sync'):
+        face_gallery.sync()
+    with stage('db_commit'):
+        # Pendaftaran ulang menambah template; yang tertua dibuang jika melebihi
+        # batas. Id backend tersimpan di header blob sebagai asal template.
+        encoding, landmarks = encode_template(encoding, backend.backend_id)
+        add_template(current_user.id, encoding, quality, TEMPLATE_SOURCE_ENROLL,
+                     limit=current_app.config['FACE_TEMPLATE_LIMIT'], landmarks=landmarks)
+        db.session.commit()
+    with stage('gallery_snapshot'):
+        face_gallery.publish_snapshot()
 
     flash("Wajah Anda berhasil didaftarkan!", "success")
     return jsonify({'status': 'success', 'message': 'Wajah berhasil didaftarkan! Anda akan diarahkan ke halaman utama.'})
@@ -0,0 +1,214 @@
+"""
+Timer per tahap dan histogram sederhana untuk endpoint /metrics (format teks
+Prometheus).
+
+Histogram disimpan di memori setiap proses worker. Durasi tahap juga
+dikumpulkan per request (thread-local) sehingga request yang lambat bisa
+dicatat beserta rinciannya. Tahap yang berjalan di proses pengenalan wajah
+dikirim balik oleh recognition_executor dan digabung di proses web.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# Batas bucket dalam detik (durasi) dan dalam skor (cosine similarity)
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SCORE_BUCKETS = tuple(round(0.05 * step, 2) for step in range(1, 21))
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+_local = threading.local()
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # Dipanggil dengan lock registry yang sudah dipegang
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, name, labels, value, buckets=DURATION_BUCKETS):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def increment(self, name, labels=None, amount=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render(self, gauges=(), totals=()):
+        """
+        Seluruh metrik dalam format teks Prometheus. `gauges` dan `totals`
+        (counter yang nilainya dibaca dari tempat lain) berisi (nama, help,
+        nilai) yang dihitung saat scrape.
+        """
+        with self._lock:
+            histograms = sorted((key, (h.buckets, list(h.counts), h.sum, h.count))
+                                for key, h in self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        lines, declared = [], set()
+        for name, help_text, value in gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+        for name, help_text, value in totals:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {value}"]
+
+        for (name, labels), value in counters:
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+metrics = MetricsRegistry()
+
+
+def record_stage(name, seconds):
+    metrics.observe('hadirku_stage_seconds', {'stage': name}, seconds)
+    breakdown = getattr(_local, 'breakdown', None)
+    if breakdown is not None:
+        breakdown[name] = breakdown.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name):
+    """
+    Ukur durasi satu tahap: `with stage('decode'): ...`
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def record_match_score(mode, similarity):
+    if similarity is not None:
+        metrics.observe('hadirku_match_score', {'mode': mode}, float(similarity), SCORE_BUCKETS)
+
+
+@contextmanager
+def collect_stages():
+    """
+    Kumpulkan durasi tahap di thread ini ke dict yang di-yield. Dipakai di
+    proses worker pengenalan agar rinciannya bisa dikirim ke proses web.
+    """
+    previous = getattr(_local, 'breakdown', None)
+    _local.breakdown = breakdown = {}
+    try:
+        yield breakdown
+    finally:
+        _local.breakdown = previous
+
+
+def merge_stages(breakdown):
+    for name, seconds in breakdown.items():
+        record_stage(name, seconds)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    metrics.observe('hadirku_db_query_seconds', {}, time.perf_counter() - context._query_started)
+    breakdown = getattr(_local, 'breakdown', None)
+    if breakdown is not None:
+        _local.query_count = getattr(_local, 'query_count', 0) + 1
+
+
+def init_app(app, db):
+    """
+    Pasang hook request (durasi, jumlah query, log request lambat) dan
+    listener query SQLAlchemy.
+    """
+    from sqlalchemy import event
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', _after_cursor_execute)
+
+    slow_request_seconds = app.config['SLOW_REQUEST_MS'] / 1000
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_started = time.perf_counter()
+        _local.breakdown = {}
+        _local.query_count = 0
+
+    def _record_request(endpoint, duration):
+        query_count = getattr(_local, 'query_count', 0)
+        metrics.observe('hadirku_request_seconds', {'endpoint': endpoint}, duration)
+        metrics.observe('hadirku_request_db_queries', {'endpoint': endpoint}, query_count, QUERY_COUNT_BUCKETS)
+        return query_count
+
+    @app.after_request
+    def _finish_request_timer(response):
+        started = g.pop('request_started', None)
+        if started is None:
+            return response
+        endpoint = request.endpoint or 'unknown'
+        metrics.increment('hadirku_requests_total', {'endpoint': endpoint, 'status': response.status_code})
+
+        if response.is_streamed:
+            # Body stream (kiosk, ekspor CSV) baru dijalankan setelah hook ini,
+            # jadi durasi dicatat saat respons ditutup. Stream yang lama bukan
+            # tanda request lambat, jadi tidak ikut log request lambat.
+            response.call_on_close(lambda: _record_request(endpoint, time.perf_counter() - started))
+            return response
+
+        duration = time.perf_counter() - started
+        query_count = _record_request(endpoint, duration)
+        if slow_request_seconds and duration >= slow_request_seconds:
+            stages = ', '.join(f"{name}={seconds * 1000:.1f}ms"
+                               for name, seconds in (getattr(_local, 'breakdown', None) or {}).items())
+            logger.warning("Request lambat %s %s: %.1fms, %d query DB [%s]",
+                           request.method, request.path, duration * 1000, query_count, stages or '-')
+        return response
+
+    @app.teardown_request
+    def _clear_request_timer(exc):
+        _local.breakdown = None
@@ -0,0 +1,83 @@
+import argparse
+
+from app import create_app, db
+from models import User, FaceTemplate
+from embedding_codec import is_legacy, load_embedding, encode_embedding, BACKEND_MEDIAPIPE
+from face_gallery import face_gallery, record_face_change
+
+
+def _migrate_table(model, column, owner, batch_size, dry_run):
+    """
+    Konversi satu kolom embedding per batch. `owner` adalah kolom user_id
+    untuk mencatat perubahan galeri. Mengembalikan (dikonversi, dilewati, gagal).
+    """
+    converted = skipped = failed = 0
+    last_id = 0
+
+    while True:
+        # Keyset per ID supaya tiap batch hanya membaca baris berikutnya
+        batch = db.session.query(model.id, owner, column).filter(
+            model.id > last_id,
+            column.isnot(None)
+        ).order_by(model.id).limit(batch_size).all()
+        if not batch:
+            break
+        last_id = batch[-1][0]
+
+        updates, changed = [], set()
+        for row_id, user_id, blob in batch:
+            if not is_legacy(blob):
+                skipped += 1
+                continue
+            header, vector = load_embedding(blob)
+            if header is None or header.backend is None:
+                print(f"  ! {model.__tablename__} {row_id}: encoding tidak dapat dibaca, dilewati.")
+                failed += 1
+                continue
+            updates.append({
+                'id': row_id,
+                column.key: encode_embedding(
+                    vector, header.backend, normalize=header.backend == BACKEND_MEDIAPIPE
+                ),
+            })
+            changed.add(user_id)
+
+        if updates and not dry_run:
+            db.session.bulk_update_mappings(model, updates)
+            for user_id in changed:
+                record_face_change(user_id)
+            db.session.commit()
+        converted += len(updates)
+        print(f"  {model.__tablename__}: batch sampai ID {last_id}: {len(updates)} dikonversi")
+
+    return converted, skipped, failed
+
+
+def migrate_embeddings(batch_size=500, dry_run=False):
+    """
+    Script command-line untuk mengubah face_encoding pickle lama (di tabel
+    user dan face_template) menjadi format biner berheader (lihat
+    embedding_codec.py), per batch.
+    """
+    app = create_app(warmup=False)
+    with app.app_context():
+        print("--- Migrasi Face Encoding ke Format Biner ---")
+        converted = skipped = failed = 0
+        for model, column, owner in ((User, User.face_encoding, User.id),
+                                     (FaceTemplate, FaceTemplate.encoding, FaceTemplate.user_id)):
+            counts = _migrate_table(model, column, owner, batch_size, dry_run)
+            converted, skipped, failed = converted + counts[0], skipped + counts[1], failed + counts[2]
+
+        if converted and not dry_run:
+            face_gallery.save_snapshot()
+
+        label = "akan dikonversi" if dry_run else "dikonversi"
+        print(f"\nSelesai: {converted} {label}, {skipped} sudah format baru, {failed} gagal.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Migrasi face_encoding pickle ke format biner.")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true', help="Hanya hitung, tanpa menulis ke database.")
+    args = parser.parse_args()
+    migrate_embeddings(batch_size=args.batch_size, dry_run=args.dry_run)
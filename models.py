@@ -1,10 +1,19 @@
 from flask_login import UserMixin
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import deferred
 
 # Inisialisasi db di sini
 db = SQLAlchemy()
 
+# Relasi many-to-many mahasiswa <-> mata kuliah yang diikuti
+course_enrollment = db.Table(
+    'course_enrollment',
+    db.Column('user_id', db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('matakuliah_id', db.Integer, db.ForeignKey('mata_kuliah.id', ondelete='CASCADE'), primary_key=True, index=True),
+)
+
 class User(UserMixin, db.Model):
     __tablename__ = 'user'
     id = db.Column(db.Integer, primary_key=True)
@@ -12,10 +21,23 @@ class User(UserMixin, db.Model):
     password = db.Column(db.String(200), nullable=False)
     is_admin = db.Column(db.Boolean, nullable=False, default=False)
     
-    # Kolom untuk menyimpan data encoding wajah (vektor 128-dimensi)
-    face_encoding = db.Column(db.LargeBinary, nullable=True)
+    # Kolom untuk menyimpan data encoding wajah (vektor 128-dimensi).
+    # Deferred: blob hanya dibaca jika atributnya benar-benar diakses.
+    # Berisi template pendaftaran terakhir; galeri membaca tabel face_template.
+    face_encoding = deferred(db.Column(db.LargeBinary, nullable=True))
+    # Penanda murah "sudah punya encoding", diisi otomatis saat face_encoding di-set
+    has_face = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     
     records = db.relationship('AttendanceRecord', back_populates='user', lazy='dynamic')
+    courses = db.relationship('MataKuliah', secondary=course_enrollment, back_populates='students')
+    templates = db.relationship('FaceTemplate', back_populates='user', cascade='all, delete-orphan')
+
+    def __str__(self):
+        return self.name
+
+@event.listens_for(User.face_encoding, 'set')
+def _sync_has_face(target, value, oldvalue, initiator):
+    target.has_face = value is not None
 
 class MataKuliah(db.Model):
     __tablename__ = 'mata_kuliah'
@@ -24,6 +46,10 @@ class MataKuliah(db.Model):
     nama_mk = db.Column(db.String(100), nullable=False)
     dosen_pengampu = db.Column(db.String(100), nullable=False)
     records = db.relationship('AttendanceRecord', back_populates='matakuliah', lazy='dynamic')
+    students = db.relationship('User', secondary=course_enrollment, back_populates='courses')
+
+    def __str__(self):
+        return f"{self.kode_mk} - {self.nama_mk}"
 
 class AttendanceRecord(db.Model):
     __tablename__ = 'attendance_record'
@@ -36,6 +62,117 @@ class AttendanceRecord(db.Model):
     longitude = db.Column(db.Float, nullable=True)
     location = db.Column(db.String(200), nullable=True)
     image_path = db.Column(db.String(200), nullable=False)
+    # Tanggal presensi dalam WIB, disimpan agar cek duplikat bisa memakai index
+    attendance_date = db.Column(db.Date, nullable=True)
 
     user = db.relationship('User', back_populates='records')
     matakuliah = db.relationship('MataKuliah', back_populates='records')
+
+    __table_args__ = (
+        # Satu presensi per mahasiswa per mata kuliah per hari
+        db.Index('uq_attendance_user_course_date', 'user_id', 'matakuliah_id', 'attendance_date', unique=True),
+        # Ekspor dan rekap per mata kuliah dalam rentang tanggal
+        db.Index('ix_attendance_course_date', 'matakuliah_id', 'attendance_date'),
+        # Riwayat per mahasiswa dengan keyset pagination (timestamp, id)
+        db.Index('ix_attendance_user_timestamp_id', 'user_id', 'timestamp', 'id'),
+    )
+
+class AttendanceDailySummary(db.Model):
+    """
+    Rekap harian per (mata kuliah, tanggal WIB, mahasiswa) dengan status
+    'hadir' atau 'absen', untuk streak absen per mahasiswa. Baris 'absen'
+    dibuat untuk peserta terdaftar pada presensi pertama di hari kuliah dan
+    diselaraskan lagi jika daftar peserta berubah di hari itu.
+    """
+    __tablename__ = 'attendance_daily_summary'
+    matakuliah_id = db.Column(db.Integer, db.ForeignKey('mata_kuliah.id', ondelete='CASCADE'), primary_key=True)
+    summary_date = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    status = db.Column(db.String(10), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_summary_user_course_date', 'user_id', 'matakuliah_id', 'summary_date'),
+    )
+
+class AttendanceSessionSummary(db.Model):
+    """
+    Penghitung per hari kuliah (mata kuliah, tanggal WIB): jumlah peserta
+    terdaftar, jumlah hadir, dan jumlah hadir yang terdaftar. Diperbarui di
+    transaksi yang sama dengan presensinya; tingkat kehadiran dan heatmap
+    dashboard hanya membaca tabel ini.
+    """
+    __tablename__ = 'attendance_session_summary'
+    matakuliah_id = db.Column(db.Integer, db.ForeignKey('mata_kuliah.id', ondelete='CASCADE'), primary_key=True)
+    summary_date = db.Column(db.Date, primary_key=True)
+    enrolled_count = db.Column(db.Integer, nullable=False, default=0)
+    present_count = db.Column(db.Integer, nullable=False, default=0)
+    enrolled_present_count = db.Column(db.Integer, nullable=False, default=0)
+
+class FaceTemplate(db.Model):
+    """
+    Satu embedding wajah milik user. Seorang mahasiswa bisa punya beberapa
+    template (berkacamata, pencahayaan atau kamera berbeda); pencocokan
+    memakai similarity tertinggi di antara template-nya.
+    """
+    __tablename__ = 'face_template'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    # Blob berformat embedding_codec yang dibaca galeri (revisi di header =
+    # versi basis landmark, 0 = vektor mentah)
+    encoding = deferred(db.Column(db.LargeBinary, nullable=False))
+    # Landmark mentah jika encoding sudah diproyeksikan, agar bisa diproyeksi
+    # ulang dengan basis baru; None jika encoding sendiri masih mentah
+    landmarks = deferred(db.Column(db.LargeBinary, nullable=True))
+    # Confidence detector wajah saat foto diambil (0-1), None untuk data lama
+    quality = db.Column(db.Float, nullable=True)
+    # 'enroll' (pendaftaran wajah) atau 'attendance' (ditambahkan otomatis dari presensi)
+    source = db.Column(db.String(20), nullable=False, default='enroll')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    user = db.relationship('User', back_populates='templates')
+
+    __table_args__ = (
+        db.Index('ix_face_template_user_created', 'user_id', 'created_at'),
+    )
+
+class EmbeddingBasis(db.Model):
+    """
+    Basis normalisasi landmark (bentuk kanonik + PCA opsional). ID adalah
+    versi basis yang ditulis di header embedding; baris tidak pernah diubah.
+    """
+    __tablename__ = 'embedding_basis'
+    id = db.Column(db.Integer, primary_key=True)
+    dim = db.Column(db.Integer, nullable=False)
+    sample_count = db.Column(db.Integer, nullable=False)
+    explained_variance = db.Column(db.Float, nullable=True)
+    # Threshold cosine di ruang basis ini (None = threshold bawaan backend)
+    threshold = db.Column(db.Float, nullable=True)
+    # Array numpy (np.savez)
+    data = deferred(db.Column(db.LargeBinary, nullable=False))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class FaceGalleryEvent(db.Model):
+    """
+    Log perubahan data wajah dan peserta mata kuliah. ID yang terus bertambah
+    dipakai sebagai nomor generasi galeri, sehingga setiap worker dapat
+    mendeteksi bahwa galerinya basi dan hanya memuat ulang delta-nya.
+    """
+    __tablename__ = 'face_gallery_event'
+    id = db.Column(db.Integer, primary_key=True)
+    # Sengaja tanpa ForeignKey: event tetap ada walaupun user sudah dihapus.
+    # Event wajah mengisi user_id, event peserta kuliah mengisi matakuliah_id;
+    # event tanpa keduanya berarti seluruh galeri harus dimuat ulang.
+    user_id = db.Column(db.Integer, nullable=True)
+    matakuliah_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UserIdentityEvent(db.Model):
+    """
+    Log perubahan identitas user (nama, status admin, wajah terdaftar) atau
+    user yang dihapus, agar cache identitas di worker lain membuang entrinya.
+    """
+    __tablename__ = 'user_identity_event'
+    id = db.Column(db.Integer, primary_key=True)
+    # Tanpa ForeignKey, sama seperti FaceGalleryEvent
+    user_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
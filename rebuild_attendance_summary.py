@@ -0,0 +1,18 @@
+from app import create_app
+from attendance_summary import rebuild_summary
+
+
+def rebuild_attendance_summary():
+    """
+    Script command-line untuk menghitung ulang tabel rekap harian presensi
+    (mis. setelah daftar peserta mata kuliah diubah).
+    """
+    app = create_app(warmup=False)
+    with app.app_context():
+        print("--- Membangun Ulang Rekap Presensi Harian ---")
+        present, absent = rebuild_summary()
+        print(f"Selesai: {present} baris hadir, {absent} baris absen.")
+
+
+if __name__ == '__main__':
+    rebuild_attendance_summary()
@@ -0,0 +1,247 @@
+"""
+Antarmuka bersama untuk engine pengenalan wajah dan registry-nya.
+
+Setiap backend menyediakan deteksi, ekstraksi embedding (satu atau banyak
+gambar, atau potongan wajah untuk mode kelas dan kiosk), fungsi skor, dan
+threshold bawaannya sendiri. Backend yang aktif
+dipilih lewat config RECOGNITION_BACKEND; modul engine-nya baru di-import
+saat dipakai, sehingga dependensi engine lain (mis. face_recognition/dlib)
+tidak wajib terpasang.
+
+Skor selalu berupa cosine similarity antar vektor ter-normalisasi L2, sama
+dengan yang dihitung galeri wajah, jadi threshold setiap backend dinyatakan
+dalam skala tersebut. Id backend ikut tersimpan di header setiap blob
+embedding (lihat embedding_codec.py).
+"""
+import importlib
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+
+import cv2
+import numpy as np
+
+from image_io import decode_image
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# nama -> (modul, kelas); nama sama dengan embedding_codec.BACKEND_NAMES
+_REGISTRY = {
+    'mediapipe': ('face_utils_mediapipe', 'MediaPipeBackend'),
+    'face_recognition': ('face_utils', 'FaceRecognitionBackend'),
+}
+
+DEFAULT_BACKEND = 'mediapipe'
+
+# Sisi potongan wajah pada mode kelas, relatif terhadap sisi terpanjang kotak
+# deteksi, sehingga proporsi wajah di potongan mirip foto selfie saat daftar
+CLASSROOM_CROP_SCALE = 2.5
+CLASSROOM_CROP_SIZE = 256
+
+_instances = {}
+_active = DEFAULT_BACKEND
+_lock = threading.Lock()
+
+
+class RecognitionBackend(ABC):
+    """
+    Kelas dasar backend. Subkelas wajib mengisi name, backend_id, dim,
+    threshold, dan mengimplementasikan detect() serta embed(); backend yang
+    belum lengkap sudah gagal saat dibuat, bukan di tengah request.
+    """
+    name = None
+    # Id backend di header blob embedding
+    backend_id = None
+    dim = None
+    # Batas cosine similarity untuk dianggap cocok
+    threshold = None
+    # Pesan error warmup terakhir (None jika belum/berhasil)
+    warmup_error = None
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.warmup_seconds = None
+
+    @abstractmethod
+    def detect(self, image_rgb):
+        """
+        Kotak relatif (xmin, ymin, width, height) semua wajah di gambar RGB.
+        """
+
+    @abstractmethod
+    def embed(self, image_rgb):
+        """
+        Embedding satu wajah dari gambar RGB. Mengembalikan (embedding,
+        jumlah wajah, kualitas); embedding None jika jumlah wajah bukan 1.
+        """
+
+    def detect_faces(self, image_rgb):
+        """
+        Deteksi untuk foto kelas dan frame kiosk (wajah bisa kecil/jauh).
+        Backend dengan detector jarak jauh dapat menimpa method ini.
+        """
+        return self.detect(image_rgb)
+
+    def embed_crop(self, crop):
+        """
+        Embedding dari potongan wajah hasil crop_face, atau None jika wajah
+        di potongan tidak terbaca.
+        """
+        embedding, _, _ = self.embed(crop)
+        return embedding
+
+    def embed_batch(self, images_rgb):
+        """
+        Seperti embed() untuk banyak gambar. Backend yang punya inferensi
+        batch dapat menimpa method ini.
+        """
+        return [self.embed(image_rgb) for image_rgb in images_rgb]
+
+    def score(self, probes, gallery):
+        """
+        Matriks cosine similarity (probe x galeri).
+        """
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        gallery = np.atleast_2d(np.asarray(gallery, dtype=np.float32))
+        return _normalize(probes) @ _normalize(gallery).T
+
+    def _warmup(self):
+        self.embed(np.zeros((480, 640, 3), dtype=np.uint8))
+
+    def warmup(self):
+        """
+        Muat model dan jalankan satu gambar kosong sebelum request pertama.
+        Jika gagal, error dicatat ke log dan warmup_error lalu dilempar ulang.
+        """
+        started = time.perf_counter()
+        try:
+            self._warmup()
+        except Exception as e:
+            self.warmup_error = f"{type(e).__name__}: {e}"
+            logger.exception("Warmup backend %s gagal", self.name)
+            raise
+        self.warmup_error = None
+        self.warmup_seconds = time.perf_counter() - started
+        self.ready.set()
+
+    def start_warmup(self):
+        thread = threading.Thread(target=self._quiet_warmup, name='face-model-warmup', daemon=True)
+        thread.start()
+        return thread
+
+    def _quiet_warmup(self):
+        # Untuk background thread: kegagalan sudah dicatat oleh warmup()
+        try:
+            self.warmup()
+        except Exception:
+            pass
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def available_backends():
+    return sorted(_REGISTRY)
+
+
+def configure_backend(name):
+    """
+    Pilih backend aktif untuk proses ini. Melempar ValueError jika nama
+    tidak terdaftar.
+    """
+    global _active
+    if name not in _REGISTRY:
+        raise ValueError(f"Backend pengenalan tidak dikenal: {name} (pilihan: {', '.join(available_backends())})")
+    _active = name
+
+
+def get_backend(name=None):
+    """
+    Instance backend (satu per proses). Tanpa nama, backend aktif yang dipakai.
+    """
+    name = name or _active
+    backend = _instances.get(name)
+    if backend is None:
+        with _lock:
+            backend = _instances.get(name)
+            if backend is None:
+                if name not in _REGISTRY:
+                    raise ValueError(f"Backend pengenalan tidak dikenal: {name}")
+                module_name, class_name = _REGISTRY[name]
+                backend = _instances[name] = getattr(importlib.import_module(module_name), class_name)()
+    return backend
+
+
+def crop_face(image_rgb, box):
+    """
+    Potongan persegi berpusat di wajah, di-resize ke CLASSROOM_CROP_SIZE.
+    `box` relatif (xmin, ymin, width, height). Bagian yang keluar dari frame
+    diisi hitam agar wajah tetap di tengah.
+    """
+    height, width = image_rgb.shape[:2]
+    xmin, ymin, box_width, box_height = box
+    center_x = (xmin + box_width / 2) * width
+    center_y = (ymin + box_height / 2) * height
+    half = max(box_width * width, box_height * height) * CLASSROOM_CROP_SCALE / 2
+    left, top = int(round(center_x - half)), int(round(center_y - half))
+    right, bottom = int(round(center_x + half)), int(round(center_y + half))
+
+    crop = image_rgb[max(top, 0):min(bottom, height), max(left, 0):min(right, width)]
+    if not crop.size:
+        return None
+    crop = cv2.copyMakeBorder(crop, max(-top, 0), max(bottom - height, 0), max(-left, 0), max(right - width, 0),
+                              cv2.BORDER_CONSTANT, value=0)
+    return cv2.resize(crop, (CLASSROOM_CROP_SIZE, CLASSROOM_CROP_SIZE), interpolation=cv2.INTER_AREA)
+
+
+def embedding_from_image_bytes(img_bytes, backend_name=None, max_width=640):
+    """
+    Decode bytes gambar lalu hasilkan (embedding, kualitas) dengan backend
+    yang diminta. Fungsi top-level agar bisa dijalankan di proses worker
+    recognition_executor. Melempar ValueError jika bytes bukan gambar valid.
+    """
+    backend = get_backend(backend_name)
+    with stage('decode'):
+        frame = decode_image(img_bytes, target_width=max_width)
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    with stage('resize'):
+        if rgb_frame.shape[1] > max_width:
+            scale = max_width / rgb_frame.shape[1]
+            rgb_frame = cv2.resize(rgb_frame, (max_width, int(rgb_frame.shape[0] * scale)))
+    embedding, _, quality = backend.embed(rgb_frame)
+    return embedding, quality
+
+
+def embedding_from_crop(crop, backend_name=None):
+    """
+    Embedding satu potongan wajah (kiosk). Fungsi top-level agar bisa
+    dijalankan di proses worker recognition_executor.
+    """
+    return get_backend(backend_name).embed_crop(crop)
+
+
+def classroom_faces_from_image_bytes(img_bytes, backend_name=None, max_width=1920):
+    """
+    Deteksi semua wajah di satu foto kelas, lalu hitung embedding setiap
+    wajah dari potongannya. Foto di-decode pada resolusi yang cukup besar
+    agar wajah di barisan belakang masih terdeteksi. Mengembalikan list
+    (embedding, kotak relatif); embedding None jika wajah tidak terbaca.
+    """
+    backend = get_backend(backend_name)
+    with stage('decode'):
+        frame = decode_image(img_bytes, target_width=max_width)
+        if frame.shape[1] > max_width:
+            scale = max_width / frame.shape[1]
+            frame = cv2.resize(frame, (max_width, int(frame.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    faces = []
+    for box in backend.detect_faces(rgb_frame):
+        crop = crop_face(rgb_frame, box)
+        faces.append((backend.embed_crop(crop) if crop is not None else None, box))
+    return faces
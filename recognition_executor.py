@@ -0,0 +1,166 @@
+"""
+Executor untuk pekerjaan pengenalan wajah yang berat (decode, resize,
+inferensi MediaPipe) di luar thread request Flask.
+
+Pekerjaan dijalankan di process pool berukuran tetap. Setiap proses worker
+memuat model backend pengenalan sekali di initializer lalu memakainya terus. Jumlah
+pekerjaan yang sedang antre atau berjalan dibatasi; jika penuh, submit()
+langsung melempar RecognitionBusy agar endpoint bisa membalas 503 daripada
+menahan thread request.
+"""
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import merge_stages
+
+
+class RecognitionBusy(Exception):
+    """
+    Antrean pengenalan penuh; klien sebaiknya mencoba lagi setelah
+    `retry_after` detik.
+    """
+
+    def __init__(self, retry_after):
+        super().__init__("Antrean pengenalan wajah penuh.")
+        self.retry_after = retry_after
+
+
+def _init_worker(backend_name):
+    # Satu pasangan detector+mesh per proses worker, di-warmup sebelum job pertama
+    from face_utils_mediapipe import face_model_pool, detection_model_pool
+    from recognition_backends import configure_backend, get_backend
+    face_model_pool.configure(1)
+    detection_model_pool.configure(1)
+    configure_backend(backend_name)
+    get_backend().warmup()
+
+
+def _run_job(fn, args):
+    # Waktu mulai dikirim balik untuk menghitung lama job menunggu di antrean
+    return time.time(), fn(*args)
+
+
+def _run_pooled_job(fn, args):
+    # Rincian tahap di proses worker dikirim balik untuk histogram proses web
+    from metrics import collect_stages
+    with collect_stages() as breakdown:
+        started_at, result = _run_job(fn, args)
+    return started_at, result, breakdown
+
+
+class RecognitionExecutor:
+
+    def __init__(self):
+        self.workers = 0
+        self.max_queue = 16
+        self.timeout = 30
+        self.retry_after = 2
+        self.backend = 'mediapipe'
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(self.max_queue)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def configure(self, workers=0, max_queue=16, timeout=30, retry_after=2, backend='mediapipe'):
+        """
+        workers=0 berarti pekerjaan dijalankan langsung di thread request,
+        tetapi batas antrean tetap berlaku. `backend` adalah nama backend
+        pengenalan yang di-warmup di setiap proses worker.
+        """
+        self.workers = max(int(workers), 0)
+        self.max_queue = max(int(max_queue), 1)
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.backend = backend
+        self._slots = threading.BoundedSemaphore(self.max_queue)
+
+    def _get_pool(self):
+        # Pool dibuat malas di proses yang memakainya (bukan sebelum fork)
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_init_worker,
+                        initargs=(self.backend,),
+                    )
+        return self._pool
+
+    def submit(self, fn, *args):
+        """
+        Jalankan fn(*args) dan tunggu hasilnya. fn harus fungsi top-level
+        yang bisa di-pickle jika process pool aktif.
+        """
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise RecognitionBusy(self.retry_after)
+
+        submitted_at = time.time()
+        with self._lock:
+            self._in_flight += 1
+        release_later = False
+        try:
+            if self.workers:
+                future = self._get_pool().submit(_run_pooled_job, fn, args)
+                try:
+                    started_at, result, breakdown = future.result(timeout=self.timeout)
+                    merge_stages(breakdown)
+                except FutureTimeout:
+                    # Job yang belum mulai dibatalkan; job yang sudah berjalan tetap
+                    # memegang slot sampai selesai, agar batas antrean tetap nyata
+                    if not future.cancel():
+                        release_later = True
+                        future.add_done_callback(lambda _: self._release(slots))
+                    raise RecognitionBusy(self.retry_after)
+                except BrokenProcessPool:
+                    # Proses worker mati (mis. OOM); pool dibuat ulang pada job berikutnya
+                    self._pool = None
+                    raise
+            else:
+                started_at, result = _run_job(fn, args)
+        finally:
+            if not release_later:
+                self._release(slots)
+
+        wait = max(started_at - submitted_at, 0.0)
+        with self._lock:
+            self._completed += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+        return result
+
+    def _release(self, slots):
+        with self._lock:
+            self._in_flight -= 1
+        slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_depth': self._in_flight,
+                'waiting': max(self._in_flight - (self.workers or self._in_flight), 0),
+                'queue_capacity': self.max_queue,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'avg_wait_ms': round(self._total_wait / self._completed * 1000, 2) if self._completed else 0.0,
+                'max_wait_ms': round(self._max_wait * 1000, 2),
+            }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+recognition_executor = RecognitionExecutor()
@@ -0,0 +1,304 @@
+"""
+Proyeksikan ulang semua template MediaPipe ke basis landmark (lihat
+landmark_basis.py): landmark di-align ke bentuk wajah kanonik dan, jika
+--components > 0, direduksi dengan PCA yang di-fit pada galeri. Contoh:
+
+    python reproject_embeddings.py                    # fit basis baru, 96 dimensi
+    python reproject_embeddings.py --components 0     # hanya align, tanpa PCA
+    python reproject_embeddings.py --basis 3          # pakai ulang basis versi 3
+    python reproject_embeddings.py --basis 0          # kembali ke vektor mentah
+    python reproject_embeddings.py --dry-run          # fit dan laporkan saja
+    python reproject_embeddings.py --target-far 0.01  # threshold dengan FAR 1%
+
+Vektor mentah setiap template disimpan di face_template.landmarks, sehingga
+perintah ini bisa dijalankan ulang dengan basis lain kapan saja. Sebaiknya
+dijalankan saat sepi: galeri di setiap worker baru berpindah ke basis baru
+setelah semua template selesai ditulis.
+"""
+import argparse
+
+import numpy as np
+
+from app import create_app, db
+from models import FaceTemplate
+from embedding_codec import load_embedding, encode_embedding, BACKEND_MEDIAPIPE, BACKEND_DIMS
+from face_gallery import face_gallery, record_face_change, record_gallery_reset
+from face_utils_mediapipe import MATCH_THRESHOLD
+from landmark_basis import LandmarkBasis, save_basis, load_basis
+
+# Jumlah pasangan acak untuk kalibrasi threshold
+_CALIBRATION_PAIRS = 200000
+
+# Threshold yang meloloskan impostor sebanyak ini (atau lebih) tidak disimpan
+MAX_FAR = 0.5
+_IN_CHUNK = 500
+
+
+def _raw_vector(encoding, landmarks):
+    """
+    Vektor landmark mentah sebuah template, atau None jika bukan template
+    MediaPipe atau vektor mentahnya tidak tersimpan.
+    """
+    header, vector = load_embedding(landmarks if landmarks is not None else encoding)
+    if header is None or header.backend != BACKEND_MEDIAPIPE or header.revision:
+        return None
+    if vector.shape[0] != BACKEND_DIMS[BACKEND_MEDIAPIPE]:
+        return None
+    return vector
+
+
+def _sample_templates(sample_size, seed):
+    """
+    (user_ids, matriks vektor mentah) dari sampel acak template untuk fit
+    basis dan kalibrasi threshold.
+    """
+    template_ids = np.array([template_id for (template_id,) in db.session.query(FaceTemplate.id)], dtype=np.int64)
+    if len(template_ids) > sample_size:
+        template_ids = np.random.default_rng(seed).choice(template_ids, sample_size, replace=False)
+
+    user_ids, vectors = [], []
+    template_ids = template_ids.tolist()
+    for start in range(0, len(template_ids), _IN_CHUNK):
+        rows = db.session.query(FaceTemplate.user_id, FaceTemplate.encoding, FaceTemplate.landmarks).filter(
+            FaceTemplate.id.in_(template_ids[start:start + _IN_CHUNK])
+        ).all()
+        for user_id, encoding, landmarks in rows:
+            vector = _raw_vector(encoding, landmarks)
+            if vector is not None:
+                user_ids.append(user_id)
+                vectors.append(vector)
+    if not vectors:
+        return np.empty(0, dtype=np.int64), np.empty((0, BACKEND_DIMS[BACKEND_MEDIAPIPE]), dtype=np.float32)
+    return np.asarray(user_ids, dtype=np.int64), np.vstack(vectors)
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _pair_scores(matrix, left, right):
+    return np.einsum('ij,ij->i', matrix[left], matrix[right])
+
+
+def calibrate_threshold(basis, user_ids, vectors, target_far=0.001, threshold=MATCH_THRESHOLD, seed=0):
+    """
+    Threshold di ruang basis yang meloloskan `target_far` dari pasangan
+    template acak milik user berbeda (impostor). Skor genuine (template
+    berurutan milik user yang sama) dipakai untuk melaporkan FRR dan
+    memeriksa threshold. FAR `threshold` pada vektor mentah hanya dilaporkan
+    sebagai pembanding. Mengembalikan dict, atau None jika sampel kurang.
+    """
+    rng = np.random.default_rng(seed)
+    left = rng.integers(len(vectors), size=_CALIBRATION_PAIRS)
+    right = rng.integers(len(vectors), size=_CALIBRATION_PAIRS)
+    impostor = user_ids[left] != user_ids[right]
+    if not impostor.any():
+        return None
+
+    raw = _normalize(vectors.astype(np.float32))
+    projected = _normalize(basis.project(vectors))
+    raw_impostor = _pair_scores(raw, left[impostor], right[impostor])
+    impostor_scores = np.sort(_pair_scores(projected, left[impostor], right[impostor]))
+    new_threshold = float(np.quantile(impostor_scores, 1 - target_far))
+
+    # Pasangan genuine: template berurutan milik user yang sama
+    order = np.argsort(user_ids, kind='stable')
+    same = user_ids[order[1:]] == user_ids[order[:-1]]
+    genuine_left, genuine_right = order[:-1][same], order[1:][same]
+    result = {
+        'threshold': new_threshold,
+        'raw_far': float(np.mean(raw_impostor >= threshold)),
+        'impostor_scores': impostor_scores,
+        'genuine_scores': np.sort(_pair_scores(projected, genuine_left, genuine_right)),
+        'genuine_pairs': int(same.sum()),
+    }
+    if same.any():
+        result['frr_raw'] = float(np.mean(_pair_scores(raw, genuine_left, genuine_right) < threshold))
+    return result
+
+
+def threshold_rates(calibration, threshold):
+    """
+    (FAR, FRR) sebuah threshold pada skor kalibrasi; FRR None tanpa pasangan genuine.
+    """
+    impostor, genuine = calibration['impostor_scores'], calibration['genuine_scores']
+    far = 1 - np.searchsorted(impostor, threshold, side='left') / len(impostor)
+    frr = np.searchsorted(genuine, threshold, side='left') / len(genuine) if len(genuine) else None
+    return float(far), None if frr is None else float(frr)
+
+
+def threshold_problem(calibration, threshold):
+    """
+    Alasan threshold tidak layak disimpan, atau None jika layak: harus > 0,
+    FAR-nya di bawah MAX_FAR, dan tidak menolak mayoritas pasangan genuine.
+    """
+    if threshold <= 0:
+        return f"threshold {threshold:.4f} tidak positif"
+    if calibration is None:
+        return None
+    far, _ = threshold_rates(calibration, threshold)
+    if far >= MAX_FAR:
+        return f"threshold {threshold:.4f} meloloskan {far * 100:.1f}% pasangan impostor"
+    genuine = calibration['genuine_scores']
+    if len(genuine) and threshold > float(np.median(genuine)):
+        return (f"threshold {threshold:.4f} di atas median skor genuine ({float(np.median(genuine)):.4f}), "
+                "mayoritas wajah yang benar akan ditolak")
+    return None
+
+
+def _rewrite_batch(batch, basis):
+    """
+    Update encoding/landmarks untuk satu batch template. Mengembalikan
+    (updates, user_ids yang berubah, jumlah dilewati).
+    """
+    items = []
+    for template_id, user_id, encoding, landmarks in batch:
+        vector = _raw_vector(encoding, landmarks)
+        if vector is not None:
+            raw = landmarks if landmarks is not None else encode_embedding(vector, BACKEND_MEDIAPIPE, normalize=True)
+            items.append((template_id, user_id, vector, raw))
+    if not items:
+        return [], set(), len(batch)
+
+    if basis is None:
+        updates = [{'id': template_id, 'encoding': raw, 'landmarks': None} for template_id, _, _, raw in items]
+    else:
+        projected = basis.project(np.vstack([vector for _, _, vector, _ in items]))
+        updates = [
+            {'id': template_id, 'landmarks': raw,
+             'encoding': encode_embedding(row, BACKEND_MEDIAPIPE, normalize=True, revision=basis.version)}
+            for (template_id, _, _, raw), row in zip(items, projected)
+        ]
+    return updates, {user_id for _, user_id, _, _ in items}, len(batch) - len(items)
+
+
+def _rewrite_templates(basis, batch_size, after_id=0, record_changes=False):
+    """
+    Tulis ulang template dengan ID > after_id per batch (keyset). Mengembalikan
+    (ID terakhir, jumlah ditulis, jumlah dilewati).
+    """
+    last_id, written, skipped = after_id, 0, 0
+    while True:
+        batch = db.session.query(FaceTemplate.id, FaceTemplate.user_id, FaceTemplate.encoding,
+                                 FaceTemplate.landmarks).filter(
+            FaceTemplate.id > last_id
+        ).order_by(FaceTemplate.id).limit(batch_size).all()
+        if not batch:
+            break
+        last_id = batch[-1][0]
+
+        updates, changed, batch_skipped = _rewrite_batch(batch, basis)
+        if updates:
+            db.session.bulk_update_mappings(FaceTemplate, updates)
+        if record_changes:
+            for user_id in changed:
+                record_face_change(user_id)
+        db.session.commit()
+        written += len(updates)
+        skipped += batch_skipped
+        print(f"  batch sampai ID {last_id}: {len(updates)} ditulis")
+    return last_id, written, skipped
+
+
+def reproject_embeddings(components=96, basis_version=None, iterations=5, sample_size=50000, batch_size=500,
+                         threshold=None, target_far=0.001, dry_run=False):
+    """
+    Script command-line untuk mem-fit basis landmark pada galeri dan menulis
+    ulang semua template MediaPipe ke basis tersebut.
+    """
+    app = create_app(warmup=False)
+    with app.app_context():
+        print("--- Proyeksi Ulang Embedding Landmark ---")
+        if basis_version == 0:
+            basis = None
+            print("Template dikembalikan ke vektor landmark mentah.")
+        elif basis_version is not None:
+            try:
+                basis = load_basis(basis_version)
+            except LookupError as e:
+                raise SystemExit(str(e))
+            if basis.threshold is not None and basis.threshold <= 0:
+                raise SystemExit(f"Basis versi {basis.version} menyimpan threshold {basis.threshold:.4f} "
+                                 "yang tidak valid; fit basis baru.")
+            print(f"Memakai basis versi {basis.version} (dimensi {basis.dim}).")
+        else:
+            user_ids, vectors = _sample_templates(sample_size, seed=0)
+            if len(vectors) < 2:
+                raise SystemExit("Template MediaPipe dengan vektor mentah terlalu sedikit untuk fit basis.")
+            basis = LandmarkBasis.fit(vectors, components=components, iterations=iterations,
+                                      sample_size=sample_size)
+            explained = '' if basis.explained_variance is None else \
+                f", varians dipertahankan {basis.explained_variance * 100:.1f}%"
+            print(f"Basis di-fit dari {len(vectors)} template: dimensi {basis.dim}{explained}.")
+
+            calibration = calibrate_threshold(basis, user_ids, vectors, target_far=target_far)
+            if calibration is not None:
+                print(f"Threshold mentah {MATCH_THRESHOLD:.3f} meloloskan {calibration['raw_far'] * 100:.2f}% "
+                      f"pasangan impostor acak; threshold basis dikalibrasi ke FAR {target_far * 100:.3f}%.")
+                if calibration['raw_far'] >= MAX_FAR:
+                    print("  (threshold mentah tidak membedakan wajah pada data ini dan tidak dipakai sebagai acuan)")
+            explicit = threshold is not None
+            if threshold is None:
+                if calibration is None:
+                    raise SystemExit("Threshold tidak dapat dikalibrasi (butuh template dari minimal dua user); "
+                                     "berikan --threshold.")
+                threshold = calibration['threshold']
+            problem = threshold_problem(calibration, threshold)
+            if problem:
+                hint = "Pilih --threshold lain." if explicit else "Periksa data galeri atau berikan --threshold."
+                raise SystemExit(f"Basis tidak disimpan: {problem}. {hint}")
+            basis.threshold = threshold
+            if calibration is not None:
+                far, frr = threshold_rates(calibration, threshold)
+                frr_text = '-' if frr is None else f"{frr * 100:.2f}% (mentah {calibration['frr_raw'] * 100:.2f}%)"
+                print(f"Threshold pencocokan untuk basis ini: {threshold:.4f} "
+                      f"(FAR {far * 100:.3f}%, FRR {frr_text} pada {calibration['genuine_pairs']} pasangan genuine)")
+            else:
+                print(f"Threshold pencocokan untuk basis ini: {threshold:.4f}")
+
+            if dry_run:
+                print("\nDry run: basis tidak disimpan dan template tidak diubah.")
+                return
+            save_basis(basis, len(vectors))
+            db.session.commit()
+            print(f"Basis disimpan sebagai versi {basis.version}.")
+
+        if dry_run:
+            print("\nDry run: template tidak diubah.")
+            return
+
+        # Galeri worker tetap memakai basis lama sampai event reset di bawah,
+        # jadi perubahan per user tidak dicatat selama penulisan ulang
+        last_id, written, skipped = _rewrite_templates(basis, batch_size)
+        record_gallery_reset()
+        db.session.commit()
+        # Template yang ditambahkan selama proses di atas masih memakai basis lama
+        _, late, late_skipped = _rewrite_templates(basis, batch_size, after_id=last_id, record_changes=True)
+
+        face_gallery.save_snapshot()
+        print(f"\nSelesai: {written + late} template ditulis, {skipped + late_skipped} dilewati "
+              f"(backend lain atau tanpa vektor mentah). Galeri: dimensi {face_gallery.dim}, "
+              f"basis versi {face_gallery.revision}.")
+        print("Jika memakai indeks ANN, bangun ulang dengan build_ann_index.py.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Proyeksikan ulang embedding landmark ke basis ter-normalisasi.")
+    parser.add_argument('--components', type=int, default=96,
+                        help="Jumlah komponen PCA (0 = hanya align ke bentuk kanonik)")
+    parser.add_argument('--basis', type=int, help="Pakai ulang basis versi ini (0 = kembali ke vektor mentah)")
+    parser.add_argument('--iterations', type=int, default=5, help="Iterasi generalized Procrustes")
+    parser.add_argument('--sample-size', type=int, default=50000, help="Template maksimum untuk fit basis")
+    parser.add_argument('--threshold', type=float, help="Threshold pencocokan basis baru (default: dikalibrasi)")
+    parser.add_argument('--target-far', type=float, default=0.001,
+                        help="FAR pasangan impostor untuk kalibrasi threshold (default 0.001)")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true', help="Fit dan laporkan saja, tanpa menulis ke database.")
+    args = parser.parse_args()
+    if not 0 < args.target_far < 1:
+        parser.error("--target-far harus di antara 0 dan 1")
+    reproject_embeddings(components=args.components, basis_version=args.basis, iterations=args.iterations,
+                         sample_size=args.sample_size, batch_size=args.batch_size, threshold=args.threshold,
+                         target_far=args.target_far, dry_run=args.dry_run)
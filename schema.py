@@ -0,0 +1,101 @@
+"""
+Penyesuaian skema untuk database yang dibuat sebelum kolom/index baru ada.
+db.create_all() hanya membuat tabel yang belum ada, jadi kolom baru di tabel
+lama ditambahkan di sini. Semua langkah aman dijalankan berulang kali.
+"""
+from sqlalchemy import inspect, text
+
+from models import db, AttendanceRecord, FaceTemplate, User
+from timezone_utils import wib_date
+
+_BACKFILL_BATCH = 1000
+
+
+def _column_names(table_name):
+    return {column['name'] for column in inspect(db.engine).get_columns(table_name)}
+
+
+def _backfill_attendance_date():
+    """
+    Isi attendance_date untuk baris lama. Jika sudah ada duplikat di hari yang
+    sama, hanya baris pertama yang diberi tanggal; sisanya tetap NULL supaya
+    unique index tetap bisa dibuat (NULL tidak dianggap sama).
+    """
+    table = AttendanceRecord.__table__
+    seen = set(db.session.query(table.c.user_id, table.c.matakuliah_id, table.c.attendance_date).filter(
+        table.c.attendance_date.isnot(None)
+    ).all())
+
+    last_id, filled = 0, 0
+    while True:
+        rows = db.session.query(table.c.id, table.c.user_id, table.c.matakuliah_id, table.c.timestamp).filter(
+            table.c.attendance_date.is_(None), table.c.id > last_id, table.c.timestamp.isnot(None)
+        ).order_by(table.c.id).limit(_BACKFILL_BATCH).all()
+        if not rows:
+            break
+        updates = []
+        for row_id, user_id, matakuliah_id, timestamp in rows:
+            key = (user_id, matakuliah_id, wib_date(timestamp))
+            if key not in seen:
+                seen.add(key)
+                updates.append({'id': row_id, 'attendance_date': key[2]})
+        if updates:
+            db.session.bulk_update_mappings(AttendanceRecord, updates)
+        db.session.commit()
+        filled += len(updates)
+        last_id = rows[-1][0]
+    return filled
+
+
+def _add_has_face_column():
+    """
+    Tambah User.has_face dan isi dari face_encoding yang sudah ada.
+    """
+    users = User.__table__
+    quoted_table = db.engine.dialect.identifier_preparer.format_table(users)
+    default = db.false().compile(dialect=db.engine.dialect)
+    db.session.execute(text(f"ALTER TABLE {quoted_table} ADD COLUMN has_face BOOLEAN NOT NULL DEFAULT {default}"))
+    db.session.execute(users.update().values(has_face=users.c.face_encoding.isnot(None)))
+    db.session.commit()
+
+
+def _add_column(table, column):
+    quoted_table = db.engine.dialect.identifier_preparer.format_table(table)
+    column_type = column.type.compile(dialect=db.engine.dialect)
+    db.session.execute(text(f"ALTER TABLE {quoted_table} ADD COLUMN {column.name} {column_type}"))
+    db.session.commit()
+
+
+def upgrade_schema():
+    if 'has_face' not in _column_names(User.__table__.name):
+        _add_has_face_column()
+
+    templates = FaceTemplate.__table__
+    if 'landmarks' not in _column_names(templates.name):
+        _add_column(templates, templates.c.landmarks)
+
+    table = AttendanceRecord.__table__
+    if 'attendance_date' not in _column_names(table.name):
+        db.session.execute(text(f"ALTER TABLE {table.name} ADD COLUMN attendance_date DATE"))
+        db.session.commit()
+
+    existing_indexes = {index['name'] for index in inspect(db.engine).get_indexes(table.name)}
+    missing_indexes = [index for index in table.indexes if index.name not in existing_indexes]
+    if missing_indexes:
+        # Backfill hanya perlu sekali, sebelum unique index dibuat
+        filled = _backfill_attendance_date()
+        if filled:
+            print(f"✅ attendance_date diisi untuk {filled} presensi lama")
+        for index in missing_indexes:
+            index.create(db.engine)
+
+    # Tabel rekap harian baru dibuat create_all dalam keadaan kosong
+    from attendance_summary import summary_needs_rebuild, rebuild_summary
+    if summary_needs_rebuild():
+        present, absent = rebuild_summary()
+        print(f"✅ Rekap presensi harian dibangun: {present} hadir, {absent} absen")
+
+    # Database lama hanya punya User.face_encoding; jadikan template pertama
+    from face_templates import templates_need_backfill, backfill_templates
+    if templates_need_backfill():
+        print(f"✅ Template wajah dibuat untuk {backfill_templates()} user lama")
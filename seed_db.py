@@ -2,7 +2,7 @@ from app import create_app, db
 from models import MataKuliah
 import os
 
-app = create_app()
+app = create_app(warmup=False)
 
 with app.app_context():
     # Hapus data lama jika ada
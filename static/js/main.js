@@ -46,40 +46,40 @@ document.addEventListener('DOMContentLoaded', function() {
                     longitude: position.coords.longitude
                 };
 
-                // 2. Ambil gambar dari video
+                // 2. Ambil gambar dari video sebagai JPEG biner (tanpa base64)
                 context.drawImage(video, 0, 0, canvas.width, canvas.height);
-                const imageData = canvas.toDataURL('image/jpeg');
 
-                // 3. Kirim data ke server
-                fetch('/mark_attendance', {
+                canvas.toBlob((blob) => {
+                    const formData = new FormData();
+                    formData.append('image', blob, 'capture.jpg');
+                    formData.append('latitude', location.latitude);
+                    formData.append('longitude', location.longitude);
+                    formData.append('matakuliah_id', selectedCourseId); // Kirim ID mata kuliah
+
+                    // 3. Kirim data ke server
+                    fetch('/mark_attendance', {
                         method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify({
-                            image_data: imageData,
-                            location: location,
-                            matakuliah_id: selectedCourseId // Kirim ID mata kuliah
-                        }),
-                    })
-                    .then(response => response.json())
-                    .then(data => {
-                        if (data.status === 'success') {
-                            Swal.fire('Berhasil!', data.message, 'success')
-                                .then(() => {
-                                    // Redirect ke halaman riwayat setelah presensi berhasil
-                                    window.location.href = '/records';
-                                });
-                        } else if (data.status === 'warning') {
-                            Swal.fire('Info', data.message, 'info');
-                        } else { // status === 'error'
-                            Swal.fire('Gagal!', data.message, 'error');
-                        }
+                        body: formData,
                     })
-                    .catch(error => {
-                        console.error('Error:', error);
-                        Swal.fire('Error', 'Terjadi kesalahan saat berkomunikasi dengan server.', 'error');
-                    });
+                        .then(response => response.json())
+                        .then(data => {
+                            if (data.status === 'success') {
+                                Swal.fire('Berhasil!', data.message, 'success')
+                                    .then(() => {
+                                        // Redirect ke halaman riwayat setelah presensi berhasil
+                                        window.location.href = '/records';
+                                    });
+                            } else if (data.status === 'warning') {
+                                Swal.fire('Info', data.message, 'info');
+                            } else { // status === 'error'
+                                Swal.fire('Gagal!', data.message, 'error');
+                            }
+                        })
+                        .catch(error => {
+                            console.error('Error:', error);
+                            Swal.fire('Error', 'Terjadi kesalahan saat berkomunikasi dengan server.', 'error');
+                        });
+                }, 'image/jpeg');
             },
             (error) => {
                 console.error("Error getting location: ", error);
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """
+    Aplikasi dengan database SQLite sementara, tanpa warmup MediaPipe.
+    """
+    database = tmp_path_factory.mktemp('db') / 'test.db'
+    os.environ['DATABASE_URL'] = f"sqlite:///{database}"
+    from app import create_app
+    app = create_app(warmup=False)
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def session(app):
+    """
+    Session database di dalam app context; tabel template, user dan basis
+    dikosongkan lagi setelah test.
+    """
+    import landmark_basis
+    from models import db, EmbeddingBasis, FaceTemplate, User
+
+    with app.app_context():
+        yield db.session
+        db.session.rollback()
+        db.session.query(FaceTemplate).delete()
+        db.session.query(User).filter(User.is_admin.is_(False)).delete()
+        db.session.query(EmbeddingBasis).delete()
+        db.session.commit()
+        landmark_basis._cache.clear()
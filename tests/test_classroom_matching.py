@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import face_utils_mediapipe
+
+
+class FakeGallery:
+    dim = 2
+
+    def __init__(self, scores):
+        self.scores = np.asarray(scores)
+
+    def sync(self):
+        pass
+
+    def score_matrix(self, embeddings, matakuliah_id=None):
+        return np.array([1, 2]), self.scores
+
+
+@pytest.fixture
+def use_scores(monkeypatch):
+    def install(scores):
+        monkeypatch.setattr(face_utils_mediapipe, 'face_gallery', FakeGallery(scores))
+        monkeypatch.setattr(face_utils_mediapipe, 'project_for_gallery', lambda embedding: embedding)
+        monkeypatch.setattr(face_utils_mediapipe, 'gallery_threshold', lambda threshold: threshold)
+    return install
+
+
+def _match(**kwargs):
+    return face_utils_mediapipe.match_classroom_embeddings([np.zeros(2)] * 2, threshold=0.85, **kwargs)
+
+
+def test_below_threshold_pair_does_not_steal_assignment(use_scores):
+    # Total skor tertinggi (0.86 + 0.80) akan memberi user 1 ke probe 1 yang di bawah threshold
+    use_scores([[0.95, 0.86],
+                [0.80, 0.10]])
+
+    assert _match() == [(0, 1, 0.95)]
+
+
+def test_same_student_in_two_photos_keeps_best_score(use_scores):
+    use_scores([[0.97, 0.88],
+                [0.96, 0.87]])
+
+    assert _match(groups=[0, 1]) == [(0, 1, 0.97)]
+
+
+def test_one_photo_assigns_each_student_once(use_scores):
+    use_scores([[0.97, 0.88],
+                [0.96, 0.87]])
+
+    matches = sorted(_match())
+    assert [user_id for _, user_id, _ in matches] == [1, 2]
+    assert sorted(probe for probe, _, _ in matches) == [0, 1]
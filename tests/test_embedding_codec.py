@@ -0,0 +1,63 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from embedding_codec import (
+    BACKEND_FACE_RECOGNITION, BACKEND_MEDIAPIPE, HEADER_SIZE, EmbeddingFormatError, decode_embedding,
+    decode_header, encode_embedding, is_legacy, load_embedding, stack_payloads,
+)
+
+
+def test_round_trip_keeps_header_and_vector():
+    vector = np.arange(128, dtype=np.float32)
+    blob = encode_embedding(vector, BACKEND_FACE_RECOGNITION, revision=7)
+
+    assert len(blob) == HEADER_SIZE + 128 * 4
+    assert not is_legacy(blob)
+    header, decoded = decode_embedding(blob)
+    assert header.backend == BACKEND_FACE_RECOGNITION
+    assert header.dim == 128
+    assert header.revision == 7
+    assert not header.normalized
+    np.testing.assert_array_equal(decoded, vector)
+
+
+def test_normalize_sets_flag_and_unit_norm():
+    blob = encode_embedding([3.0, 4.0], BACKEND_MEDIAPIPE, normalize=True)
+
+    header, vector = decode_embedding(blob)
+    assert header.normalized
+    np.testing.assert_allclose(vector, [0.6, 0.8], rtol=1e-6)
+
+
+def test_decode_header_rejects_legacy_pickle():
+    blob = pickle.dumps(np.zeros(128))
+
+    assert is_legacy(blob)
+    with pytest.raises(EmbeddingFormatError):
+        decode_header(blob)
+
+
+def test_load_embedding_reads_legacy_pickle():
+    vector = np.linspace(-1, 1, 128)
+
+    header, decoded = load_embedding(pickle.dumps(vector))
+    assert header.backend == BACKEND_FACE_RECOGNITION
+    assert header.dim == 128
+    assert header.revision == 0
+    np.testing.assert_allclose(decoded, vector.astype(np.float32))
+
+
+def test_load_embedding_tolerates_broken_blob():
+    assert load_embedding(None) == (None, None)
+    assert load_embedding(b'bukan pickle') == (None, None)
+
+
+def test_stack_payloads_builds_contiguous_matrix():
+    vectors = np.random.default_rng(0).normal(size=(3, 5)).astype(np.float32)
+    blobs = [encode_embedding(vector, BACKEND_MEDIAPIPE) for vector in vectors]
+
+    matrix = stack_payloads(blobs, 5)
+    assert matrix.shape == (3, 5)
+    np.testing.assert_array_equal(matrix, vectors)
@@ -0,0 +1,102 @@
+import numpy as np
+
+from embedding_codec import BACKEND_DIMS, BACKEND_FACE_RECOGNITION, BACKEND_MEDIAPIPE, encode_embedding
+from face_gallery import _decode_rows, _segment_max, _segment_starts
+from landmark_basis import LandmarkBasis, save_basis
+from models import FaceTemplate, User
+
+RAW_DIM = BACKEND_DIMS[BACKEND_MEDIAPIPE]
+
+
+def test_segment_starts():
+    np.testing.assert_array_equal(_segment_starts(np.array([4, 4, 7, 9, 9, 9])), [0, 2, 3])
+    assert len(_segment_starts(np.array([], dtype=np.int64))) == 0
+
+
+def test_segment_max_1d():
+    user_ids = np.array([4, 4, 7, 9, 9, 9])
+    scores = np.array([0.1, 0.5, 0.3, 0.2, 0.9, 0.4])
+
+    users, best = _segment_max(scores, user_ids)
+    np.testing.assert_array_equal(users, [4, 7, 9])
+    np.testing.assert_allclose(best, [0.5, 0.3, 0.9])
+
+
+def test_segment_max_2d_reduces_per_probe():
+    user_ids = np.array([4, 4, 7])
+    scores = np.array([[0.1, 0.5, 0.3],
+                       [0.8, 0.2, 0.9]])
+
+    users, best = _segment_max(scores, user_ids)
+    np.testing.assert_array_equal(users, [4, 7])
+    np.testing.assert_allclose(best, [[0.5, 0.3], [0.8, 0.9]])
+
+
+def test_decode_rows_raw_revision():
+    rows = [(1, 10, encode_embedding([3.0, 4.0], BACKEND_MEDIAPIPE)),
+            (2, 11, encode_embedding([0.0, 2.0], BACKEND_MEDIAPIPE)),
+            (3, 12, encode_embedding([1.0] * 128, BACKEND_FACE_RECOGNITION)),
+            (4, 13, None)]
+
+    template_ids, user_ids, matrix, revision = _decode_rows(rows, BACKEND_MEDIAPIPE)
+    assert revision == 0
+    np.testing.assert_array_equal(template_ids, [1, 2])
+    np.testing.assert_array_equal(user_ids, [10, 11])
+    np.testing.assert_allclose(matrix, [[0.6, 0.8], [0.0, 1.0]], rtol=1e-6)
+
+
+def _fit_basis(session, rng, components=4):
+    basis = LandmarkBasis.fit(rng.normal(size=(20, RAW_DIM)).astype(np.float32), components=components)
+    version = save_basis(basis, 20)
+    session.commit()
+    return basis, version
+
+
+def _expected(basis, raw):
+    projected = basis.project(raw.reshape(1, -1))[0]
+    return projected / np.linalg.norm(projected)
+
+
+def test_decode_rows_projects_raw_rows_to_gallery_revision(session):
+    rng = np.random.default_rng(0)
+    basis, version = _fit_basis(session, rng)
+    raw = rng.normal(size=(3, RAW_DIM)).astype(np.float32)
+    rows = [(1, 10, encode_embedding(basis.project(raw[:1])[0], BACKEND_MEDIAPIPE, revision=version)),
+            (2, 11, encode_embedding(basis.project(raw[1:2])[0], BACKEND_MEDIAPIPE, revision=version)),
+            # Template lama yang belum diproyeksikan ulang
+            (3, 12, encode_embedding(raw[2], BACKEND_MEDIAPIPE))]
+
+    template_ids, user_ids, matrix, revision = _decode_rows(rows, BACKEND_MEDIAPIPE)
+    assert revision == version
+    assert matrix.shape == (3, basis.dim)
+    by_template = dict(zip(template_ids.tolist(), matrix))
+    assert set(by_template) == {1, 2, 3}
+    np.testing.assert_array_equal(user_ids[template_ids.tolist().index(3)], 12)
+    np.testing.assert_allclose(by_template[3], _expected(basis, raw[2]), atol=1e-5)
+
+
+def test_decode_rows_reprojects_other_revision_from_landmarks(session):
+    rng = np.random.default_rng(1)
+    old_basis, old_version = _fit_basis(session, rng, components=3)
+    basis, version = _fit_basis(session, rng)
+    raw = rng.normal(size=(3, RAW_DIM)).astype(np.float32)
+
+    user = User(name='mahasiswa', password='x')
+    session.add(user)
+    session.flush()
+    # Template dari basis lama: vektor mentahnya ada di kolom landmarks
+    stale = FaceTemplate(user_id=user.id,
+                         encoding=encode_embedding(old_basis.project(raw[2:])[0], BACKEND_MEDIAPIPE,
+                                                   revision=old_version),
+                         landmarks=encode_embedding(raw[2], BACKEND_MEDIAPIPE))
+    session.add(stale)
+    session.commit()
+
+    rows = [(100, 10, encode_embedding(basis.project(raw[:1])[0], BACKEND_MEDIAPIPE, revision=version)),
+            (101, 11, encode_embedding(basis.project(raw[1:2])[0], BACKEND_MEDIAPIPE, revision=version)),
+            (stale.id, user.id, stale.encoding)]
+
+    template_ids, user_ids, matrix, revision = _decode_rows(rows, BACKEND_MEDIAPIPE)
+    assert revision == version
+    assert stale.id in template_ids.tolist()
+    np.testing.assert_allclose(matrix[template_ids.tolist().index(stale.id)], _expected(basis, raw[2]), atol=1e-5)
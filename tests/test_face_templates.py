@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+from embedding_codec import BACKEND_MEDIAPIPE, encode_embedding
+from face_templates import TEMPLATE_SOURCE_ATTENDANCE, TEMPLATE_SOURCE_ENROLL, evict_templates
+from models import FaceTemplate, User
+
+
+def _add_templates(session, user, sources):
+    """
+    Tambah template berurutan dari yang tertua; kembalikan id-nya.
+    """
+    start = datetime(2024, 1, 1)
+    templates = [FaceTemplate(user_id=user.id, encoding=encode_embedding([1.0, 0.0], BACKEND_MEDIAPIPE),
+                              source=source, created_at=start + timedelta(days=offset))
+                 for offset, source in enumerate(sources)]
+    session.add_all(templates)
+    session.flush()
+    return [template.id for template in templates]
+
+
+def _remaining(session, user):
+    return sorted(template_id for (template_id,) in
+                  session.query(FaceTemplate.id).filter(FaceTemplate.user_id == user.id))
+
+
+def test_evict_keeps_newest_enroll_template(session):
+    user = User(name='mahasiswa', password='x')
+    session.add(user)
+    session.flush()
+    old_enroll, new_enroll, *attendance = _add_templates(
+        session, user, [TEMPLATE_SOURCE_ENROLL, TEMPLATE_SOURCE_ENROLL] + [TEMPLATE_SOURCE_ATTENDANCE] * 4)
+
+    assert evict_templates([user.id], 3) == 3
+    assert _remaining(session, user) == sorted([new_enroll] + attendance[-2:])
+    assert old_enroll not in _remaining(session, user)
+
+
+def test_evict_keeps_newest_when_enroll_already_kept(session):
+    user = User(name='mahasiswa', password='x')
+    session.add(user)
+    session.flush()
+    ids = _add_templates(session, user, [TEMPLATE_SOURCE_ATTENDANCE, TEMPLATE_SOURCE_ATTENDANCE,
+                                         TEMPLATE_SOURCE_ENROLL])
+
+    assert evict_templates([user.id], 2) == 1
+    assert _remaining(session, user) == ids[1:]
+
+
+def test_evict_within_limit_is_noop(session):
+    user = User(name='mahasiswa', password='x')
+    session.add(user)
+    session.flush()
+    ids = _add_templates(session, user, [TEMPLATE_SOURCE_ENROLL, TEMPLATE_SOURCE_ATTENDANCE])
+
+    assert evict_templates([user.id], 5) == 0
+    assert _remaining(session, user) == ids
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from embedding_codec import BACKEND_MEDIAPIPE
+from gallery_snapshot import GallerySnapshot, SnapshotFormatError, read_header, write_snapshot
+
+
+def test_write_then_open_round_trip(tmp_path):
+    path = str(tmp_path / 'gallery.snap')
+    matrix = np.random.default_rng(0).normal(size=(4, 6)).astype(np.float32)
+
+    assert write_snapshot(path, [11, 12, 13, 14], [1, 1, 2, 3], matrix, 5, BACKEND_MEDIAPIPE, revision=2)
+
+    header = read_header(path)
+    assert (header.backend, header.dim, header.count, header.generation, header.revision) == \
+        (BACKEND_MEDIAPIPE, 6, 4, 5, 2)
+    snapshot = GallerySnapshot.open(path)
+    assert snapshot.generation == 5
+    np.testing.assert_array_equal(snapshot.template_ids, [11, 12, 13, 14])
+    np.testing.assert_array_equal(snapshot.user_ids, [1, 1, 2, 3])
+    np.testing.assert_array_equal(snapshot.vectors, matrix)
+    assert snapshot.quantized.shape == (4, 6)
+
+
+def test_empty_snapshot(tmp_path):
+    path = str(tmp_path / 'gallery.snap')
+
+    assert write_snapshot(path, [], [], np.empty((0, 6), dtype=np.float32), 1, BACKEND_MEDIAPIPE)
+
+    snapshot = GallerySnapshot.open(path)
+    assert len(snapshot.user_ids) == 0
+    assert snapshot.vectors.shape == (0, 6)
+
+
+def test_older_generation_does_not_overwrite(tmp_path):
+    path = str(tmp_path / 'gallery.snap')
+    matrix = np.ones((1, 3), dtype=np.float32)
+
+    assert write_snapshot(path, [1], [1], matrix, 3, BACKEND_MEDIAPIPE)
+    assert not write_snapshot(path, [2], [2], matrix, 2, BACKEND_MEDIAPIPE)
+    assert read_header(path).generation == 3
+
+
+def test_open_rejects_missing_or_truncated_file(tmp_path):
+    path = str(tmp_path / 'gallery.snap')
+    with pytest.raises(SnapshotFormatError):
+        GallerySnapshot.open(path)
+
+    write_snapshot(path, [1, 2], [1, 2], np.ones((2, 3), dtype=np.float32), 1, BACKEND_MEDIAPIPE)
+    with open(path, 'r+b') as handle:
+        handle.truncate(40)
+    with pytest.raises(SnapshotFormatError):
+        GallerySnapshot.open(path)
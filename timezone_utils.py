@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import pytz
+from sqlalchemy import DateTime
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+# Semua tanggal presensi dihitung dalam Waktu Indonesia Barat, bukan zona waktu server
+WIB = pytz.timezone('Asia/Jakarta')
+# WIB tidak memakai daylight saving, jadi selisihnya selalu +7 jam
+WIB_OFFSET_HOURS = 7
+
+
+def to_wib(utc_datetime):
+    """
+    Ubah datetime UTC naif (seperti yang disimpan di database) ke WIB.
+    """
+    return utc_datetime.replace(tzinfo=pytz.utc).astimezone(WIB)
+
+
+def wib_date(utc_datetime):
+    """
+    Tanggal WIB dari datetime UTC naif.
+    """
+    return to_wib(utc_datetime).date()
+
+
+def wib_today():
+    return wib_date(datetime.utcnow())
+
+
+class wib_timestamp(FunctionElement):
+    """
+    Ekspresi SQL: kolom timestamp UTC naif dikonversi ke waktu WIB di
+    database, sehingga hasil query tidak perlu dikonversi per baris di Python.
+    """
+    type = DateTime()
+    name = 'wib_timestamp'
+    inherit_cache = True
+
+
+@compiles(wib_timestamp)
+def _compile_wib_timestamp(element, compiler, **kw):
+    return f"({compiler.process(element.clauses, **kw)} + INTERVAL '{WIB_OFFSET_HOURS}' HOUR)"
+
+
+@compiles(wib_timestamp, 'postgresql')
+def _compile_wib_timestamp_postgresql(element, compiler, **kw):
+    return f"(({compiler.process(element.clauses, **kw)} AT TIME ZONE 'UTC') AT TIME ZONE 'Asia/Jakarta')"
+
+
+@compiles(wib_timestamp, 'sqlite')
+def _compile_wib_timestamp_sqlite(element, compiler, **kw):
+    return f"datetime({compiler.process(element.clauses, **kw)}, '+{WIB_OFFSET_HOURS} hours')"
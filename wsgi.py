@@ -0,0 +1,32 @@
+"""
+Entry point WSGI untuk server produksi:
+
+    python init_db.py
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Dengan preload_app, modul ini dimuat sekali di proses master gunicorn.
+Galeri wajah (matriks numpy) ikut dimuat di master sehingga dibagi
+copy-on-write ke semua worker hasil fork. Model MediaPipe tidak aman
+di-fork, jadi warmup-nya dijalankan per worker di hook post_fork.
+"""
+import logging
+import time
+
+from app import create_app
+from models import db
+from face_gallery import face_gallery
+
+logger = logging.getLogger('gunicorn.error')
+
+_started = time.perf_counter()
+
+# Skema dan data awal sudah disiapkan init_db.py, bukan di setiap start
+app = create_app(init_database=False, warmup=False)
+
+with app.app_context():
+    face_gallery.reload()
+    # Koneksi milik master tidak boleh dipakai bersama oleh worker
+    db.engine.dispose()
+
+startup_seconds = time.perf_counter() - _started
+logger.info("Aplikasi dimuat dalam %.2f detik (%d wajah di galeri)", startup_seconds, len(face_gallery))